@@ -0,0 +1,79 @@
+# answer_cache.py
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+def normalize_query(query):
+    # Case, whitespace and trailing punctuation do not change the question
+    return re.sub(r'\s+', ' ', query).strip().rstrip('?.!').strip().lower()
+
+def context_fingerprint(context):
+    serialized = json.dumps(context, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+class AnswerCache:
+    path: str
+    ttl: float
+    max_entries: int
+
+    def __init__(self, path, ttl=3600, max_entries=1000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access);
+        ''')
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def key(query, context):
+        # The context fingerprint changes whenever the underlying Graph data does
+        return hashlib.sha256(f"{normalize_query(query)}\0{context_fingerprint(context)}".encode('utf-8')).hexdigest()
+
+    def get(self, query, context):
+        if not self.enabled:
+            return None
+        key = self.key(query, context)
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT answer, created FROM answers WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self.connection.execute('DELETE FROM answers WHERE key = ?', (key,))
+                return None
+            self.connection.execute('UPDATE answers SET last_access = ? WHERE key = ?', (now, key))
+            return row[0]
+
+    def set(self, query, context, answer):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)',
+                                    (self.key(query, context), answer, now, now))
+            # Drop expired entries, then the least recently used ones over the size limit
+            self.connection.execute('DELETE FROM answers WHERE created < ?', (now - self.ttl,))
+            self.connection.execute('''
+                DELETE FROM answers WHERE key IN (
+                    SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )''', (self.max_entries,))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM answers')
@@ -1,8 +1,14 @@
 # app.py
 from flask import Flask, request, jsonify
+import os
+import json
 import asyncio
+import hashlib
 import configparser
 from graph import Graph
+from shared_store import open_store, get_or_compute, SHARED_STORE_URL
+from subscriptions import SubscriptionStore, SUBSCRIPTIONS_PATH
+from notifications import NotificationProcessor
 import nest_asyncio
 
 # Apply nest_asyncio to fix event loop issues
@@ -15,6 +21,26 @@ config = configparser.ConfigParser()
 config.read(['config.cfg', 'config.dev.cfg'])
 azure_settings = config['azure']
 
+# Cache read-only option results for this many seconds; 0 disables the cache
+INTERACT_CACHE_TTL = float(os.getenv('INTERACT_CACHE_TTL', '0'))
+# Options 1 and 3 perform actions and are never cached
+CACHEABLE_OPTIONS = {2, 4, 5, 6, 7, 8}
+
+# Tokens, cached results and single-flight locks live here; set SHARED_STORE_URL to share them between workers
+shared_store = open_store(SHARED_STORE_URL)
+
+def invalidate_interact_cache(options):
+    for option in options:
+        shared_store.delete_prefix(f"interact:{option}:")
+
+# Graph change notifications invalidate cached results and update the keyword index
+notification_processor = NotificationProcessor(
+    lambda: Graph(azure_settings, store=shared_store),
+    SubscriptionStore(SUBSCRIPTIONS_PATH),
+    invalidate_interact_cache,
+    keyword_index_path=os.getenv('KEYWORD_INDEX_PATH', 'keyword_index.db')
+)
+
 @app.route('/options', methods=['GET'])
 def options():
     options_list = [
@@ -25,7 +51,8 @@ def options():
         {'id': 4, 'name': 'Extract email metadata'},
         {'id': 5, 'name': 'Extract calendar events'},
         {'id': 6, 'name': 'Extract contacts and network'},
-        {'id': 7, 'name': 'Extract SharePoint usage'}
+        {'id': 7, 'name': 'Extract SharePoint usage'},
+        {'id': 8, 'name': 'Search content'}
     ]
     return jsonify(options_list)
 
@@ -41,17 +68,52 @@ def interact():
             return jsonify({'error': 'Option must be an integer'}), 400
         # Get search_term from the request data
         search_term = data.get('search_term', '')
-        
+        # Get the search query and entity types for option 8
+        query = data.get('query', '')
+        entity_types = data.get('entity_types')
+        if isinstance(entity_types, str):
+            entity_types = [entity_type.strip() for entity_type in entity_types.split(',') if entity_type.strip()]
+
         # Process the selected option
-        result = asyncio.run(process_option(option, search_term))
+        if INTERACT_CACHE_TTL > 0 and option in CACHEABLE_OPTIONS:
+            # Identical requests on any worker share one Graph call; error responses and partial search results are not cached
+            key = f"interact:{option}:{hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()}"
+            result, _ = get_or_compute(
+                shared_store, key,
+                lambda: json.dumps(asyncio.run(process_option(option, search_term, query, entity_types))),
+                INTERACT_CACHE_TTL,
+                should_cache=lambda value: value.startswith('{') and '"search_errors"' not in value
+            )
+            result = json.loads(result)
+        else:
+            result = asyncio.run(process_option(option, search_term, query, entity_types))
+
+        # Errors come back from process_option as (body, status)
+        if isinstance(result, (list, tuple)):
+            return jsonify(result[0]), result[1]
         return jsonify(result)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-async def process_option(option, search_term=''):
+@app.route('/notifications', methods=['POST'])
+def notifications():
+    # Graph validates a new subscription by sending a token that must be echoed back as plain text
+    validation_token = request.args.get('validationToken')
+    if validation_token is not None:
+        return validation_token, 200, {'Content-Type': 'text/plain'}
+
+    data = request.get_json(silent=True) or {}
+    notification_processor.accept(data.get('value', []))
+    return '', 202
+
+@app.route('/notifications/stats', methods=['GET'])
+def notification_stats():
+    return jsonify(notification_processor.summary())
+
+async def process_option(option, search_term='', query='', entity_types=None):
     # Initialize Graph object inside the async function to ensure it uses the same event loop
-    graph_instance = Graph(azure_settings)
+    graph_instance = Graph(azure_settings, store=shared_store)
 
     if option == 0:
         return {'message': 'Goodbye...'}
@@ -130,8 +192,19 @@ async def process_option(option, search_term=''):
             return {'sharepoint_sites': site_list}
         else:
             return {'sharepoint_sites': []}
+    elif option == 8:
+        if not query:
+            return {'error': 'Missing query for search.'}, 400
+        results = await graph_instance.search(query, entity_types)
+        if results['errors'] and not results['hits']:
+            return {'error': '; '.join(error['error'] for error in results['errors']), 'search_errors': results['errors']}, 502
+        # Hits from the searches that worked, with the errors of the ones that did not
+        response = {'search_hits': results['hits']}
+        if results['errors']:
+            response['search_errors'] = results['errors']
+        return response
     else:
         return {'error': 'Invalid option.'}, 400
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', port=int(os.getenv('PORT', '5000')))
\ No newline at end of file
@@ -0,0 +1,158 @@
+# attachments.py
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import configparser
+from collections import Counter
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define where attachments are saved, how many download at once and how much of each is held in memory
+ATTACHMENTS_OUTPUT_DIR = os.getenv('ATTACHMENTS_OUTPUT_DIR', 'attachments')
+ATTACHMENT_CONCURRENCY = int(os.getenv('ATTACHMENT_CONCURRENCY', '4'))
+ATTACHMENT_CHUNK_KB = int(os.getenv('ATTACHMENT_CHUNK_KB', '1024'))
+
+# Reference attachments are links to files elsewhere and have no content to download
+REFERENCE_ATTACHMENT = '#microsoft.graph.referenceAttachment'
+
+def safe_filename(name, default='attachment'):
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', name or '').strip(' .')
+    return name[:200] or default
+
+def peak_memory_mb():
+    # Peak resident memory of this process; the resource module is not available on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+class AttachmentDownloader:
+    def __init__(self, graph: Graph, concurrency=ATTACHMENT_CONCURRENCY, chunk_size=ATTACHMENT_CHUNK_KB * 1024):
+        self.graph = graph
+        self.chunk_size = chunk_size
+        # Each download holds at most one chunk, so memory stays at about concurrency * chunk_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stats = Counter()
+        self.started = time.perf_counter()
+
+    async def attachments(self, user_id: str, message_id: str):
+        attachments = await self.graph.get_attachments(user_id, message_id)
+        return [attachment for attachment in attachments if attachment.odata_type != REFERENCE_ATTACHMENT]
+
+    async def download(self, user_id: str, message_id: str, attachment, write):
+        # Stream one attachment to write(chunk), which may be async, such as an upload or a hash
+        async with self.semaphore:
+            size = await self.graph.stream_attachment(user_id, message_id, attachment.id, write, self.chunk_size)
+        self.stats['attachments'] += 1
+        self.stats['bytes'] += size
+        return size
+
+    async def download_to_file(self, user_id: str, message_id: str, attachment, path):
+        # Written to a .part file first, so an interrupted download never looks complete
+        partial = path + '.part'
+        try:
+            with open(partial, 'wb') as f:
+                size = await self.download(user_id, message_id, attachment, f.write)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return size
+
+    async def download_message(self, user_id: str, message_id: str, directory):
+        # Every attachment of one message into directory; returns the saved paths
+        attachments = await self.attachments(user_id, message_id)
+        if not attachments:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        paths, names = [], Counter()
+        for attachment in attachments:
+            name = safe_filename(attachment.name)
+            names[name] += 1
+            if names[name] > 1:
+                stem, extension = os.path.splitext(name)
+                name = f"{stem} ({names[name]}){extension}"
+            paths.append(os.path.join(directory, name))
+        results = await asyncio.gather(*[self.download_to_file(user_id, message_id, attachment, path)
+                                         for attachment, path in zip(attachments, paths)], return_exceptions=True)
+        saved = []
+        for attachment, path, result in zip(attachments, paths, results):
+            if isinstance(result, Exception):
+                self.stats['failed'] += 1
+                print(f"Error downloading {attachment.name}: {result}")
+            else:
+                saved.append(path)
+        self.stats['messages'] += 1
+        return saved
+
+    async def download_mailbox(self, user_id: str, output_dir, max_messages=None, page_size=100):
+        # Messages with attachments, one page at a time, so the number of pending downloads stays bounded
+        next_link, scanned = None, 0
+        while True:
+            page = await self.graph.get_mailbox_page(user_id, next_link, page_size)
+            messages = page.value or []
+            if max_messages is not None:
+                messages = messages[:max_messages - scanned]
+            scanned += len(messages)
+            await asyncio.gather(*[self.download_message(user_id, message.id, os.path.join(output_dir, safe_filename(message.id)))
+                                   for message in messages if message.has_attachments])
+            next_link = page.odata_next_link
+            if not next_link or (max_messages is not None and scanned >= max_messages):
+                return scanned
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        megabytes = self.stats['bytes'] / (1024 * 1024)
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'messages': self.stats['messages'], 'attachments': self.stats['attachments'], 'failed': self.stats['failed'],
+            'megabytes': round(megabytes, 2),
+            'mb_per_second': round(megabytes / elapsed, 2) if elapsed else None,
+            'peak_memory_mb': peak_memory_mb(),
+        }
+
+async def main():
+    parser = argparse.ArgumentParser(description='Stream the attachments of a mailbox to disk without loading them into memory')
+    parser.add_argument('--user', help="User id or userPrincipalName, defaults to the user in graph.py")
+    parser.add_argument('--message', help='Only download the attachments of this message')
+    parser.add_argument('--max-messages', type=int, help='Stop after scanning this many messages')
+    parser.add_argument('--concurrency', type=int, default=ATTACHMENT_CONCURRENCY, help='Attachments downloading at once')
+    parser.add_argument('--chunk-kb', type=int, default=ATTACHMENT_CHUNK_KB, help='KB held in memory per download')
+    parser.add_argument('--output-dir', default=ATTACHMENTS_OUTPUT_DIR)
+    parser.add_argument('--report', default='attachments_report.json')
+    args = parser.parse_args()
+
+    # Load settings
+    config = configparser.ConfigParser()
+    config.read(['config.cfg', 'config.dev.cfg'])
+    azure_settings = config['azure']
+
+    graph: Graph = Graph(azure_settings)
+    user_id = args.user or graph.user_id
+    downloader = AttachmentDownloader(graph, args.concurrency, args.chunk_kb * 1024)
+    output_dir = os.path.join(args.output_dir, safe_filename(user_id))
+    if args.message:
+        await downloader.download_message(user_id, args.message, os.path.join(output_dir, safe_filename(args.message)))
+    else:
+        await downloader.download_mailbox(user_id, output_dir, args.max_messages)
+
+    report = downloader.report()
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"{report['attachments']} attachments from {report['messages']} messages ({report['megabytes']} MB) in "
+          f"{report['elapsed_seconds']} s: {report['mb_per_second']} MB/s, peak memory {report['peak_memory_mb']} MB, "
+          f"saved to {output_dir}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
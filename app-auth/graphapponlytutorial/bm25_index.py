@@ -0,0 +1,146 @@
+# bm25_index.py
+import hashlib
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+def keyword_text(record):
+    # Only the fields we want to match lexically are indexed for each source
+    data = record['data']
+    source = record['source']
+    if source == 'email':
+        return f"{data.get('subject') or ''} {data.get('from') or ''}"
+    if source == 'event':
+        return f"{data.get('subject') or ''} {data.get('location') or ''}"
+    if source == 'contact':
+        return f"{data.get('display_name') or ''} {data.get('email') or ''}"
+    if source == 'sharepoint_item':
+        fields = ' '.join(str(value) for key, value in data.get('fields', {}).items() if not key.startswith('@'))
+        return f"{data.get('list') or ''} {fields}"
+    return record.get('text', '')
+
+class BM25Index:
+    path: str
+    connection: sqlite3.Connection
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                record TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                doc_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+        ''')
+
+    def __len__(self):
+        return self.connection.execute('SELECT doc_count FROM stats').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def _delete(self, doc_id):
+        row = self.connection.execute('SELECT length FROM docs WHERE id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return False
+        self.connection.execute('DELETE FROM postings WHERE doc_id = ?', (doc_id,))
+        self.connection.execute('DELETE FROM docs WHERE id = ?', (doc_id,))
+        self.connection.execute('UPDATE stats SET doc_count = doc_count - 1, total_length = total_length - ?', (row[0],))
+        return True
+
+    def add(self, records):
+        added = 0
+        with self.lock, self.connection:
+            for record in records:
+                serialized = json.dumps(record, sort_keys=True, default=str)
+                digest = hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+                existing = self.connection.execute('SELECT digest FROM docs WHERE id = ?', (record['id'],)).fetchone()
+                if existing and existing[0] == digest:
+                    # Unchanged record, nothing to re-index
+                    continue
+                self._delete(record['id'])
+
+                terms = Counter(tokenize(keyword_text(record)))
+                length = sum(terms.values())
+                self.connection.execute('INSERT INTO docs VALUES (?, ?, ?, ?)', (record['id'], length, digest, serialized))
+                self.connection.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                                            [(term, record['id'], tf) for term, tf in terms.items()])
+                self.connection.execute('UPDATE stats SET doc_count = doc_count + 1, total_length = total_length + ?', (length,))
+                added += 1
+        return added
+
+    def delete(self, doc_ids):
+        with self.lock, self.connection:
+            return sum(1 for doc_id in doc_ids if self._delete(doc_id))
+
+    def sync(self, records, sources=None, prefix=None):
+        # Upsert the given records and drop indexed records of the same sources, or with the
+        # given id prefix, that no longer exist
+        sources = set(sources or (record['source'] for record in records))
+        current = {record['id'] for record in records}
+        with self.lock:
+            indexed = [row[0] for row in self.connection.execute('SELECT id FROM docs')]
+        if prefix:
+            stale = [doc_id for doc_id in indexed if doc_id.startswith(prefix) and doc_id not in current]
+        else:
+            stale = [doc_id for doc_id in indexed if doc_id.split(':', 1)[0] in sources and doc_id not in current]
+        return self.add(records), self.delete(stale)
+
+    def search(self, query, top_k=20):
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+
+        with self.lock:
+            doc_count, total_length = self.connection.execute('SELECT doc_count, total_length FROM stats').fetchone()
+            if doc_count == 0:
+                return []
+            avg_length = total_length / doc_count
+
+            placeholders = ','.join('?' * len(terms))
+            doc_freqs = dict(self.connection.execute(
+                f'SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term', terms))
+            postings = self.connection.execute(
+                f'SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id '
+                f'WHERE p.term IN ({placeholders})', terms).fetchall()
+
+            scores = Counter()
+            for term, doc_id, tf, length in postings:
+                df = doc_freqs[term]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                scores[doc_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+            top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            records = dict(self.connection.execute(
+                f'SELECT id, record FROM docs WHERE id IN ({",".join("?" * len(top))})', [doc_id for doc_id, _ in top]))
+        return [(score, json.loads(records[doc_id])) for doc_id, score in top]
@@ -0,0 +1,65 @@
+# build_index.py
+import argparse
+import asyncio
+import configparser
+import os
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph
+from records import collect_records, read_records
+from vector_index import VectorIndex, EMBEDDING_MODEL
+from bm25_index import BM25Index
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define the index locations
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'vector_index')
+KEYWORD_INDEX_PATH = os.getenv('KEYWORD_INDEX_PATH', 'keyword_index.db')
+
+def build_vector_index(records):
+    from llama_index.embeddings.gemini import GeminiEmbedding
+
+    embed_model = GeminiEmbedding(model_name=EMBEDDING_MODEL, api_key=os.getenv('GEMINI_API_KEY'))
+    index = VectorIndex.build(records, embed_model.get_text_embedding_batch)
+    index.save(VECTOR_INDEX_DIR)
+    print(f"Saved vector index with {len(index)} records to {VECTOR_INDEX_DIR}")
+
+def build_keyword_index(records):
+    index = BM25Index(KEYWORD_INDEX_PATH)
+    updated, deleted = index.sync(records)
+    print(f"Keyword index at {KEYWORD_INDEX_PATH}: {updated} records added or updated, {deleted} deleted, {len(index)} total")
+    index.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description='Build a retrieval index over Microsoft Graph data')
+    parser.add_argument('--backend', choices=['vector', 'bm25', 'all'], default='vector')
+    parser.add_argument('--records', nargs='+', default=[],
+                        help='Also index these JSONL files or folders, such as mailbox_crawl, sharepoint_crawl and documents.jsonl')
+    parser.add_argument('--search', help='Only read the SharePoint lists of sites matching this search term')
+    parser.add_argument('--skip-graph', action='store_true', help='Only index the --records files')
+    args = parser.parse_args()
+
+    records = read_records(args.records)
+    print(f"Read {len(records)} records from {', '.join(args.records) or 'no files'}")
+    if not args.skip_graph:
+        # Load settings
+        config = configparser.ConfigParser()
+        config.read(['config.cfg', 'config.dev.cfg'])
+        azure_settings = config['azure']
+
+        graph: Graph = Graph(azure_settings)
+        collected = await collect_records(graph, args.search)
+        print(f"Collected {len(collected)} records from Microsoft Graph")
+        records.extend(collected)
+
+    # A mailbox can be both crawled and read directly; keep one record per id
+    records = list({record['id']: record for record in records}.values())
+    print(f"Indexing {len(records)} records")
+
+    if args.backend in ('vector', 'all'):
+        build_vector_index(records)
+    if args.backend in ('bm25', 'all'):
+        build_keyword_index(records)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,318 @@
+# bulk_mail.py
+import os
+import json
+import time
+import base64
+import asyncio
+import argparse
+import mimetypes
+import configparser
+from collections import Counter
+import httpx
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define the sending rate of each mailbox. Exchange Online allows 30 messages a minute per mailbox,
+# and Outlook requests allow 4 at once per mailbox, including the requests inside one $batch;
+# a bucket refilling at 25 a minute with a burst of 4 stays under both.
+MAX_MAILBOX_BURST = 4
+MAIL_SEND_PER_MINUTE = float(os.getenv('MAIL_SEND_PER_MINUTE', '25'))
+MAIL_SEND_BURST = min(int(os.getenv('MAIL_SEND_BURST', '4')), MAX_MAILBOX_BURST)
+MAIL_SEND_CONCURRENCY = int(os.getenv('MAIL_SEND_CONCURRENCY', '4'))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', '5'))
+
+# Graph takes at most 20 requests per $batch and about 4 MB per request
+MAX_BATCH_SIZE = 20
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+# Messages with more attachment bytes than this are sent as drafts, so they never make a batch too large
+BATCH_ATTACHMENT_BYTES = 2 * 1024 * 1024
+# Attachments of this size and over need an upload session
+UPLOAD_SESSION_BYTES = 3 * 1024 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # The lock is fair, so messages of one mailbox leave in the order they asked for a token
+        self.lock = asyncio.Lock()
+
+    async def take(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        # After a 429 the mailbox sends nothing more until Retry-After has passed
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+def recipients(addresses):
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    return [{'emailAddress': {'address': address}} for address in addresses or []]
+
+def attachment_files(message):
+    # Attachments are file paths, or dicts with a path and optionally a name and content type
+    files = []
+    for attachment in message.get('attachments') or []:
+        if isinstance(attachment, str):
+            attachment = {'path': attachment}
+        name = attachment.get('name') or os.path.basename(attachment['path'])
+        files.append({
+            'path': attachment['path'],
+            'name': name,
+            'contentType': attachment.get('contentType') or mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'size': os.path.getsize(attachment['path']),
+        })
+    return files
+
+def file_attachment(attachment):
+    with open(attachment['path'], 'rb') as f:
+        content = f.read()
+    return {'@odata.type': '#microsoft.graph.fileAttachment', 'name': attachment['name'],
+            'contentType': attachment['contentType'], 'contentBytes': base64.b64encode(content).decode('ascii')}
+
+def graph_message(message):
+    return {
+        'subject': message.get('subject', ''),
+        'body': {'contentType': 'HTML' if message.get('html') else 'Text', 'content': message.get('body', '')},
+        'toRecipients': recipients(message.get('to')),
+        'ccRecipients': recipients(message.get('cc')),
+        'bccRecipients': recipients(message.get('bcc')),
+    }
+
+class BulkMailer:
+    def __init__(self, graph: Graph, per_minute=MAIL_SEND_PER_MINUTE, burst=MAIL_SEND_BURST, concurrency=MAIL_SEND_CONCURRENCY,
+                 max_attempts=MAIL_MAX_ATTEMPTS, batch_size=MAX_BATCH_SIZE, linger=0.05):
+        self.graph = graph
+        self.per_minute = per_minute
+        self.burst = min(burst, MAX_MAILBOX_BURST)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        # How long a batch waits for more ready messages before it is sent part full
+        self.linger = linger
+        self.buckets = {}
+        self.stats = Counter()
+
+    def bucket(self, sender):
+        if sender not in self.buckets:
+            self.buckets[sender] = TokenBucket(self.per_minute, self.burst)
+        return self.buckets[sender]
+
+    async def send(self, messages):
+        # Yields one result per message as soon as it is sent or has failed for good, in completion order
+        self.results = asyncio.Queue()
+        self.ready = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.tasks = set()
+        mailboxes = {}
+        for index, message in enumerate(messages):
+            sender = message.get('sender') or self.graph.user_id
+            job = {'id': str(message.get('id', index)), 'sender': sender, 'message': message, 'attempts': 0,
+                   'started': time.perf_counter(), 'draft_id': None, 'attachments_done': set()}
+            mailboxes.setdefault(sender.lower(), []).append(job)
+        total = sum(len(jobs) for jobs in mailboxes.values())
+
+        workers = [asyncio.create_task(self.schedule(jobs)) for jobs in mailboxes.values()]
+        workers.append(asyncio.create_task(self.batcher()))
+        try:
+            for _ in range(total):
+                yield await self.results.get()
+        finally:
+            for task in workers + list(self.tasks):
+                task.cancel()
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def schedule(self, jobs):
+        # The messages of one mailbox, released at the mailbox's sending rate
+        for job in jobs:
+            try:
+                job['attachments'] = attachment_files(job['message'])
+            except Exception as e:
+                self.finish(job, 'failed', None, f"Cannot read attachment: {e}")
+                continue
+            await self.submit(job)
+
+    async def submit(self, job):
+        # An error here fails only this message; left uncaught it would stop the mailbox's schedule or the retry,
+        # and send() would wait forever for the missing results
+        try:
+            await self.bucket(job['sender'].lower()).take()
+            job['attempts'] += 1
+            if sum(attachment['size'] for attachment in job['attachments']) <= BATCH_ATTACHMENT_BYTES:
+                job['request'] = {'message': dict(graph_message(job['message']),
+                                                  attachments=[file_attachment(attachment) for attachment in job['attachments']]),
+                                  'saveToSentItems': job['message'].get('saveToSentItems', True)}
+                job['size'] = len(json.dumps(job['request']))
+                await self.ready.put(job)
+            else:
+                self.spawn(self.send_with_uploads(job))
+        except Exception as e:
+            self.fail(job, None, str(e))
+
+    async def batcher(self):
+        # Packs ready messages from every mailbox into $batch requests
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            batch = [carry or await self.ready.get()]
+            carry = None
+            size = batch[0]['size']
+            deadline = loop.time() + self.linger
+            while len(batch) < self.batch_size:
+                try:
+                    job = await asyncio.wait_for(self.ready.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if size + job['size'] > MAX_BATCH_BYTES:
+                    carry = job
+                    break
+                batch.append(job)
+                size += job['size']
+            await self.slots.acquire()
+            self.spawn(self.post_batch(batch))
+
+    async def post_batch(self, batch):
+        try:
+            requests = [{'id': str(index), 'method': 'POST', 'url': f"/users/{job['sender']}/sendMail",
+                         'headers': {'Content-Type': 'application/json'}, 'body': job.pop('request')}
+                        for index, job in enumerate(batch)]
+            try:
+                responses = await self.graph.batch(requests)
+            except Exception as e:
+                for job in batch:
+                    self.attempt_failed(job, None, f"Batch request failed: {e}", None)
+                return
+            self.stats['batches'] += 1
+            for job, response in zip(batch, responses):
+                if response['status'] < 300:
+                    self.finish(job, 'sent', response['status'])
+                    continue
+                error = ((response.get('body') or {}).get('error') or {}).get('message') or f"HTTP {response['status']}"
+                retry_after = (response.get('headers') or {}).get('Retry-After')
+                self.attempt_failed(job, response['status'], error, float(retry_after) if retry_after else None)
+        finally:
+            self.slots.release()
+
+    async def send_with_uploads(self, job):
+        # A draft with small attachments added directly and large ones through upload sessions, then sent
+        async with self.slots:
+            sender = job['sender']
+            try:
+                # A retry reuses the draft and skips the attachments already added to it, so each is uploaded once
+                if job['draft_id'] is None:
+                    job['draft_id'] = await self.graph.create_draft(sender, graph_message(job['message']))
+                for index, attachment in enumerate(job['attachments']):
+                    if index in job['attachments_done']:
+                        continue
+                    if attachment['size'] < UPLOAD_SESSION_BYTES:
+                        await self.graph.add_attachment(sender, job['draft_id'], file_attachment(attachment))
+                    else:
+                        with open(attachment['path'], 'rb') as f:
+                            await self.graph.upload_attachment(sender, job['draft_id'], attachment['name'], attachment['size'],
+                                                               f.read, attachment['contentType'])
+                        self.stats['uploaded_bytes'] += attachment['size']
+                    job['attachments_done'].add(index)
+                await self.graph.send_draft(sender, job['draft_id'])
+            except httpx.HTTPStatusError as e:
+                retry_after = e.response.headers.get('Retry-After')
+                self.attempt_failed(job, e.response.status_code, str(e), float(retry_after) if retry_after else None)
+            except Exception as e:
+                self.attempt_failed(job, None, str(e), None)
+            else:
+                self.finish(job, 'sent', 202)
+
+    def attempt_failed(self, job, status, error, retry_after):
+        # Throttling, server errors and lost connections are retried; anything else is reported as failed
+        if (status is None or status in RETRY_STATUSES) and job['attempts'] < self.max_attempts:
+            self.stats['retries'] += 1
+            delay = retry_after if retry_after is not None else 2 ** job['attempts']
+            if status == 429:
+                self.stats['throttled'] += 1
+                self.bucket(job['sender'].lower()).pause(delay)
+                delay = 0
+            self.spawn(self.retry(job, delay))
+        else:
+            self.fail(job, status, error)
+
+    def fail(self, job, status, error):
+        if job['draft_id'] is not None:
+            self.spawn(self.discard_draft(job, status, error))
+        else:
+            self.finish(job, 'failed', status, error)
+
+    async def discard_draft(self, job, status, error):
+        # A message that will not be sent leaves no draft behind in the sender's mailbox
+        try:
+            await self.graph.delete_draft(job['sender'], job['draft_id'])
+            self.stats['drafts_deleted'] += 1
+        except Exception as e:
+            error = f"{error}; the draft could not be deleted: {e}"
+        self.finish(job, 'failed', status, error)
+
+    async def retry(self, job, delay):
+        try:
+            await asyncio.sleep(delay)
+            await self.submit(job)
+        except Exception as e:
+            self.fail(job, None, str(e))
+
+    def finish(self, job, status, http_status, error=None):
+        self.stats[status] += 1
+        self.results.put_nowait({
+            'id': job['id'], 'sender': job['sender'], 'status': status, 'http_status': http_status, 'error': error,
+            'attempts': job['attempts'], 'draft': job['draft_id'] is not None,
+            'seconds': round(time.perf_counter() - job['started'], 3),
+        })
+
+async def main():
+    parser = argparse.ArgumentParser(description='Send many messages with $batch requests, upload sessions and per-mailbox rate limits')
+    parser.add_argument('messages', help='JSONL file with one message per line: sender, to, cc, bcc, subject, body, html, attachments')
+    parser.add_argument('--per-minute', type=float, default=MAIL_SEND_PER_MINUTE, help='Messages each mailbox sends per minute')
+    parser.add_argument('--burst', type=int, default=MAIL_SEND_BURST, help=f'Messages a mailbox may send at once (at most {MAX_MAILBOX_BURST})')
+    parser.add_argument('--concurrency', type=int, default=MAIL_SEND_CONCURRENCY, help='Batches and uploads in flight')
+    parser.add_argument('--max-attempts', type=int, default=MAIL_MAX_ATTEMPTS)
+    parser.add_argument('--results', default='bulk_mail_results.jsonl', help='One result per message, written as they arrive')
+    args = parser.parse_args()
+
+    with open(args.messages, encoding='utf-8') as f:
+        messages = [json.loads(line) for line in f if line.strip()]
+
+    # Load settings
+    config = configparser.ConfigParser()
+    config.read(['config.cfg', 'config.dev.cfg'])
+    azure_settings = config['azure']
+
+    graph: Graph = Graph(azure_settings)
+    mailer = BulkMailer(graph, args.per_minute, args.burst, args.concurrency, args.max_attempts)
+    started = time.perf_counter()
+    with open(args.results, 'w', encoding='utf-8') as results:
+        async for result in mailer.send(messages):
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+            if result['status'] == 'failed':
+                print(f"Message {result['id']} from {result['sender']} failed after {result['attempts']} attempts: {result['error']}")
+
+    elapsed = time.perf_counter() - started
+    stats = mailer.stats
+    print(f"{stats['sent']} sent, {stats['failed']} failed in {elapsed:.1f} s ({stats['sent'] / elapsed:.1f} messages/s), "
+          f"{stats['batches']} batches, {stats['retries']} retries, {stats['throttled']} throttled; results in {args.results}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# cascade.py
+import os
+import re
+import json
+
+# Models to try in order, cheapest first. Empty means no cascade.
+GENERATION_CASCADE = [model.strip() for model in os.getenv('GENERATION_CASCADE', '').split(',') if model.strip()]
+
+# How answers from the cheaper models are checked: heuristic, self_consistency or json
+CASCADE_CHECK = os.getenv('CASCADE_CHECK', 'heuristic')
+
+# JSON Schema the answers must match with the json check; the QA prompt asks for it
+CASCADE_SCHEMA = json.loads(os.getenv('CASCADE_SCHEMA') or
+                            '{"type": "object", "required": ["answer"], "properties": {"answer": {"type": "string"}}}')
+
+# Temperature of the second sample drawn by the self_consistency check; a second sample at the
+# default temperature would mostly repeat the first
+CASCADE_SAMPLE_TEMPERATURE = float(os.getenv('CASCADE_SAMPLE_TEMPERATURE', '1.0'))
+
+REFUSAL_PATTERNS = [
+    "i don't know", "i do not know", "cannot answer", "can't answer", "not enough information",
+    "unable to answer", "unable to determine", "no information", "not provided",
+]
+COUNT_QUESTION = re.compile(r'\b(how many|count|number of|total)\b')
+NUMBER = re.compile(r'\d+(?:\.\d+)?')
+WORD = re.compile(r'\w+')
+
+def heuristic_check(answer, query_str):
+    text = (answer or '').strip().lower()
+    if not text:
+        return False, 'empty answer'
+    if any(pattern in text for pattern in REFUSAL_PATTERNS):
+        return False, 'model declined to answer'
+    if COUNT_QUESTION.search(query_str.lower()) and not NUMBER.search(text):
+        return False, 'count question without a number'
+    return True, None
+
+def answers_agree(first, second, threshold=0.6):
+    # Numbers must match exactly; otherwise compare word overlap
+    first_numbers, second_numbers = set(NUMBER.findall(first)), set(NUMBER.findall(second))
+    if first_numbers or second_numbers:
+        return first_numbers == second_numbers
+    first_words, second_words = set(WORD.findall(first.lower())), set(WORD.findall(second.lower()))
+    if not first_words or not second_words:
+        return False
+    return len(first_words & second_words) / len(first_words | second_words) >= threshold
+
+def parse_json_answer(answer):
+    text = answer.strip()
+    # Models often wrap JSON in a fenced code block
+    fenced = re.match(r'^```(?:json)?\s*(.*?)\s*```$', text, re.DOTALL)
+    return json.loads(fenced.group(1) if fenced else text)
+
+def unwrap_answer(answer):
+    # Callers get the answer field of a JSON answer, or the raw text when it is not JSON
+    try:
+        value = parse_json_answer(answer or '')
+    except ValueError:
+        return answer
+    if isinstance(value, dict) and 'answer' in value:
+        return value['answer'] if isinstance(value['answer'], str) else json.dumps(value['answer'])
+    return answer
+
+def matches_schema(value, schema):
+    # A small subset of JSON Schema: type, properties, required, items and enum
+    types = {
+        'object': dict, 'array': list, 'string': str, 'boolean': bool,
+        'integer': int, 'number': (int, float), 'null': type(None),
+    }
+    expected = schema.get('type')
+    if expected and not isinstance(value, types[expected]):
+        return False
+    if expected in ('integer', 'number') and isinstance(value, bool):
+        return False
+    if 'enum' in schema and value not in schema['enum']:
+        return False
+    if isinstance(value, dict):
+        if any(key not in value for key in schema.get('required', [])):
+            return False
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value and not matches_schema(value[key], subschema):
+                return False
+    if isinstance(value, list) and 'items' in schema:
+        return all(matches_schema(item, schema['items']) for item in value)
+    return True
+
+class ModelCascade:
+    def __init__(self, models, complete, check=CASCADE_CHECK, schema=CASCADE_SCHEMA, sample_temperature=CASCADE_SAMPLE_TEMPERATURE):
+        # complete(model, prompt_text, temperature=None) returns the answer text for one model call;
+        # None keeps the model's default temperature
+        if not models:
+            raise ValueError('A cascade needs at least one model')
+        self.models = models
+        self.complete = complete
+        self.check = check
+        self.schema = schema
+        self.sample_temperature = sample_temperature
+
+    def validate(self, model, answer, prompt_text, query_str):
+        if self.check == 'json':
+            try:
+                if not matches_schema(parse_json_answer(answer or ''), self.schema or {}):
+                    return False, 'answer does not match schema'
+            except ValueError:
+                return False, 'answer is not valid JSON'
+            answer = unwrap_answer(answer)
+        ok, reason = heuristic_check(answer, query_str)
+        if not ok:
+            return ok, reason
+        if self.check == 'self_consistency':
+            # Draw a second, hotter sample; an answer the model is unsure of rarely comes out the same twice
+            if not answers_agree(answer, self.complete(model, prompt_text, self.sample_temperature)):
+                return False, 'samples disagree'
+        return True, None
+
+    def result(self, answer, model, escalations):
+        return {'answer': unwrap_answer(answer) if self.check == 'json' else answer, 'model': model, 'escalations': escalations}
+
+    def generate(self, prompt_text, query_str, skip_last=False):
+        # Try each model in turn and stop at the first answer that passes the check.
+        # With skip_last the final model is not called, so the caller can stream it instead.
+        escalations = []
+        candidates = self.models[:-1] if skip_last else self.models
+        for position, model in enumerate(candidates):
+            answer = self.complete(model, prompt_text)
+            if position == len(self.models) - 1:
+                # The last model is trusted, there is nothing left to escalate to
+                return self.result(answer, model, escalations)
+            ok, reason = self.validate(model, answer, prompt_text, query_str)
+            if ok:
+                return self.result(answer, model, escalations)
+            escalations.append({'model': model, 'reason': reason})
+        return {'answer': None, 'model': self.models[-1], 'escalations': escalations}
@@ -0,0 +1,196 @@
+# document_pipeline.py
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import argparse
+import tempfile
+import configparser
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph
+from records import document_record
+from document_text import extract_document, UnsupportedDocument, SUPPORTED_EXTENSIONS, CHUNK_SIZE, CHUNK_OVERLAP
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define where document records are written and which files are too large to fetch
+DOCUMENTS_OUTPUT_PATH = os.getenv('DOCUMENTS_OUTPUT_PATH', 'documents.jsonl')
+MAX_DOCUMENT_MB = float(os.getenv('MAX_DOCUMENT_MB', '100'))
+
+class DocumentPipeline:
+    def __init__(self, graph: Graph, output, spool_dir, processes=os.cpu_count() or 1, download_concurrency=8,
+                 chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, max_bytes=int(MAX_DOCUMENT_MB * 1024 * 1024)):
+        self.graph = graph
+        self.output = output
+        self.spool_dir = spool_dir
+        self.processes = processes
+        self.download_concurrency = download_concurrency
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+        self.timings = Counter()
+        self.started = None
+
+    async def run(self, drives):
+        self.started = time.perf_counter()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        queue = asyncio.Queue(maxsize=self.download_concurrency * 4)
+        # Downloads run ahead of extraction by at most this many spooled files
+        self.spool_slots = asyncio.Semaphore(self.processes * 2)
+        self.extractions = set()
+
+        # Spawned workers only import document_text, not the Graph client
+        with ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn')) as pool, \
+                open(self.output, 'w', encoding='utf-8') as output:
+            downloaders = [asyncio.create_task(self.download_worker(queue, pool, output))
+                           for _ in range(self.download_concurrency)]
+            try:
+                await self.list_files(drives, queue)
+            finally:
+                for _ in downloaders:
+                    await queue.put(None)
+                await asyncio.gather(*downloaders)
+                await asyncio.gather(*self.extractions)
+        return self.report()
+
+    async def list_files(self, drives, queue):
+        for drive in drives:
+            next_link = None
+            while True:
+                page = await self.graph.get_drive_items_page(drive['drive_id'], next_link)
+                for item in page.value or []:
+                    if not item.file or item.deleted:
+                        continue
+                    self.stats['listed'] += 1
+                    extension = os.path.splitext(item.name or '')[1].lower()
+                    if extension not in SUPPORTED_EXTENSIONS or (item.size or 0) > self.max_bytes:
+                        self.stats['skipped'] += 1
+                        continue
+                    await queue.put({
+                        'drive_id': drive['drive_id'], 'item_id': item.id, 'name': item.name, 'source': drive['source'],
+                        'web_url': item.web_url, 'size': item.size, 'extension': extension,
+                        'last_modified': item.last_modified_date_time.isoformat() if item.last_modified_date_time else None,
+                    })
+                next_link = page.odata_next_link
+                if not next_link:
+                    break
+
+    async def download_worker(self, queue, pool, output):
+        while True:
+            document = await queue.get()
+            if document is None:
+                return
+            await self.spool_slots.acquire()
+            path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}{document['extension']}")
+            started = time.perf_counter()
+            try:
+                with open(path, 'wb') as spool:
+                    size = await self.graph.stream_content(f"drives/{document['drive_id']}/items/{document['item_id']}/content",
+                                                           spool.write)
+            except Exception as e:
+                self.spool_slots.release()
+                self.stats['failed'] += 1
+                if os.path.exists(path):
+                    os.remove(path)
+                print(f"Error downloading {document['name']}: {e}")
+                continue
+            self.timings['download_seconds'] += time.perf_counter() - started
+            self.stats['downloaded'] += 1
+            self.stats['bytes'] += size
+
+            # Extraction runs while this worker moves on to the next download
+            task = asyncio.create_task(self.extract(document, path, pool, output))
+            self.extractions.add(task)
+            task.add_done_callback(self.extractions.discard)
+
+    async def extract(self, document, path, pool, output):
+        try:
+            chunks, cpu_seconds = await asyncio.get_running_loop().run_in_executor(
+                pool, extract_document, path, document['extension'], self.chunk_size, self.chunk_overlap)
+            metadata = {key: value for key, value in document.items() if key != 'extension'}
+            output.write(''.join(json.dumps(document_record(metadata, index, chunk)) + '\n' for index, chunk in enumerate(chunks)))
+            self.timings['extract_cpu_seconds'] += cpu_seconds
+            self.stats['extracted'] += 1
+            self.stats['chunks'] += len(chunks)
+        except UnsupportedDocument as e:
+            self.stats['unsupported'] += 1
+            print(f"Skipped {document['name']}: {e}")
+        except Exception as e:
+            self.stats['failed'] += 1
+            print(f"Error extracting {document['name']}: {e}")
+        finally:
+            os.remove(path)
+            self.spool_slots.release()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        megabytes = self.stats['bytes'] / (1024 * 1024)
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'files_listed': self.stats['listed'], 'files_skipped': self.stats['skipped'],
+            'files_downloaded': self.stats['downloaded'], 'documents_extracted': self.stats['extracted'],
+            'documents_unsupported': self.stats['unsupported'], 'documents_failed': self.stats['failed'],
+            'chunks': self.stats['chunks'], 'megabytes': round(megabytes, 2),
+            'mb_per_second': round(megabytes / elapsed, 2) if elapsed else None,
+            'documents_per_second': round(self.stats['extracted'] / elapsed, 2) if elapsed else None,
+            # Time spent summed over all downloads and worker processes, to show which stage limits throughput
+            'download_seconds': round(self.timings['download_seconds'], 2),
+            'extract_cpu_seconds': round(self.timings['extract_cpu_seconds'], 2),
+        }
+
+async def report_progress(pipeline: DocumentPipeline, interval):
+    while True:
+        await asyncio.sleep(interval)
+        report = pipeline.report()
+        print(f"{report['documents_extracted']} documents, {report['chunks']} chunks, {report['megabytes']} MB, "
+              f"{report['mb_per_second']} MB/s, {report['documents_per_second']} documents/s")
+
+async def main():
+    parser = argparse.ArgumentParser(description='Extract text from SharePoint and OneDrive files into chunked records')
+    parser.add_argument('--search', help='Only read the document libraries of sites matching this search term')
+    parser.add_argument('--include-onedrive', action='store_true', help="Also read every user's OneDrive")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Text extraction processes')
+    parser.add_argument('--download-concurrency', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Characters per chunk')
+    parser.add_argument('--chunk-overlap', type=int, default=CHUNK_OVERLAP)
+    parser.add_argument('--max-mb', type=float, default=MAX_DOCUMENT_MB, help='Skip files larger than this')
+    parser.add_argument('--spool-dir', help='Directory for files being processed, defaults to a temporary directory')
+    parser.add_argument('--output', default=DOCUMENTS_OUTPUT_PATH)
+    parser.add_argument('--report-interval', type=float, default=10)
+    parser.add_argument('--report', default='document_pipeline_report.json')
+    args = parser.parse_args()
+
+    # Load settings
+    config = configparser.ConfigParser()
+    config.read(['config.cfg', 'config.dev.cfg'])
+    azure_settings = config['azure']
+
+    graph: Graph = Graph(azure_settings)
+    drives = await graph.get_drives(args.search, args.include_onedrive)
+    print(f"Reading {len(drives)} drives")
+
+    spool_dir = args.spool_dir or tempfile.mkdtemp(prefix='document-spool-')
+    pipeline = DocumentPipeline(graph, args.output, spool_dir, args.processes, args.download_concurrency,
+                                args.chunk_size, args.chunk_overlap, int(args.max_mb * 1024 * 1024))
+    progress = asyncio.create_task(report_progress(pipeline, args.report_interval))
+    try:
+        report = await pipeline.run(drives)
+    finally:
+        progress.cancel()
+        if not args.spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"{report['documents_extracted']} documents ({report['megabytes']} MB) in {report['elapsed_seconds']} s: "
+          f"{report['mb_per_second']} MB/s, {report['documents_per_second']} documents/s, {report['chunks']} chunks written to {args.output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+# document_text.py
+import os
+import re
+import html
+import time
+import zipfile
+import xml.etree.ElementTree as ElementTree
+
+# Define how document text is chunked, and where extraction of one file stops
+CHUNK_SIZE = int(os.getenv('DOCUMENT_CHUNK_SIZE', '2000'))
+CHUNK_OVERLAP = int(os.getenv('DOCUMENT_CHUNK_OVERLAP', '200'))
+MAX_DOCUMENT_CHARS = int(os.getenv('MAX_DOCUMENT_CHARS', '5000000'))
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.json', '.xml', '.html', '.htm'}
+# Parts of Office Open XML packages that hold the text
+OFFICE_PARTS = {
+    '.docx': re.compile(r'word/(document|footnotes|endnotes)\.xml'),
+    '.pptx': re.compile(r'ppt/slides/slide(\d+)\.xml'),
+    '.xlsx': re.compile(r'xl/sharedStrings\.xml'),
+}
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS | set(OFFICE_PARTS) | {'.pdf'}
+
+class UnsupportedDocument(Exception):
+    pass
+
+def plain_text(path, extension, max_chars):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        text = f.read(max_chars)
+    if extension in ('.html', '.htm'):
+        text = html.unescape(re.sub(r'<(script|style)\b.*?</\1>|<[^>]+>', ' ', text, flags=re.S | re.I))
+    return text
+
+def office_text(path, extension, max_chars):
+    # Office files are zip packages of XML parts; the parts are parsed as streams, so large files stay out of memory
+    pattern = OFFICE_PARTS[extension]
+    parts, length = [], 0
+    with zipfile.ZipFile(path) as package:
+        names = [name for name in package.namelist() if pattern.fullmatch(name)]
+        # Slides are stored in any order, so sort them by number
+        names.sort(key=lambda name: int(pattern.fullmatch(name).group(1)) if extension == '.pptx' else name)
+        for name in names:
+            with package.open(name) as part:
+                for _, element in ElementTree.iterparse(part):
+                    tag = element.tag.rsplit('}', 1)[-1]
+                    if tag == 't' and element.text:
+                        parts.append(element.text)
+                        length += len(element.text)
+                    elif tag in ('p', 'si', 'br'):
+                        parts.append('\n')
+                    elif tag == 'tab':
+                        parts.append('\t')
+                    element.clear()
+                    if length >= max_chars:
+                        return ''.join(parts)[:max_chars]
+    return ''.join(parts)
+
+def pdf_text(path, max_chars):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedDocument('PDF extraction needs pypdf (pip install pypdf)')
+    pages, length = [], 0
+    for page in PdfReader(path).pages:
+        text = page.extract_text() or ''
+        pages.append(text)
+        length += len(text)
+        if length >= max_chars:
+            break
+    return '\n\n'.join(pages)[:max_chars]
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    # Chunks of up to size characters that end at a paragraph, line, sentence or word break where possible,
+    # each starting overlap characters before the previous one ended
+    text = re.sub(r'[ \t]+', ' ', re.sub(r'\n\s*\n\s*', '\n\n', text)).strip()
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            for separator in ('\n\n', '\n', '. ', ' '):
+                cut = text.rfind(separator, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def extract_document(path, extension, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, max_chars=MAX_DOCUMENT_CHARS):
+    # Runs in a worker process; returns the chunks and the CPU seconds spent
+    started = time.process_time()
+    if extension in TEXT_EXTENSIONS:
+        text = plain_text(path, extension, max_chars)
+    elif extension in OFFICE_PARTS:
+        text = office_text(path, extension, max_chars)
+    elif extension == '.pdf':
+        text = pdf_text(path, max_chars)
+    else:
+        raise UnsupportedDocument(f"No text extractor for {extension} files")
+    return chunk_text(text, chunk_size, overlap), time.process_time() - started
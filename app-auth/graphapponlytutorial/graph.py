@@ -1,6 +1,14 @@
+import re
+import time
+import json
+import asyncio
+import inspect
+import httpx
 from configparser import SectionProxy
+from azure.core.credentials import AccessToken
 from azure.identity.aio import ClientSecretCredential
 from msgraph import GraphServiceClient
+from msgraph.generated.users.users_request_builder import UsersRequestBuilder
 from msgraph.generated.users.item.user_item_request_builder import UserItemRequestBuilder
 from msgraph.generated.users.item.mail_folders.item.messages.messages_request_builder import MessagesRequestBuilder
 from msgraph.generated.users.item.send_mail.send_mail_post_request_body import SendMailPostRequestBody
@@ -10,22 +18,105 @@ from msgraph.generated.models.body_type import BodyType
 from msgraph.generated.models.recipient import Recipient
 from msgraph.generated.models.email_address import EmailAddress
 from msgraph.generated.users.item.calendar.events.events_request_builder import EventsRequestBuilder
+from msgraph.generated.users.item.messages.messages_request_builder import MessagesRequestBuilder as MailboxMessagesRequestBuilder
+from msgraph.generated.users.item.messages.item.message_item_request_builder import MessageItemRequestBuilder
+from msgraph.generated.users.item.events.events_request_builder import EventsRequestBuilder as MailboxEventsRequestBuilder
+from msgraph.generated.users.item.contacts.contacts_request_builder import ContactsRequestBuilder
+from msgraph.generated.users.item.messages.item.attachments.attachments_request_builder import AttachmentsRequestBuilder
+from msgraph.generated.users.item.events.item.event_item_request_builder import EventItemRequestBuilder
 from msgraph.generated.sites.sites_request_builder import SitesRequestBuilder
+from msgraph.generated.sites.item.lists.lists_request_builder import ListsRequestBuilder
+from msgraph.generated.sites.item.lists.item.items.items_request_builder import ItemsRequestBuilder
+from msgraph.generated.models.subscription import Subscription
+from msgraph.generated.search.query.query_post_request_body import QueryPostRequestBody
+from msgraph.generated.models.search_request import SearchRequest
+from msgraph.generated.models.search_query import SearchQuery
+from msgraph.generated.models.entity_type import EntityType
+from shared_store import async_get_or_compute
+
+# With application permissions the Search API only covers SharePoint and OneDrive content, so these types share
+# one search request; mail and events are searched in a mailbox instead
+APP_ONLY_SEARCH_TYPES = ('driveItem', 'listItem')
+SEARCH_PAGE_SIZE = 500
+MAILBOX_SEARCH_TYPES = ('message', 'event')
+# Events have no $search, so at most this many of the mailbox's events are matched locally
+EVENT_SEARCH_SCAN = 1000
+
+class StaticTokenCredential:
+    # Async credential that always returns the same token, for local Graph stand-ins
+    def __init__(self, token: str):
+        self.token = token
+
+    async def get_token(self, *scopes, **kwargs):
+        return AccessToken(self.token, int(time.time()) + 3600)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+class SharedTokenCredential:
+    # Async credential that shares tokens between worker processes through a shared store
+    def __init__(self, credential, store, key_prefix: str):
+        self.credential = credential
+        self.store = store
+        self.key_prefix = key_prefix
+
+    async def get_token(self, *scopes, **kwargs):
+        # Claims challenges need a fresh token, so they bypass the store
+        if kwargs.get('claims'):
+            return await self.credential.get_token(*scopes, **kwargs)
+
+        async def fetch():
+            token = await self.credential.get_token(*scopes, **kwargs)
+            return json.dumps([token.token, token.expires_on])
+
+        # Keep tokens until five minutes before they expire, and let one worker fetch a missing one
+        key = f"{self.key_prefix}:{' '.join(sorted(scopes))}"
+        value, _ = await async_get_or_compute(self.store, key, fetch, lambda value: json.loads(value)[1] - time.time() - 300)
+        token, expires_on = json.loads(value)
+        return AccessToken(token, expires_on)
+
+    async def close(self):
+        await self.credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
 
 class Graph:
     settings: SectionProxy
     client_credential: ClientSecretCredential
     app_client: GraphServiceClient
 
-    def __init__(self, config: SectionProxy):
+    def __init__(self, config: SectionProxy, store=None):
         self.settings = config
         client_id = self.settings['clientId']
         tenant_id = self.settings['tenantId']
         client_secret = self.settings['clientSecret']
 
-        self.client_credential = ClientSecretCredential(tenant_id, client_id, client_secret)
+        if self.settings.get('staticToken'):
+            self.client_credential = StaticTokenCredential(self.settings['staticToken']) # type: ignore
+        else:
+            self.client_credential = ClientSecretCredential(tenant_id, client_id, client_secret)
+        # Share app-only tokens with the other workers instead of fetching one per worker
+        if store is not None:
+            self.client_credential = SharedTokenCredential(self.client_credential, store, f"token:{tenant_id}:{client_id}") # type: ignore
         self.app_client = GraphServiceClient(self.client_credential) # type: ignore
 
+        # Point the client at another Graph endpoint, such as tests/mock_graph_server.py
+        self.base_url = (self.settings.get('graphBaseUrl') or 'https://graph.microsoft.com/v1.0').rstrip('/')
+        if self.settings.get('graphBaseUrl'):
+            self.app_client.request_adapter.base_url = self.base_url
+        # Raw HTTP client for file content, batches and uploads, created on first use in this Graph's event loop
+        self.http_client = None
+
         # Hard-coded user ID
         self.user_id = '7e00cad8-6276-4c23-89f7-d3ea1c5fd1b8'
 
@@ -60,6 +151,11 @@ class Graph:
                 request_configuration=request_config)
         return messages
 
+    async def get_inbox_page(self, next_link: str):
+        # Follow the @odata.nextLink of a previous inbox page
+        messages = await self.app_client.users.by_user_id(self.user_id).mail_folders.by_mail_folder_id('inbox').messages.with_url(next_link).get()
+        return messages
+
     async def send_mail(self, subject: str, body: str, recipient: str):
         message = Message()
         message.subject = subject
@@ -98,20 +194,7 @@ class Graph:
         messages = await self.app_client.users.by_user_id(self.user_id).mail_folders.by_mail_folder_id('inbox').messages.get(
             request_configuration=request_config)
 
-        email_metadata = []
-        for message in messages.value:
-            metadata = {
-                "subject": message.subject,
-                "from": message.from_.email_address.address if message.from_ and message.from_.email_address else "N/A",
-                "received_date_time": message.received_date_time.strftime('%Y-%m-%d %H:%M:%S%z'),
-                "is_read": message.is_read,
-                "to_recipients": [recipient.email_address.address for recipient in message.to_recipients] if message.to_recipients else [],
-                "cc_recipients": [recipient.email_address.address for recipient in message.cc_recipients] if message.cc_recipients else [],
-                "importance": message.importance.value if message.importance else "normal",
-                "has_attachments": message.has_attachments,
-                "categories": message.categories if message.categories else []
-            }
-            email_metadata.append(metadata)
+        email_metadata = [message_metadata(message) for message in messages.value]
 
         # Print the enriched metadata
         for metadata in email_metadata:
@@ -187,4 +270,490 @@ class Graph:
             else:
                 print(f"No SharePoint sites found for search term '{search_term or ''}'")
         except Exception as e:
-            print(f"Error extracting SharePoint usage: {e}")
\ No newline at end of file
+            print(f"Error extracting SharePoint usage: {e}")
+
+    async def extract_sharepoint_list_items(self, search_term=None):
+        if search_term:
+            sites = await self.app_client.sites.get(
+                request_configuration=SitesRequestBuilder.SitesRequestBuilderGetRequestConfiguration(
+                    query_parameters=SitesRequestBuilder.SitesRequestBuilderGetQueryParameters(search=search_term)
+                )
+            )
+        else:
+            sites = await self.app_client.sites.get()
+
+        list_items = []
+        if sites and sites.value:
+            for site in sites.value:
+                lists = await self.app_client.sites.by_site_id(site.id).lists.get()
+                if not lists or not lists.value:
+                    continue
+                for lst in lists.value:
+                    items = await self.app_client.sites.by_site_id(site.id).lists.by_list_id(lst.id).items.get()
+                    if not items or not items.value:
+                        continue
+                    list_items.extend(list_item(item, site, lst) for item in items.value)
+
+        # Return the flattened list items
+        return list_items
+
+    async def get_sharepoint_lists(self):
+        sites = await self.app_client.sites.get()
+        sharepoint_lists = []
+        for site in (sites.value if sites and sites.value else []):
+            lists = await self.app_client.sites.by_site_id(site.id).lists.get()
+            for lst in (lists.value if lists and lists.value else []):
+                sharepoint_lists.append({"site_id": site.id, "site": site.display_name or site.web_url,
+                                         "list_id": lst.id, "list": lst.display_name})
+        return sharepoint_lists
+
+    async def get_email_metadata(self, message_id: str, user_id=None):
+        query_params = MessageItemRequestBuilder.MessageItemRequestBuilderGetQueryParameters(
+            select=['from', 'isRead', 'receivedDateTime', 'subject', 'toRecipients', 'ccRecipients', 'importance', 'hasAttachments', 'categories']
+        )
+        request_config = MessageItemRequestBuilder.MessageItemRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        message = await self.app_client.users.by_user_id(user_id or self.user_id).messages.by_message_id(message_id).get(
+            request_configuration=request_config)
+        return message_metadata(message)
+
+    async def get_users_page(self, next_link=None, page_size=999):
+        # One page of the tenant's users; pass the @odata.nextLink of the previous page to continue
+        if next_link:
+            return await self.app_client.users.with_url(next_link).get()
+        query_params = UsersRequestBuilder.UsersRequestBuilderGetQueryParameters(
+            select=['id', 'mail', 'userPrincipalName'],
+            top=page_size
+        )
+        request_config = UsersRequestBuilder.UsersRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        return await self.app_client.users.get(request_configuration=request_config)
+
+    async def get_mailbox_page(self, user_id: str, next_link=None, page_size=100):
+        # One page of message metadata from any user's mailbox, across all folders
+        messages_builder = self.app_client.users.by_user_id(user_id).messages
+        if next_link:
+            return await messages_builder.with_url(next_link).get()
+        query_params = MailboxMessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+            select=['from', 'isRead', 'receivedDateTime', 'subject', 'toRecipients', 'ccRecipients', 'importance', 'hasAttachments', 'categories'],
+            top=page_size
+        )
+        request_config = MailboxMessagesRequestBuilder.MessagesRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        return await messages_builder.get(request_configuration=request_config)
+
+    async def get_events_page(self, user_id: str, next_link=None, page_size=100):
+        # One page of a user's calendar events; pass the @odata.nextLink of the previous page to continue
+        events_builder = self.app_client.users.by_user_id(user_id).events
+        if next_link:
+            return await events_builder.with_url(next_link).get()
+        query_params = MailboxEventsRequestBuilder.EventsRequestBuilderGetQueryParameters(
+            select=['subject', 'start', 'end', 'location'],
+            top=page_size
+        )
+        request_config = MailboxEventsRequestBuilder.EventsRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        return await events_builder.get(request_configuration=request_config)
+
+    async def get_contacts_page(self, user_id: str, next_link=None, page_size=100):
+        # One page of a user's contacts
+        contacts_builder = self.app_client.users.by_user_id(user_id).contacts
+        if next_link:
+            return await contacts_builder.with_url(next_link).get()
+        query_params = ContactsRequestBuilder.ContactsRequestBuilderGetQueryParameters(
+            select=['displayName', 'emailAddresses'],
+            top=page_size
+        )
+        request_config = ContactsRequestBuilder.ContactsRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        return await contacts_builder.get(request_configuration=request_config)
+
+    async def get_attachments(self, user_id: str, message_id: str):
+        # Attachment metadata only; contentBytes is left out so no attachment is loaded as base64
+        attachments_builder = self.app_client.users.by_user_id(user_id).messages.by_message_id(message_id).attachments
+        query_params = AttachmentsRequestBuilder.AttachmentsRequestBuilderGetQueryParameters(
+            select=['id', 'name', 'contentType', 'size', 'isInline', 'lastModifiedDateTime']
+        )
+        request_config = AttachmentsRequestBuilder.AttachmentsRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        attachments = []
+        page = await attachments_builder.get(request_configuration=request_config)
+        while page:
+            attachments.extend(page.value or [])
+            if not page.odata_next_link:
+                break
+            page = await attachments_builder.with_url(page.odata_next_link).get()
+        return attachments
+
+    async def stream_attachment(self, user_id: str, message_id: str, attachment_id: str, write, chunk_size=1024 * 1024):
+        # The raw content of a file attachment, or the MIME of an attached item, in chunks from $value
+        return await self.stream_content(f"users/{user_id}/messages/{message_id}/attachments/{attachment_id}/$value",
+                                         write, chunk_size)
+
+    async def get_calendar_event(self, event_id: str, user_id=None):
+        query_params = EventItemRequestBuilder.EventItemRequestBuilderGetQueryParameters(
+            select=['subject', 'start', 'end', 'location']
+        )
+        request_config = EventItemRequestBuilder.EventItemRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        event = await self.app_client.users.by_user_id(user_id or self.user_id).events.by_event_id(event_id).get(
+            request_configuration=request_config)
+        return event
+
+    async def get_list_items(self, site_id: str, list_id: str):
+        # Every item of one list, in the same shape as extract_sharepoint_list_items
+        site_builder = self.app_client.sites.by_site_id(site_id)
+        site, lst = await asyncio.gather(site_builder.get(), site_builder.lists.by_list_id(list_id).get())
+        items, next_link = [], None
+        while True:
+            page = await self.get_list_items_page(site_id, list_id, next_link)
+            items.extend(list_item(item, site, lst) for item in page.value or [])
+            next_link = page.odata_next_link
+            if not next_link:
+                return items
+
+    async def get_sites_page(self, search_term=None, next_link=None):
+        # One page of sites; pass the @odata.nextLink of the previous page to continue
+        if next_link:
+            return await self.app_client.sites.with_url(next_link).get()
+        query_params = SitesRequestBuilder.SitesRequestBuilderGetQueryParameters(
+            search=search_term or None,
+            select=['id', 'displayName', 'webUrl']
+        )
+        return await self.app_client.sites.get(
+            request_configuration=SitesRequestBuilder.SitesRequestBuilderGetRequestConfiguration(query_parameters=query_params)
+        )
+
+    async def get_lists_page(self, site_id: str, next_link=None):
+        # One page of a site's lists, with the modification time used to skip unchanged lists
+        lists_builder = self.app_client.sites.by_site_id(site_id).lists
+        if next_link:
+            return await lists_builder.with_url(next_link).get()
+        query_params = ListsRequestBuilder.ListsRequestBuilderGetQueryParameters(
+            select=['id', 'displayName', 'lastModifiedDateTime']
+        )
+        return await lists_builder.get(
+            request_configuration=ListsRequestBuilder.ListsRequestBuilderGetRequestConfiguration(query_parameters=query_params)
+        )
+
+    async def get_list_items_page(self, site_id: str, list_id: str, next_link=None, page_size=200):
+        # One page of a list's items with their fields
+        items_builder = self.app_client.sites.by_site_id(site_id).lists.by_list_id(list_id).items
+        if next_link:
+            return await items_builder.with_url(next_link).get()
+        query_params = ItemsRequestBuilder.ItemsRequestBuilderGetQueryParameters(
+            expand=['fields'],
+            top=page_size
+        )
+        return await items_builder.get(
+            request_configuration=ItemsRequestBuilder.ItemsRequestBuilderGetRequestConfiguration(query_parameters=query_params)
+        )
+
+    async def get_drives(self, search_term=None, include_onedrive=False):
+        # Document libraries of every site, and optionally every user's OneDrive
+        drives, next_link = [], None
+        while True:
+            sites = await self.get_sites_page(search_term, next_link)
+            for site in sites.value or []:
+                site_drives = await self.app_client.sites.by_site_id(site.id).drives.get()
+                drives.extend({'drive_id': drive.id, 'source': f"{site.display_name or site.web_url}/{drive.name}"}
+                              for drive in (site_drives.value if site_drives and site_drives.value else []))
+            next_link = sites.odata_next_link
+            if not next_link:
+                break
+
+        next_link = None
+        while include_onedrive:
+            users = await self.get_users_page(next_link)
+            for user in users.value or []:
+                try:
+                    drive = await self.app_client.users.by_user_id(user.id).drive.get()
+                except Exception:
+                    # Users without a OneDrive license have no drive
+                    continue
+                drives.append({'drive_id': drive.id, 'source': f"OneDrive of {user.user_principal_name or user.id}"})
+            next_link = users.odata_next_link
+            if not next_link:
+                break
+        return drives
+
+    async def get_drive_items_page(self, drive_id: str, next_link=None):
+        # One page of every file and folder in a drive, via delta so nested folders need no extra requests
+        delta_builder = self.app_client.drives.by_drive_id(drive_id).items.by_drive_item_id('root').delta
+        if next_link:
+            return await delta_builder.with_url(next_link).get()
+        return await delta_builder.get()
+
+    def get_http_client(self):
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(follow_redirects=True, timeout=httpx.Timeout(60.0, connect=10.0))
+        return self.http_client
+
+    async def request(self, method: str, url: str, authorize=True, retries=3, **kwargs):
+        # One raw request to a path under the Graph base URL or to an absolute URL, retried while throttled.
+        # Upload URLs are pre-authenticated and must be called with authorize=False.
+        if not url.startswith('http'):
+            url = f"{self.base_url}/{url.lstrip('/')}"
+        headers = kwargs.pop('headers', None) or {}
+        for attempt in range(retries + 1):
+            if authorize:
+                headers['Authorization'] = f"Bearer {await self.get_app_only_token()}"
+            response = await self.get_http_client().request(method, url, headers=headers, **kwargs)
+            if response.status_code in (429, 503, 504) and attempt < retries:
+                await asyncio.sleep(float(response.headers.get('Retry-After', 2 ** attempt)))
+                continue
+            response.raise_for_status()
+            return response
+
+    async def batch(self, requests):
+        # Up to 20 requests in one $batch call; returns their responses in the same order.
+        # Each response has its own status, so throttled or failed requests have to be handled by the caller.
+        response = await self.request('POST', '$batch', json={'requests': requests})
+        responses = {item['id']: item for item in response.json()['responses']}
+        return [responses[request['id']] for request in requests]
+
+    async def create_draft(self, user_id: str, message: dict):
+        response = await self.request('POST', f"users/{user_id}/messages", json=message)
+        return response.json()['id']
+
+    async def add_attachment(self, user_id: str, message_id: str, attachment: dict):
+        # Attachments under 3 MB can be added in one request
+        await self.request('POST', f"users/{user_id}/messages/{message_id}/attachments", json=attachment)
+
+    async def upload_attachment(self, user_id: str, message_id: str, name: str, size: int, read, content_type=None,
+                                chunk_size=10 * 320 * 1024):
+        # Attachments of 3 MB to 150 MB go through an upload session, in chunks that are multiples of 320 KiB.
+        # read(count) returns the next bytes of the attachment, so only one chunk is held in memory.
+        item = {'attachmentType': 'file', 'name': name, 'size': size}
+        if content_type:
+            item['contentType'] = content_type
+        session = await self.request('POST', f"users/{user_id}/messages/{message_id}/attachments/createUploadSession",
+                                     json={'AttachmentItem': item})
+        upload_url = session.json()['uploadUrl']
+        offset = 0
+        while offset < size:
+            chunk = read(min(chunk_size, size - offset))
+            if inspect.isawaitable(chunk):
+                chunk = await chunk
+            if not chunk:
+                raise Exception(f"Attachment {name} ended after {offset} of {size} bytes")
+            await self.request('PUT', upload_url, authorize=False, content=chunk, headers={
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': f"bytes {offset}-{offset + len(chunk) - 1}/{size}",
+            })
+            offset += len(chunk)
+
+    async def send_draft(self, user_id: str, message_id: str):
+        await self.request('POST', f"users/{user_id}/messages/{message_id}/send")
+
+    async def delete_draft(self, user_id: str, message_id: str):
+        await self.request('DELETE', f"users/{user_id}/messages/{message_id}")
+
+    async def stream_content(self, path: str, write, chunk_size=1024 * 1024, retries=3):
+        # Stream a binary resource such as /drives/{id}/items/{id}/content in chunks to write(chunk), which may be async.
+        # Nothing is held in memory beyond one chunk. Returns the number of bytes written.
+        for attempt in range(retries + 1):
+            token = await self.get_app_only_token()
+            # httpx drops the Authorization header when following a redirect to the pre-authenticated download host
+            async with self.get_http_client().stream('GET', f"{self.base_url}/{path.lstrip('/')}",
+                                               headers={'Authorization': f"Bearer {token}"}) as response:
+                if response.status_code in (429, 503, 504) and attempt < retries:
+                    await asyncio.sleep(float(response.headers.get('Retry-After', 2 ** attempt)))
+                    continue
+                response.raise_for_status()
+                size = 0
+                async for chunk in response.aiter_bytes(chunk_size):
+                    result = write(chunk)
+                    if inspect.isawaitable(result):
+                        await result
+                    size += len(chunk)
+                return size
+
+    async def create_subscription(self, resource: str, change_type: str, notification_url: str, client_state: str,
+                                  expiration, lifecycle_notification_url=None):
+        subscription = Subscription()
+        subscription.resource = resource
+        subscription.change_type = change_type
+        subscription.notification_url = notification_url
+        subscription.lifecycle_notification_url = lifecycle_notification_url
+        subscription.client_state = client_state
+        subscription.expiration_date_time = expiration
+        return await self.app_client.subscriptions.post(subscription)
+
+    async def renew_subscription(self, subscription_id: str, expiration):
+        subscription = Subscription()
+        subscription.expiration_date_time = expiration
+        return await self.app_client.subscriptions.by_subscription_id(subscription_id).patch(subscription)
+
+    async def delete_subscription(self, subscription_id: str):
+        await self.app_client.subscriptions.by_subscription_id(subscription_id).delete()
+
+    async def search(self, query: str, entity_types=None, fields=None, max_results=25, user_id=None):
+        # Filter server-side so only matching items are transferred. Without entity types only SharePoint and
+        # OneDrive content is searched; mail and events come from one mailbox, by default the hard-coded user.
+        # Each kind of search fails on its own, so the hits of the others are still returned with the errors.
+        entity_types = list(entity_types or APP_ONLY_SEARCH_TYPES)
+        unknown = [entity_type for entity_type in entity_types if entity_type not in APP_ONLY_SEARCH_TYPES + MAILBOX_SEARCH_TYPES]
+        if unknown:
+            raise Exception(f"Unsupported entity types: {', '.join(unknown)}")
+        user_id = user_id or self.user_id
+        searches = []
+        app_only_types = tuple(entity_type for entity_type in APP_ONLY_SEARCH_TYPES if entity_type in entity_types)
+        if app_only_types:
+            searches.append((app_only_types, self.search_entity_types(query, app_only_types, fields, max_results, SEARCH_PAGE_SIZE)))
+        if 'message' in entity_types:
+            searches.append((('message',), self.search_messages(user_id, query, max_results)))
+        if 'event' in entity_types:
+            searches.append((('event',), self.search_events(user_id, query, max_results)))
+
+        results = await asyncio.gather(*[search for _, search in searches], return_exceptions=True)
+        hits, errors = [], []
+        for (types, _), result in zip(searches, results):
+            if isinstance(result, Exception):
+                errors.append({'entity_types': list(types), 'error': str(result) or type(result).__name__})
+            else:
+                hits.extend(result)
+        return {'hits': hits, 'errors': errors}
+
+    async def search_messages(self, user_id: str, query: str, max_results=25):
+        # $search on the mailbox works with application permissions, unlike message search in the Search API
+        messages_builder = self.app_client.users.by_user_id(user_id).messages
+        phrase = query.replace('"', '')
+        query_params = MailboxMessagesRequestBuilder.MessagesRequestBuilderGetQueryParameters(
+            search=f'"{phrase}"',
+            select=['subject', 'from', 'receivedDateTime', 'bodyPreview', 'webLink'],
+            top=min(max_results, 100)
+        )
+        request_config = MailboxMessagesRequestBuilder.MessagesRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        hits = []
+        page = await messages_builder.get(request_configuration=request_config)
+        while page:
+            for message in page.value or []:
+                hits.append(resource_hit(message, message.id, len(hits) + 1, message.body_preview, 'message'))
+            if len(hits) >= max_results or not page.odata_next_link:
+                break
+            page = await messages_builder.with_url(page.odata_next_link).get()
+        return hits[:max_results]
+
+    async def search_events(self, user_id: str, query: str, max_results=25):
+        # Events are matched locally: every query term must appear in the subject, preview or location
+        terms = [term for term in re.findall(r'\w+', query.lower()) if term.upper() not in ('AND', 'OR', 'NOT')]
+        events_builder = self.app_client.users.by_user_id(user_id).events
+        query_params = MailboxEventsRequestBuilder.EventsRequestBuilderGetQueryParameters(
+            select=['subject', 'start', 'end', 'location', 'bodyPreview', 'webLink'],
+            top=100
+        )
+        request_config = MailboxEventsRequestBuilder.EventsRequestBuilderGetRequestConfiguration(
+            query_parameters=query_params
+        )
+        hits, scanned = [], 0
+        page = await events_builder.get(request_configuration=request_config)
+        while page:
+            for event in page.value or []:
+                scanned += 1
+                text = ' '.join(filter(None, [event.subject, event.body_preview,
+                                              event.location.display_name if event.location else None])).lower()
+                if terms and all(term in text for term in terms):
+                    hits.append(resource_hit(event, event.id, len(hits) + 1, event.body_preview, 'event'))
+            if len(hits) >= max_results or scanned >= EVENT_SEARCH_SCAN or not page.odata_next_link:
+                break
+            page = await events_builder.with_url(page.odata_next_link).get()
+        return hits[:max_results]
+
+    async def search_entity_types(self, query: str, entity_types, fields, max_results, page_size):
+        hits = []
+        offset = 0
+        while len(hits) < max_results:
+            search_request = SearchRequest()
+            search_request.entity_types = [EntityType(entity_type) for entity_type in entity_types]
+            search_request.query = SearchQuery()
+            search_request.query.query_string = query
+            search_request.from_ = offset
+            search_request.size = min(page_size, max_results - len(hits))
+            if fields:
+                search_request.fields = list(fields)
+            # App-only search of SharePoint and OneDrive content requires a region
+            if self.settings.get('searchRegion'):
+                search_request.region = self.settings['searchRegion']
+
+            request_body = QueryPostRequestBody()
+            request_body.requests = [search_request]
+            response = await self.app_client.search.query.post(request_body)
+
+            more_results = False
+            page_hits = 0
+            for search_response in (response.value if response and response.value else []):
+                for container in search_response.hits_containers or []:
+                    more_results = more_results or bool(container.more_results_available)
+                    for hit in container.hits or []:
+                        hits.append(search_hit(hit))
+                        page_hits += 1
+            if not more_results or not page_hits:
+                break
+            offset += page_hits
+
+        return hits[:max_results]
+
+def message_metadata(message):
+    return {
+        "id": message.id,
+        "subject": message.subject,
+        "from": message.from_.email_address.address if message.from_ and message.from_.email_address else "N/A",
+        "received_date_time": message.received_date_time.strftime('%Y-%m-%d %H:%M:%S%z'),
+        "is_read": message.is_read,
+        "to_recipients": [recipient.email_address.address for recipient in message.to_recipients] if message.to_recipients else [],
+        "cc_recipients": [recipient.email_address.address for recipient in message.cc_recipients] if message.cc_recipients else [],
+        "importance": message.importance.value if message.importance else "normal",
+        "has_attachments": message.has_attachments,
+        "categories": message.categories if message.categories else []
+    }
+
+def list_item(item, site, lst):
+    return {
+        "id": item.id,
+        "site_id": site.id,
+        "site": site.display_name or site.web_url,
+        "list_id": lst.id,
+        "list": lst.display_name,
+        "fields": item.fields.additional_data if item.fields else {}
+    }
+
+def search_hit(hit):
+    return resource_hit(hit.resource, hit.hit_id, hit.rank, hit.summary)
+
+def resource_hit(resource, hit_id, rank, summary, resource_type=None):
+    # Flatten a search hit into the fields the RAG prompt needs
+    result = {
+        "id": hit_id,
+        "rank": rank,
+        "summary": summary,
+        "type": resource_type or ((resource.odata_type or '').replace('#microsoft.graph.', '') if resource else None),
+    }
+    if resource is None:
+        return result
+    sender = getattr(resource, 'from_', None)
+    start = getattr(resource, 'start', None)
+    end = getattr(resource, 'end', None)
+    fields = getattr(resource, 'fields', None)
+    values = {
+        "subject": getattr(resource, 'subject', None),
+        "name": getattr(resource, 'name', None),
+        "from": sender.email_address.address if sender and sender.email_address else None,
+        "received_date_time": str(resource.received_date_time) if getattr(resource, 'received_date_time', None) else None,
+        "start": start.date_time if start else None,
+        "end": end.date_time if end else None,
+        "web_url": getattr(resource, 'web_url', None) or getattr(resource, 'web_link', None),
+        "last_modified_date_time": str(resource.last_modified_date_time) if getattr(resource, 'last_modified_date_time', None) else None,
+        "fields": fields.additional_data if fields else None,
+    }
+    result.update({key: value for key, value in values.items() if value})
+    return result
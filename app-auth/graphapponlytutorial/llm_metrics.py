@@ -0,0 +1,172 @@
+# llm_metrics.py
+import os
+import time
+import sqlite3
+import argparse
+import threading
+import statistics
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Define where LLM call metrics are stored
+LLM_METRICS_PATH = os.getenv('LLM_METRICS_PATH', 'llm_metrics.db')
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+
+# USD per million tokens as (input, output). Update these from the current Gemini price list.
+MODEL_PRICES = {
+    'gemini-1.5-flash-8b': (0.0375, 0.15),
+    'models/gemini-2.0-flash-exp': (0.0, 0.0),
+    'models/text-embedding-004': (0.0, 0.0),
+}
+
+class MetricsStore:
+    path: str
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                timestamp REAL NOT NULL,
+                stage TEXT NOT NULL,
+                model TEXT NOT NULL,
+                latency_ms REAL NOT NULL,
+                time_to_first_token_ms REAL,
+                prompt_tokens INTEGER,
+                response_tokens INTEGER,
+                tokens_estimated INTEGER NOT NULL,
+                retries INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS llm_calls_timestamp ON llm_calls (timestamp);
+        ''')
+
+    def record(self, call):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT INTO llm_calls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+                time.time(), call.stage, call.model, call.latency_ms, call.time_to_first_token_ms,
+                call.prompt_tokens, call.response_tokens, int(call.tokens_estimated),
+                call.retries, call.status, call.error,
+            ))
+
+    def summary(self, since=None):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT stage, model, latency_ms, prompt_tokens, response_tokens, retries, status '
+                'FROM llm_calls WHERE timestamp >= ?', (since or 0,)).fetchall()
+
+        groups = {}
+        for stage, model, latency_ms, prompt_tokens, response_tokens, retries, status in rows:
+            groups.setdefault((stage, model), []).append((latency_ms, prompt_tokens or 0, response_tokens or 0, retries, status))
+
+        report = []
+        for (stage, model), calls in sorted(groups.items()):
+            latencies = sorted(call[0] for call in calls)
+            prompt_tokens = sum(call[1] for call in calls)
+            response_tokens = sum(call[2] for call in calls)
+            input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+            report.append({
+                'stage': stage,
+                'model': model,
+                'calls': len(calls),
+                'errors': sum(1 for call in calls if call[4] != 'ok'),
+                'retries': sum(call[3] for call in calls),
+                'p50_ms': round(statistics.median(latencies), 1),
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+                'prompt_tokens': prompt_tokens,
+                'response_tokens': response_tokens,
+                'cost_usd': round((prompt_tokens * input_price + response_tokens * output_price) / 1_000_000, 6),
+            })
+        return report
+
+class LLMCall:
+    def __init__(self, stage, model):
+        self.stage = stage
+        self.model = model
+        self.latency_ms = 0.0
+        self.time_to_first_token_ms = None
+        self.prompt_tokens = None
+        self.response_tokens = None
+        self.tokens_estimated = False
+        self.retries = 0
+        self.status = 'ok'
+        self.error = None
+
+@lru_cache(maxsize=None)
+def get_metrics_store(path=LLM_METRICS_PATH):
+    return MetricsStore(path)
+
+@contextmanager
+def track_llm_call(stage, model, store=None):
+    # Record latency, tokens, retries and outcome of one LLM call
+    call = LLMCall(stage, model)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call.status = 'error'
+        call.error = str(e)
+        raise
+    finally:
+        call.latency_ms = (time.perf_counter() - start) * 1000
+        (store or get_metrics_store()).record(call)
+
+def call_with_retries(function, call, max_retries=LLM_MAX_RETRIES, backoff=0.5):
+    for attempt in range(max_retries + 1):
+        try:
+            return function()
+        except Exception:
+            if attempt == max_retries:
+                raise
+            call.retries += 1
+            time.sleep(backoff * 2 ** attempt)
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return max(1, len(text or '') // 4)
+
+def record_usage(call, usage, prompt_text=None, response_text=None):
+    # usage is Gemini usage metadata as an object or a dict; estimate when it is missing
+    if isinstance(usage, dict):
+        prompt_tokens = usage.get('prompt_token_count')
+        response_tokens = usage.get('candidates_token_count')
+    else:
+        prompt_tokens = getattr(usage, 'prompt_token_count', None)
+        response_tokens = getattr(usage, 'candidates_token_count', None)
+
+    if prompt_tokens is None and prompt_text is not None:
+        prompt_tokens = estimate_tokens(prompt_text)
+        call.tokens_estimated = True
+    if response_tokens is None and response_text is not None:
+        response_tokens = estimate_tokens(response_text)
+        call.tokens_estimated = True
+    call.prompt_tokens = prompt_tokens
+    call.response_tokens = response_tokens
+
+def llama_usage(response):
+    # llama_index keeps the raw Gemini response, which may carry usage metadata
+    raw = getattr(response, 'raw', None) or {}
+    return raw.get('usage_metadata') if isinstance(raw, dict) else getattr(raw, 'usage_metadata', None)
+
+def print_report(report):
+    header = f"{'stage':<12} {'model':<30} {'calls':>6} {'errors':>6} {'retries':>7} {'p50 ms':>9} {'p95 ms':>9} {'in tok':>9} {'out tok':>9} {'cost $':>10}"
+    print(header)
+    print('-' * len(header))
+    for row in report:
+        print(f"{row['stage']:<12} {row['model']:<30} {row['calls']:>6} {row['errors']:>6} {row['retries']:>7} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['prompt_tokens']:>9} {row['response_tokens']:>9} {row['cost_usd']:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize recorded LLM calls per stage and model')
+    parser.add_argument('--path', default=LLM_METRICS_PATH)
+    parser.add_argument('--hours', type=float, help='Only include calls from the last N hours')
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    print_report(MetricsStore(args.path).summary(since))
+
+if __name__ == "__main__":
+    main()
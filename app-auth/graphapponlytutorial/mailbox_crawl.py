@@ -0,0 +1,310 @@
+# mailbox_crawl.py
+import os
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import hashlib
+import argparse
+import threading
+import configparser
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph, message_metadata
+from records import email_record
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define where the crawl queue and the extracted records are kept
+CRAWL_QUEUE_PATH = os.getenv('CRAWL_QUEUE_PATH', 'mailbox_crawl.db')
+CRAWL_OUTPUT_DIR = os.getenv('CRAWL_OUTPUT_DIR', 'mailbox_crawl')
+# A shard whose lease is not renewed within this many seconds goes back to the queue
+LEASE_SECONDS = float(os.getenv('CRAWL_LEASE_SECONDS', '60'))
+# A shard that fails this many times is parked as failed
+MAX_ATTEMPTS = int(os.getenv('CRAWL_MAX_ATTEMPTS', '5'))
+
+class CrawlQueue:
+    path: str
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Autocommit, so leasing can take the write lock up front with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS shards (
+                id TEXT PRIMARY KEY,
+                mailbox TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                checkpoint TEXT,
+                output_bytes INTEGER NOT NULL DEFAULT 0,
+                messages INTEGER NOT NULL DEFAULT 0,
+                pages INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued REAL NOT NULL,
+                started REAL,
+                updated REAL,
+                finished REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS shards_state ON shards (state, enqueued);
+        ''')
+
+    def enqueue(self, mailboxes):
+        # mailboxes is a list of (user_id, address); mailboxes already in the queue keep their progress
+        now = time.time()
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute('BEGIN')
+            self.connection.executemany('INSERT OR IGNORE INTO shards (id, mailbox, enqueued) VALUES (?, ?, ?)',
+                                        [(user_id, mailbox, now) for user_id, mailbox in mailboxes])
+            self.connection.execute('COMMIT')
+            return self.connection.total_changes - before
+
+    def lease(self, owner, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        # Take the oldest pending shard, or one whose owner stopped sending heartbeats
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.execute('''
+                    UPDATE shards SET state = 'failed', owner = NULL, error = 'Lease expired too many times'
+                    WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?''', (now, max_attempts))
+                row = self.connection.execute('''
+                    SELECT id FROM shards WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+                    ORDER BY enqueued, id LIMIT 1''', (now,)).fetchone()
+                if row:
+                    self.connection.execute('''
+                        UPDATE shards SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1,
+                        started = COALESCE(started, ?), updated = ? WHERE id = ?''', (owner, now + lease_seconds, now, now, row[0]))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+        return self.get(row[0]) if row else None
+
+    def heartbeat(self, shard_id, owner, lease_seconds=LEASE_SECONDS):
+        # False means the lease was lost and another worker may own the shard now
+        with self.lock:
+            cursor = self.connection.execute('''
+                UPDATE shards SET lease_expires = ? WHERE state = 'leased' AND id = ? AND owner = ?''',
+                (time.time() + lease_seconds, shard_id, owner))
+        return cursor.rowcount == 1
+
+    def checkpoint(self, shard_id, owner, next_link, messages, output_bytes, lease_seconds=LEASE_SECONDS):
+        # Record a finished page; a resumed shard continues from next_link with the output cut back to output_bytes.
+        # The last page completes the shard in the same update, so a crash cannot leave a shard with no
+        # next_link to be crawled again from the first page
+        now = time.time()
+        with self.lock:
+            if next_link:
+                cursor = self.connection.execute('''
+                    UPDATE shards SET checkpoint = ?, output_bytes = ?, messages = messages + ?, pages = pages + 1,
+                    updated = ?, lease_expires = ? WHERE state = 'leased' AND id = ? AND owner = ?''',
+                    (next_link, output_bytes, messages, now, now + lease_seconds, shard_id, owner))
+            else:
+                cursor = self.connection.execute('''
+                    UPDATE shards SET state = 'done', owner = NULL, checkpoint = NULL, output_bytes = ?, messages = messages + ?,
+                    pages = pages + 1, finished = ?, updated = ?, error = NULL WHERE state = 'leased' AND id = ? AND owner = ?''',
+                    (output_bytes, messages, now, now, shard_id, owner))
+        return cursor.rowcount == 1
+
+    def fail(self, shard_id, owner, error, max_attempts=MAX_ATTEMPTS):
+        with self.lock:
+            self.connection.execute('''
+                UPDATE shards SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, owner = NULL, error = ?
+                WHERE id = ? AND owner = ?''', (max_attempts, error, shard_id, owner))
+
+    def retry_failed(self):
+        with self.lock:
+            cursor = self.connection.execute("UPDATE shards SET state = 'pending', attempts = 0 WHERE state = 'failed'")
+        return cursor.rowcount
+
+    def active(self):
+        # Shards another worker is still crawling, which may come back to the queue if that worker dies
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM shards WHERE state = 'leased'").fetchone()[0]
+
+    def get(self, shard_id):
+        with self.lock:
+            cursor = self.connection.execute('SELECT * FROM shards WHERE id = ?', (shard_id,))
+            row = cursor.fetchone()
+        return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def shards(self):
+        with self.lock:
+            cursor = self.connection.execute('SELECT * FROM shards ORDER BY enqueued, id')
+            rows = cursor.fetchall()
+        return [dict(zip([column[0] for column in cursor.description], row)) for row in rows]
+
+def node_mailboxes(mailboxes, node, nodes):
+    # A stable split of the tenant, so each node can keep its own local queue
+    return [(user_id, mailbox) for user_id, mailbox in mailboxes
+            if int(hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:8], 16) % nodes == node]
+
+async def list_mailboxes(graph: Graph):
+    mailboxes, next_link = [], None
+    while True:
+        users = await graph.get_users_page(next_link)
+        # Users without a mail address have no mailbox to crawl
+        mailboxes.extend((user.id, user.mail) for user in users.value or [] if user.mail)
+        next_link = users.odata_next_link
+        if not next_link:
+            return mailboxes
+
+async def crawl_shard(graph: Graph, queue: CrawlQueue, shard, owner, output_dir, page_size, lease_seconds):
+    lost = asyncio.Event()
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not queue.heartbeat(shard['id'], owner, lease_seconds):
+                lost.set()
+                return
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        with open(os.path.join(output_dir, f"{shard['id']}.jsonl"), 'ab') as output:
+            # Drop anything written after the last checkpoint, so a resumed shard writes each page once
+            output.truncate(shard['output_bytes'])
+            next_link = shard['checkpoint']
+            while True:
+                messages = await graph.get_mailbox_page(shard['id'], next_link, page_size)
+                if lost.is_set():
+                    return False
+                records = [email_record(dict(message_metadata(message), mailbox=shard['mailbox']), shard['id']) for message in messages.value or []]
+                output.write(''.join(json.dumps(record, default=str) + '\n' for record in records).encode('utf-8'))
+                output.flush()
+                os.fsync(output.fileno())
+                next_link = messages.odata_next_link
+                if not queue.checkpoint(shard['id'], owner, next_link, len(records), output.tell(), lease_seconds):
+                    return False
+                if not next_link:
+                    return True
+    finally:
+        heartbeat_task.cancel()
+
+async def work(queue_path, output_dir, concurrency, page_size, lease_seconds):
+    # Load settings
+    config = configparser.ConfigParser()
+    config.read(['config.cfg', 'config.dev.cfg'])
+    graph: Graph = Graph(config['azure'])
+    queue = CrawlQueue(queue_path)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def lane(index):
+        # Each lane crawls one mailbox at a time under its own lease
+        lane_owner = f"{owner}:{index}"
+        completed = 0
+        while True:
+            shard = queue.lease(lane_owner, lease_seconds)
+            if shard is None:
+                if not queue.active():
+                    return completed
+                # Wait in case a shard comes back from a worker that died
+                await asyncio.sleep(lease_seconds / 3)
+                continue
+            try:
+                if await crawl_shard(graph, queue, shard, lane_owner, output_dir, page_size, lease_seconds):
+                    completed += 1
+            except Exception as e:
+                queue.fail(shard['id'], lane_owner, str(e))
+                print(f"Error crawling mailbox {shard['mailbox']}: {e}")
+
+    return sum(await asyncio.gather(*[lane(index) for index in range(concurrency)]))
+
+def run_worker(queue_path, output_dir, concurrency, page_size, lease_seconds):
+    return asyncio.run(work(queue_path, output_dir, concurrency, page_size, lease_seconds))
+
+def shard_report(queue: CrawlQueue):
+    now = time.time()
+    shards = []
+    for shard in queue.shards():
+        end = shard['finished'] or shard['updated'] or now
+        elapsed = end - shard['started'] if shard['started'] else 0
+        shards.append({
+            'mailbox': shard['mailbox'], 'state': shard['state'], 'messages': shard['messages'], 'pages': shard['pages'],
+            'attempts': shard['attempts'], 'owner': shard['owner'],
+            'messages_per_second': round(shard['messages'] / elapsed, 1) if elapsed > 0 else None,
+            # Seconds since a crawling shard last checkpointed, or since a waiting shard was queued
+            'lag_seconds': round(now - (shard['updated'] if shard['state'] == 'leased' else shard['enqueued']), 1)
+                           if shard['state'] in ('leased', 'pending') else None,
+            'error': shard['error'],
+        })
+    return shards
+
+def print_report(shards, started=None):
+    states = {}
+    for shard in shards:
+        states[shard['state']] = states.get(shard['state'], 0) + 1
+    messages = sum(shard['messages'] for shard in shards)
+    rate = f", {messages / (time.time() - started):.1f} messages/s" if started else ''
+    print(f"{len(shards)} shards ({', '.join(f'{count} {state}' for state, count in sorted(states.items()))}), {messages} messages{rate}")
+
+    active = [shard for shard in shards if shard['state'] in ('leased', 'failed')]
+    for shard in sorted(active, key=lambda shard: -(shard['lag_seconds'] or 0))[:10]:
+        print(f"  {shard['mailbox']:<40} {shard['state']:<7} {shard['messages']:>7} messages "
+              f"{shard['messages_per_second'] or 0:>7} msg/s  lag {shard['lag_seconds'] or 0:>6} s  {shard['error'] or ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl the message metadata of every mailbox in the tenant')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Worker processes on this node')
+    parser.add_argument('--concurrency', type=int, default=4, help='Mailboxes each worker process crawls at once')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS)
+    parser.add_argument('--node', type=int, default=0, help='Index of this node when several nodes split the tenant')
+    parser.add_argument('--nodes', type=int, default=1, help='Number of nodes splitting the tenant')
+    parser.add_argument('--queue', default=CRAWL_QUEUE_PATH)
+    parser.add_argument('--output-dir', default=CRAWL_OUTPUT_DIR)
+    parser.add_argument('--skip-enqueue', action='store_true', help='Only work on the shards already in the queue')
+    parser.add_argument('--retry-failed', action='store_true', help='Put failed shards back in the queue')
+    parser.add_argument('--status', action='store_true', help='Print the state of the queue and exit')
+    parser.add_argument('--report-interval', type=float, default=10, help='Seconds between progress reports')
+    parser.add_argument('--report', default='mailbox_crawl_report.json', help='Per-shard report written at the end')
+    args = parser.parse_args()
+
+    queue = CrawlQueue(args.queue)
+    if args.status:
+        print_report(shard_report(queue))
+        return
+    if args.retry_failed:
+        print(f"{queue.retry_failed()} failed shards queued again")
+
+    if not args.skip_enqueue:
+        # Load settings
+        config = configparser.ConfigParser()
+        config.read(['config.cfg', 'config.dev.cfg'])
+        mailboxes = node_mailboxes(asyncio.run(list_mailboxes(Graph(config['azure']))), args.node, args.nodes)
+        print(f"Found {len(mailboxes)} mailboxes for node {args.node + 1} of {args.nodes}, {queue.enqueue(mailboxes)} new")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    started = time.time()
+    # Spawned workers open their own Graph client and queue connection
+    with ProcessPoolExecutor(args.processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(run_worker, args.queue, args.output_dir, args.concurrency, args.page_size, args.lease_seconds)
+                   for _ in range(args.processes)]
+        while True:
+            done, pending = wait(futures, timeout=args.report_interval, return_when=FIRST_EXCEPTION)
+            print_report(shard_report(queue), started)
+            if not pending or any(future.exception() for future in done):
+                break
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            # Finished pages are checkpointed, so the next run picks up from there
+            print(f"A worker stopped: {e!r}. Run again with --skip-enqueue to resume the crawl.")
+
+    shards = shard_report(queue)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({'elapsed_seconds': round(time.time() - started, 1), 'shards': shards}, f, indent=2)
+    print(f"Crawl finished in {time.time() - started:.1f} s; records in {args.output_dir}, per-shard report in {args.report}")
+
+if __name__ == "__main__":
+    main()
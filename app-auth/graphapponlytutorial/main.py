@@ -17,7 +17,8 @@ async def main():
 
     graph: Graph = Graph(azure_settings)
 
-    await greet_user(graph)
+    warm_up = start_warm_up(graph)
+    await greet_user(graph, warm_up)
 
     choice = -1
 
@@ -31,9 +32,11 @@ async def main():
         print('5. Extract calendar events')
         print('6. Extract contacts and network')
         print('7. Extract SharePoint usage')
+        print('8. Search content')
 
         try:
-            choice = int(input())
+            # Read the choice in a thread so the warm-up keeps running while the menu is shown
+            choice = int(await asyncio.to_thread(input))
         except ValueError:
             choice = -1
 
@@ -41,9 +44,9 @@ async def main():
             if choice == 0:
                 print('Goodbye...')
             elif choice == 1:
-                await display_access_token(graph)
+                await display_access_token(graph, warm_up)
             elif choice == 2:
-                await list_inbox(graph)
+                await list_inbox(graph, warm_up)
             elif choice == 3:
                 await send_mail(graph)
             elif choice == 4:
@@ -54,6 +57,8 @@ async def main():
                 await extract_contacts_and_network(graph)
             elif choice == 7:
                 await extract_sharepoint_usage(graph)
+            elif choice == 8:
+                await search_content(graph)
             else:
                 print('Invalid choice!\n')
         except ODataError as odata_error:
@@ -61,11 +66,33 @@ async def main():
             if odata_error.error:
                 print(odata_error.error.code, odata_error.error.message)
 
+    for task in warm_up.values():
+        task.cancel()
 # </ProgramSnippet>
 
+# <WarmUpSnippet>
+def start_warm_up(graph: Graph):
+    # Fetch what the menu is likely to need while the user is still reading it
+    return {
+        'user': asyncio.create_task(graph.get_user()),
+        'token': asyncio.create_task(graph.get_app_only_token()),
+        'inbox': asyncio.create_task(graph.get_inbox()),
+    }
+
+async def warmed(warm_up: dict, name: str, fetch):
+    # A warmed-up result is used once; later calls and failed warm-ups fetch fresh data
+    task = warm_up.pop(name, None)
+    if task is not None:
+        try:
+            return await task
+        except Exception:
+            pass
+    return await fetch()
+# </WarmUpSnippet>
+
 # <GreetUserSnippet>
-async def greet_user(graph: Graph):
-    user = await graph.get_user()
+async def greet_user(graph: Graph, warm_up: dict):
+    user = await warmed(warm_up, 'user', graph.get_user)
     if user:
         print('Hello,', user.display_name)
         # For Work/school accounts, email is in mail property
@@ -74,15 +101,15 @@ async def greet_user(graph: Graph):
 # </GreetUserSnippet>
 
 # <DisplayAccessTokenSnippet>
-async def display_access_token(graph: Graph):
-    token = await graph.get_app_only_token()
+async def display_access_token(graph: Graph, warm_up: dict):
+    token = await warmed(warm_up, 'token', graph.get_app_only_token)
     print('App-only token:', token, '\n')
 # </DisplayAccessTokenSnippet>
 
 # <ListInboxSnippet>
-async def list_inbox(graph: Graph):
-    message_page = await graph.get_inbox()
-    if message_page and message_page.value:
+async def list_inbox(graph: Graph, warm_up: dict):
+    message_page = await warmed(warm_up, 'inbox', graph.get_inbox)
+    while message_page and message_page.value:
         # Output each message's details
         for message in message_page.value:
             print('Message:', message.subject)
@@ -97,8 +124,18 @@ async def list_inbox(graph: Graph):
             print('  Received:', message.received_date_time)
 
         # If @odata.nextLink is present
-        more_available = message_page.odata_next_link is not None
-        print('\nMore messages available?', more_available, '\n')
+        if message_page.odata_next_link is None:
+            print('\nNo more messages.\n')
+            break
+
+        # Fetch the next page while the user reads this one
+        next_page = asyncio.create_task(graph.get_inbox_page(message_page.odata_next_link))
+        answer = await asyncio.to_thread(input, '\nShow more messages? (y/N) ')
+        if answer.strip().lower() != 'y':
+            next_page.cancel()
+            print()
+            break
+        message_page = await next_page
 # </ListInboxSnippet>
 
 # <SendMailSnippet>
@@ -130,9 +167,23 @@ async def extract_contacts_and_network(graph: Graph):
 
 # <ExtractSharePointUsageSnippet>
 async def extract_sharepoint_usage(graph: Graph):
-    search_term = input("Enter a search term for SharePoint sites (or leave blank for all): ")
+    search_term = await asyncio.to_thread(input, "Enter a search term for SharePoint sites (or leave blank for all): ")
     await graph.extract_sharepoint_usage(search_term)
 # </ExtractSharePointUsageSnippet>
 
+# <SearchContentSnippet>
+async def search_content(graph: Graph):
+    query = await asyncio.to_thread(input, "Enter a search query: ")
+    results = await graph.search(query, ['message', 'event', 'driveItem', 'listItem'])
+    hits = results['hits']
+    for hit in hits:
+        print(f"{hit['type']}: {hit.get('subject') or hit.get('name') or hit['id']}")
+        if hit.get('summary'):
+            print(f"  {hit['summary']}")
+    for error in results['errors']:
+        print(f"Search of {', '.join(error['entity_types'])} failed: {error['error']}")
+    print(f"\n{len(hits)} results.\n")
+# </SearchContentSnippet>
+
 # Run main
 asyncio.run(main())
\ No newline at end of file
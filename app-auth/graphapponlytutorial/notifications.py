@@ -0,0 +1,143 @@
+# notifications.py
+import os
+import hmac
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from graph import message_metadata
+from records import all_pages, email_record, event_record, sharepoint_item_record
+from subscriptions import SubscriptionManager
+
+# /interact options whose results each kind of change makes stale
+AFFECTED_OPTIONS = {
+    'messages': {2, 4, 8},
+    'events': {5, 8},
+    'list': {7, 8},
+}
+
+def subscription_user(subscription):
+    # Mail and calendar subscriptions are on users/{id}/...
+    return subscription['resource'].split('/')[1]
+
+class NotificationProcessor:
+    def __init__(self, make_graph, store, invalidate, keyword_index_path=None):
+        # make_graph() returns a Graph for the worker's event loop; invalidate(options) drops cached results
+        self.make_graph = make_graph
+        self.store = store
+        self.invalidate = invalidate
+        self.keyword_index_path = keyword_index_path
+        self.keyword_index = None
+        # One worker, so changes are applied in the order they arrive
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def validate(self, notification):
+        # Only notifications for our own subscriptions, carrying that subscription's secret, are trusted
+        subscription = self.store.get(notification.get('subscriptionId'))
+        if subscription is None:
+            return None
+        if not hmac.compare_digest(notification.get('clientState') or '', subscription['client_state']):
+            return None
+        return subscription
+
+    def accept(self, notifications):
+        # Graph expects a response within a few seconds, so only validation and cache invalidation happen here
+        accepted = []
+        for notification in notifications:
+            subscription = self.validate(notification)
+            if subscription is None:
+                self.count('rejected')
+                continue
+            accepted.append((subscription, notification))
+
+        if accepted:
+            self.count('accepted', len(accepted))
+            self.invalidate(set().union(*(AFFECTED_OPTIONS[subscription['kind']] for subscription, _ in accepted)))
+            self.executor.submit(asyncio.run, self.apply_all(accepted))
+        return len(accepted)
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def summary(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def get_keyword_index(self):
+        # Only an index built by build_index.py is kept up to date
+        if self.keyword_index is None and self.keyword_index_path and os.path.exists(self.keyword_index_path):
+            from bm25_index import BM25Index
+            self.keyword_index = BM25Index(self.keyword_index_path)
+        return self.keyword_index
+
+    async def apply_all(self, accepted):
+        graph = self.make_graph()
+        for subscription, notification in accepted:
+            try:
+                if notification.get('lifecycleEvent'):
+                    await self.apply_lifecycle(graph, subscription, notification['lifecycleEvent'])
+                else:
+                    await self.apply(graph, subscription, notification)
+                self.count('applied')
+            except Exception as e:
+                self.count('failed')
+                print(f"Error applying notification for {subscription['resource']}: {e}")
+
+    async def apply(self, graph, subscription, notification):
+        index = self.get_keyword_index()
+        if index is None:
+            return
+        change_type = notification.get('changeType')
+        resource_id = (notification.get('resourceData') or {}).get('id')
+
+        if subscription['kind'] == 'messages':
+            user_id = subscription_user(subscription)
+            if change_type == 'deleted':
+                index.delete([f"email:{user_id}/{resource_id}"])
+            else:
+                index.add([email_record(await graph.get_email_metadata(resource_id, user_id), user_id)])
+        elif subscription['kind'] == 'events':
+            user_id = subscription_user(subscription)
+            if change_type == 'deleted':
+                index.delete([f"event:{user_id}/{resource_id}"])
+            else:
+                index.add([event_record(await graph.get_calendar_event(resource_id, user_id), user_id)])
+        elif subscription['kind'] == 'list':
+            await self.resync_list(graph, index, subscription)
+        self.count('index_updates')
+
+    async def resync_list(self, graph, index, subscription):
+        # List notifications do not say which item changed, so the list is re-read and diffed
+        items = await graph.get_list_items(subscription['site_id'], subscription['list_id'])
+        index.sync([sharepoint_item_record(item) for item in items],
+                   prefix=f"sharepoint_item:{subscription['site_id']}/{subscription['list_id']}/")
+
+    async def apply_lifecycle(self, graph, subscription, event):
+        if event == 'reauthorizationRequired':
+            await SubscriptionManager(graph, self.store).renew(subscription)
+        elif event == 'subscriptionRemoved':
+            # The next run of subscriptions.py creates a replacement
+            self.store.delete(subscription['id'])
+        elif event == 'missed':
+            # Some notifications were dropped, so re-read every page of the subscribed mailbox or list;
+            # only that mailbox's records are replaced
+            index = self.get_keyword_index()
+            if index is None:
+                return
+            if subscription['kind'] == 'messages':
+                user_id = subscription_user(subscription)
+                messages = await all_pages(graph.get_mailbox_page, user_id)
+                index.sync([email_record(message_metadata(message), user_id) for message in messages], prefix=f"email:{user_id}/")
+            elif subscription['kind'] == 'events':
+                user_id = subscription_user(subscription)
+                events = await all_pages(graph.get_events_page, user_id)
+                index.sync([event_record(event, user_id) for event in events], prefix=f"event:{user_id}/")
+            else:
+                await self.resync_list(graph, index, subscription)
+        self.count(f"lifecycle_{event}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -1,297 +1,201 @@
 import os
+import sys
 import json
-import requests
-from google import genai
-from google.genai import types
-from llama_index.core.base.llms.types import ChatMessage, MessageRole
-from llama_index.core.prompts.base import ChatPromptTemplate
-from llama_index.core import Settings
-from llama_index.llms.gemini import Gemini
-from dotenv import load_dotenv, find_dotenv
-
-# Load environment variables
-_ = load_dotenv(find_dotenv())  # read local .env file
-
-# Suppress logging warnings
-os.environ["GRPC_VERBOSITY"] = "ERROR"
-os.environ["GLOG_minloglevel"] = "2"
-
-# Ensure the API key is set correctly
-GOOGLE_API_KEY = os.getenv('GEMINI_API_KEY')
-os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
-os.environ["GEMINI_API_KEY"] = GOOGLE_API_KEY
-
-# Create a client
-client = genai.Client(api_key=os.environ['GEMINI_API_KEY'])
-
-# Initialize the Gemini models
-gemini_1_5_flash = 'gemini-1.5-flash-8b'
-Settings.llm = Gemini(model='models/gemini-2.0-flash-exp')
-
-# Define the base URL for the Flask REST API
-BASE_URL = "http://127.0.0.1:5000"
-
-# Define the function declarations for the REST API interactions
-display_access_token_declaration = types.FunctionDeclaration(
-    name="display_access_token",
-    description="Display the access token for the Microsoft Graph API",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "dummy": {
-                "type": "STRING",
-                "description": "Dummy parameter to satisfy the API requirements",
-            },
-        },
-        "required": [],
-    },
-)
-
-list_inbox_declaration = types.FunctionDeclaration(
-    name="list_inbox",
-    description="List the emails in the inbox",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "dummy": {
-                "type": "STRING",
-                "description": "Dummy parameter to satisfy the API requirements",
-            },
-        },
-        "required": [],
-    },
-)
-
-send_mail_declaration = types.FunctionDeclaration(
-    name="send_mail",
-    description="Send an email to the signed-in user",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "dummy": {
-                "type": "STRING",
-                "description": "Dummy parameter to satisfy the API requirements",
-            },
-        },
-        "required": [],
-    },
-)
-
-extract_email_metadata_declaration = types.FunctionDeclaration(
-    name="extract_email_metadata",
-    description="Extract metadata from emails",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "dummy": {
-                "type": "STRING",
-                "description": "Dummy parameter to satisfy the API requirements",
-            },
-        },
-        "required": [],
-    },
-)
-
-extract_calendar_events_declaration = types.FunctionDeclaration(
-    name="extract_calendar_events",
-    description="Extract calendar events",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "dummy": {
-                "type": "STRING",
-                "description": "Dummy parameter to satisfy the API requirements",
-            },
-        },
-        "required": [],
-    },
-)
-
-extract_contacts_declaration = types.FunctionDeclaration(
-    name="extract_contacts",
-    description="Extract contacts and network information",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "dummy": {
-                "type": "STRING",
-                "description": "Dummy parameter to satisfy the API requirements",
-            },
-        },
-        "required": [],
-    },
-)
-
-extract_sharepoint_usage_declaration = types.FunctionDeclaration(
-    name="extract_sharepoint_usage",
-    description="Extract SharePoint usage information",
-    parameters={
-        "type": "OBJECT",
-        "properties": {
-            "search_term": {
-                "type": "STRING",
-                "description": "Search term to filter SharePoint sites",
-            },
-        },
-        "required": ["search_term"],
-    },
-)
-
-# Define the tool
-api_tool = types.Tool(
-    function_declarations=[
-        display_access_token_declaration,
-        list_inbox_declaration,
-        send_mail_declaration,
-        extract_email_metadata_declaration,
-        extract_calendar_events_declaration,
-        extract_contacts_declaration,
-        extract_sharepoint_usage_declaration,
-    ],
-)
-
-# Define the functions to interact with the REST API
-def display_access_token():
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 1}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to display access token: {response.status_code} - {response.text}")
-
-def list_inbox():
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 2}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to list inbox: {response.status_code} - {response.text}")
-
-def send_mail():
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 3}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to send mail: {response.status_code} - {response.text}")
-
-def extract_email_metadata():
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 4}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to extract email metadata: {response.status_code} - {response.text}")
-
-def extract_calendar_events():
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 5}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to extract calendar events: {response.status_code} - {response.text}")
-
-def extract_contacts():
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 6}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to extract contacts: {response.status_code} - {response.text}")
-
-def extract_sharepoint_usage(search_term):
-    url = f"{BASE_URL}/interact"
-    payload = {"option": 7, "search_term": search_term}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        raise Exception(f"Failed to extract SharePoint usage: {response.status_code} - {response.text}")
-
-# Define the functions dictionary
-functions = {
-    "display_access_token": display_access_token,
-    "list_inbox": list_inbox,
-    "send_mail": send_mail,
-    "extract_email_metadata": extract_email_metadata,
-    "extract_calendar_events": extract_calendar_events,
-    "extract_contacts": extract_contacts,
-    "extract_sharepoint_usage": extract_sharepoint_usage,
-}
-
-# text qa prompt
-TEXT_QA_SYSTEM_PROMPT = ChatMessage(
-    content=(
-        "You are an expert Q&A system that is trusted around the world.\n"
-        "Always answer the query using the provided context information, "
-        "and not prior knowledge.\n"
-        "Some rules to follow:\n"
-        "1. Never directly reference the given context in your answer.\n"
-        "2. Avoid statements like 'Based on the context, ...' or "
-        "'The context information ...' or anything along "
-        "those lines."
-    ),
-    role=MessageRole.SYSTEM,
-)
-
-TEXT_QA_PROMPT_TMPL_MSGS = [
-    TEXT_QA_SYSTEM_PROMPT,
-    ChatMessage(
-        content=(
-            "Context information is below.\n"
-            "---------------------\n"
-            "{context_str}\n"
-            "---------------------\n"
-            "Given the context information and not prior knowledge, "
-            "answer the query.\n"
-            "Query: {query_str}\n"
-            "Answer: "
-        ),
-        role=MessageRole.USER,
-    ),
-]
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from tools import TOOLS_BY_NAME, call_tool
+from speculation import SpeculativePrefetcher
+from rag_core import (determine_function_calls, call_functions, get_retrieval_index, retrieve_context,
+                      generate_response, generate_response_stream)
+
+def print_response(query_str, context_str):
+    timings = {}
+    for token in generate_response_stream(query_str, context_str, timings):
+        print(token, end='', flush=True)
+    source = 'answer cache' if timings['cached'] else f"generated by {timings['model']}"
+    print(f"\n\n(first token after {timings['time_to_first_token']:.2f}s, {source} in {timings['generation_time']:.2f}s)")
+
+def get_prefetcher():
+    if os.getenv('SPECULATIVE_PREFETCH', '0') != '1':
+        return None
+    return SpeculativePrefetcher(call_tool, state_path=os.getenv('SPECULATION_STATE_PATH', 'speculation_state.json'))
+
+def read_prompts(path):
+    # One prompt per line, either plain text or a JSON object with "prompt" and an optional "id"
+    f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    prompts = {}
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                prompt, prompt_id = item['prompt'], item.get('id')
+            else:
+                prompt, prompt_id = line, None
+            # Identical prompts share an id, so they are answered once
+            prompt_id = prompt_id or hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:16]
+            prompts.setdefault(prompt_id, prompt)
+    return prompts
+
+def read_completed(output_path):
+    completed = set()
+    if os.path.exists(output_path):
+        with open(output_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A partially written line from an interrupted run
+                    continue
+                if result.get('status') == 'ok':
+                    completed.add(result['id'])
+    return completed
+
+def run_batch(prompts, output_path, routing_limit=4, tool_limit=4, generation_limit=2, prefetcher=None):
+    completed = read_completed(output_path)
+    pending = [(prompt_id, prompt) for prompt_id, prompt in prompts.items() if prompt_id not in completed]
+    print(f"{len(prompts)} prompts, {len(prompts) - len(pending)} already answered, {len(pending)} to run")
+
+    routing_slots = threading.BoundedSemaphore(routing_limit)
+    tool_slots = threading.BoundedSemaphore(tool_limit)
+    generation_slots = threading.BoundedSemaphore(generation_limit)
+    write_lock = threading.Lock()
+    tool_lock = threading.Lock()
+    tool_futures = {}
+
+    def call_once(name, args):
+        # Identical tool calls within the batch are executed once and shared
+        key = (name, json.dumps(dict(args), sort_keys=True))
+        with tool_lock:
+            future = tool_futures.get(key)
+            owner = future is None
+            if owner:
+                future = tool_futures[key] = Future()
+        if owner:
+            try:
+                with tool_slots:
+                    future.set_result(call_tool(name, args))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def run_one(prompt_id, prompt):
+        result = {'id': prompt_id, 'prompt': prompt, 'timings': {}}
+        timings = result['timings']
+        start = time.perf_counter()
+        try:
+            stage_start = time.perf_counter()
+            speculative = prefetcher.start(prompt, call=call_once) if prefetcher else {}
+            try:
+                with routing_slots:
+                    function_calls = determine_function_calls(prompt, result.setdefault('routing', {}))
+            except Exception:
+                if prefetcher:
+                    prefetcher.cancel(speculative)
+                raise
+            # Resolve the predictions whichever way the prompt is answered, so the metrics count every one
+            call = prefetcher.resolve(function_calls, speculative, fallback=call_once) if prefetcher else call_once
+            timings['routing'] = time.perf_counter() - stage_start
+            function_names = [name for name, _ in function_calls]
+            result['function_calls'] = [{'function_name': name, 'args': dict(args)} for name, args in function_calls]
+
+            stage_start = time.perf_counter()
+            if any(name in TOOLS_BY_NAME for name in function_names):
+                context = call_functions(function_calls, call=call)
+                has_data = bool(context)
+                timings['tools'] = time.perf_counter() - stage_start
+            elif get_retrieval_index() is not None:
+                # No tool fits the prompt, so answer from the top-k indexed records
+                context = retrieve_context(prompt)
+                has_data = bool(context['records'])
+                timings['retrieval'] = time.perf_counter() - stage_start
+            else:
+                context, has_data = None, False
+                result['answer'] = "The query cannot be served at this time."
+
+            if has_data:
+                stage_start = time.perf_counter()
+                with generation_slots:
+                    result['answer'] = generate_response(prompt, context)
+                timings['generation'] = time.perf_counter() - stage_start
+            elif context is not None:
+                result['answer'] = "No data found for the given query."
+            result['status'] = 'ok'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        timings['total'] = time.perf_counter() - start
 
-CHAT_TEXT_QA_PROMPT = ChatPromptTemplate(message_templates=TEXT_QA_PROMPT_TMPL_MSGS)
+        with write_lock, open(output_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, default=str) + '\n')
+        print(f"[{result['status']}] {prompt_id} in {timings['total']:.2f}s")
+        return result
 
-def determine_function_call(prompt):
-    response = client.models.generate_content(
-        model=gemini_1_5_flash,
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            tools=[api_tool],
-            temperature=0,
-        ),
-)
-    if response.candidates and response.candidates[0].content.parts[0].function_call:
-        function_call = response.candidates[0].content.parts[0].function_call
-        return function_call.name, function_call.args
-    return None, None
+    with ThreadPoolExecutor(max_workers=routing_limit + tool_limit + generation_limit) as executor:
+        results = list(executor.map(lambda item: run_one(*item), pending))
 
-def generate_response(query_str, context_str):
-    full_text = CHAT_TEXT_QA_PROMPT.format(context_str=json.dumps(context_str), query_str=query_str)
-    resp = Settings.llm.complete(full_text)
-    return resp.text
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    print(f"Finished {len(results)} prompts, {failed} failed. Re-run the same command to retry failures.")
+    if prefetcher:
+        print(f"Speculative prefetch: {json.dumps(prefetcher.summary())}")
+    return results
 
 def main():
+    parser = argparse.ArgumentParser(description='Answer questions about Microsoft Graph data')
+    parser.add_argument('--batch', help='Read prompts from this file ("-" for stdin) instead of asking for one')
+    parser.add_argument('--output', default='rag_results.jsonl', help='JSONL file for batch results')
+    parser.add_argument('--routing-concurrency', type=int, default=4)
+    parser.add_argument('--tool-concurrency', type=int, default=4)
+    parser.add_argument('--generation-concurrency', type=int, default=2)
+    args = parser.parse_args()
+
+    prefetcher = get_prefetcher()
+    if args.batch:
+        run_batch(read_prompts(args.batch), args.output,
+                  routing_limit=args.routing_concurrency,
+                  tool_limit=args.tool_concurrency,
+                  generation_limit=args.generation_concurrency,
+                  prefetcher=prefetcher)
+        if prefetcher:
+            prefetcher.shutdown()
+        return
+
     prompt = input("Enter a prompt: ")
-    function_name, args = determine_function_call(prompt)
-    
-    if function_name and function_name in functions:
+    speculative = prefetcher.start(prompt) if prefetcher else {}
+    routing_stats = {}
+    try:
+        function_calls = determine_function_calls(prompt, routing_stats)
+    except Exception:
+        if prefetcher:
+            prefetcher.cancel(speculative)
+            prefetcher.shutdown()
+        raise
+    # Resolve the predictions whichever way the prompt is answered, so the metrics count every one
+    call = prefetcher.resolve(function_calls, speculative) if prefetcher else call_tool
+    function_names = [name for name, _ in function_calls]
+    print(f"(routed with {len(routing_stats['tools_sent'])} tools, {routing_stats['prompt_tokens']} prompt tokens)")
+
+    if any(name in TOOLS_BY_NAME for name in function_names):
         try:
-            if function_name == "extract_sharepoint_usage":
-                result = functions[function_name](args["search_term"])
-            else:
-                result = functions[function_name]()
-            
+            result = call_functions(function_calls, call=call)
+
             if result:
-                response = generate_response(prompt, result)
-                print(response)
+                print_response(prompt, result)
+            else:
+                print("No data found for the given query.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+    elif get_retrieval_index() is not None:
+        # No tool fits the prompt, so answer from the top-k indexed records
+        try:
+            result = retrieve_context(prompt)
+            if result['records']:
+                print_response(prompt, result)
             else:
                 print("No data found for the given query.")
         except Exception as e:
@@ -299,5 +203,9 @@ def main():
     else:
         print("The query cannot be served at this time.")
 
+    if prefetcher:
+        prefetcher.shutdown()
+        print(f"Speculative prefetch: {json.dumps(prefetcher.summary())}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
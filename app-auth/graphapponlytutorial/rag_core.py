@@ -0,0 +1,260 @@
+# rag_core.py
+import os
+import json
+import time
+import itertools
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+from answer_cache import AnswerCache
+from llm_metrics import track_llm_call, call_with_retries, record_usage, llama_usage
+from cascade import ModelCascade, GENERATION_CASCADE, CASCADE_CHECK, CASCADE_SCHEMA
+from tools import TOOLS_BY_NAME, call_tool, build_tool, select_tools
+
+# Routing, retrieval and generation shared by rag.py and rag_gui.py.
+# google.genai, llama_index and numpy take seconds to import, so they are
+# imported on first use instead of at startup (see tests/bench_startup.py)
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Suppress logging warnings
+os.environ["GRPC_VERBOSITY"] = "ERROR"
+os.environ["GLOG_minloglevel"] = "2"
+
+# Ensure the API key is set correctly
+GOOGLE_API_KEY = os.getenv('GEMINI_API_KEY')
+os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+os.environ["GEMINI_API_KEY"] = GOOGLE_API_KEY
+
+# Create a client
+@lru_cache(maxsize=None)
+def get_client():
+    from google import genai
+    return genai.Client(api_key=os.environ['GEMINI_API_KEY'])
+
+# With the json check, answers are asked for as JSON and unwrapped by the cascade
+JSON_ANSWERS = bool(GENERATION_CASCADE) and CASCADE_CHECK == 'json'
+
+# Initialize the Gemini models
+gemini_1_5_flash = 'gemini-1.5-flash-8b'
+# With a cascade configured, its last model is the one answers are streamed from
+generation_model = GENERATION_CASCADE[-1] if GENERATION_CASCADE else 'models/gemini-2.0-flash-exp'
+
+@lru_cache(maxsize=None)
+def get_model_llm(model, temperature=None):
+    from llama_index.llms.gemini import Gemini
+    # None keeps the model's default temperature
+    return Gemini(model=model) if temperature is None else Gemini(model=model, temperature=temperature)
+
+def get_llm():
+    return get_model_llm(generation_model)
+
+@lru_cache(maxsize=None)
+def get_embed_model():
+    from llama_index.embeddings.gemini import GeminiEmbedding
+    from vector_index import EMBEDDING_MODEL
+    return GeminiEmbedding(model_name=EMBEDDING_MODEL)
+
+# Load the retrieval index built by build_index.py, if there is one
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'vector')
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '20'))
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'vector_index')
+KEYWORD_INDEX_PATH = os.getenv('KEYWORD_INDEX_PATH', 'keyword_index.db')
+
+@lru_cache(maxsize=None)
+def get_retrieval_index():
+    if RETRIEVAL_BACKEND == 'bm25':
+        from bm25_index import BM25Index
+        return BM25Index(KEYWORD_INDEX_PATH) if os.path.exists(KEYWORD_INDEX_PATH) else None
+    from vector_index import VectorIndex
+    return VectorIndex.load(VECTOR_INDEX_DIR) if VectorIndex.exists(VECTOR_INDEX_DIR) else None
+
+# Cache generated answers by query and context fingerprint; the database is opened on first use,
+# so --help and imports do not create it
+@lru_cache(maxsize=None)
+def get_answer_cache():
+    return AnswerCache(
+        os.getenv('ANSWER_CACHE_PATH', 'answer_cache.db'),
+        ttl=float(os.getenv('ANSWER_CACHE_TTL', '3600')),
+        max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000')),
+    )
+
+# text qa prompt
+@lru_cache(maxsize=None)
+def get_qa_prompt():
+    from llama_index.core.base.llms.types import ChatMessage, MessageRole
+    from llama_index.core.prompts.base import ChatPromptTemplate
+
+    TEXT_QA_SYSTEM_PROMPT = ChatMessage(
+        content=(
+            "You are an expert Q&A system that is trusted around the world.\n"
+            "Always answer the query using the provided context information, "
+            "and not prior knowledge.\n"
+            "Some rules to follow:\n"
+            "1. Never directly reference the given context in your answer.\n"
+            "2. Avoid statements like 'Based on the context, ...' or "
+            "'The context information ...' or anything along "
+            "those lines."
+        ),
+        role=MessageRole.SYSTEM,
+    )
+
+    TEXT_QA_PROMPT_TMPL_MSGS = [
+        TEXT_QA_SYSTEM_PROMPT,
+        ChatMessage(
+            content=(
+                "Context information is below.\n"
+                "---------------------\n"
+                "{context_str}\n"
+                "---------------------\n"
+                "Given the context information and not prior knowledge, "
+                "answer the query.\n"
+                + ("Answer with only a JSON value that matches this JSON Schema: {schema_str}\n"
+                   if JSON_ANSWERS else "") +
+                "Query: {query_str}\n"
+                "Answer: "
+            ),
+            role=MessageRole.USER,
+        ),
+    ]
+
+    return ChatPromptTemplate(message_templates=TEXT_QA_PROMPT_TMPL_MSGS)
+
+def format_qa_prompt(query_str, context_str):
+    # schema_str is only used by the prompt for the json check
+    return get_qa_prompt().format(context_str=json.dumps(context_str), query_str=query_str,
+                                  schema_str=json.dumps(CASCADE_SCHEMA))
+
+def determine_function_calls(prompt, stats=None):
+    from google.genai import types
+
+    # Only send the tools that look relevant to this prompt; search_index only when there is an index
+    stats = stats if stats is not None else {}
+    tool_names = select_tools(prompt, local=get_retrieval_index() is not None)
+    with track_llm_call('routing', gemini_1_5_flash) as call:
+        response = call_with_retries(lambda: get_client().models.generate_content(
+            model=gemini_1_5_flash,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                tools=[build_tool(tool_names)],
+                temperature=0,
+            ),
+        ), call)
+        record_usage(call, response.usage_metadata)
+    stats['tools_sent'] = list(tool_names)
+    stats['prompt_tokens'] = call.prompt_tokens
+
+    # Gemini may return several function-call parts for one prompt
+    function_calls = []
+    if response.candidates and response.candidates[0].content.parts:
+        for part in response.candidates[0].content.parts:
+            if part.function_call and (part.function_call.name, part.function_call.args or {}) not in function_calls:
+                function_calls.append((part.function_call.name, part.function_call.args or {}))
+    return function_calls
+
+def call_local_tool(name, args):
+    # search_index answers from the index built by build_index.py instead of /interact
+    if name == 'search_index':
+        return retrieve_context(args.get('query') or '')['records']
+    raise Exception(f"Unknown local tool {name}")
+
+def call_functions(function_calls, call=call_tool):
+    # Run every call concurrently so the latency is that of the slowest call
+    function_calls = [(name, args) for name, args in function_calls if name in TOOLS_BY_NAME]
+    with ThreadPoolExecutor(max_workers=max(len(function_calls), 1)) as executor:
+        futures = [(name, args, executor.submit(call_local_tool if TOOLS_BY_NAME[name].get('local') else call, name, args))
+                   for name, args in function_calls]
+
+    # Merge the results into one context
+    results = []
+    for name, args, future in futures:
+        try:
+            results.append({"function_name": name, "args": dict(args), "result": future.result()})
+        except Exception as e:
+            results.append({"function_name": name, "args": dict(args), "error": str(e)})
+    if results and all("error" in result for result in results):
+        raise Exception("; ".join(result["error"] for result in results))
+    return [result for result in results if result.get("result") or "error" in result]
+
+def retrieve_context(query_str, top_k=RETRIEVAL_TOP_K):
+    if RETRIEVAL_BACKEND == 'bm25':
+        hits = get_retrieval_index().search(query_str, top_k)
+    else:
+        from vector_index import EMBEDDING_MODEL
+        with track_llm_call('embedding', EMBEDDING_MODEL) as call:
+            query_vector = call_with_retries(lambda: get_embed_model().get_query_embedding(query_str), call)
+            record_usage(call, None, prompt_text=query_str)
+        hits = get_retrieval_index().search(query_vector, top_k)
+    return {'records': [dict(record['data'], source=record['source'], score=round(score, 4)) for score, record in hits]}
+
+def complete_with_model(model, prompt_text, temperature=None):
+    with track_llm_call('generation', model) as call:
+        resp = call_with_retries(lambda: get_model_llm(model, temperature).complete(prompt_text), call)
+        record_usage(call, llama_usage(resp), prompt_text=prompt_text, response_text=resp.text)
+    return resp.text
+
+@lru_cache(maxsize=None)
+def get_cascade():
+    # Try cheaper models first and escalate when their answer fails the check
+    return ModelCascade(GENERATION_CASCADE, complete_with_model, CASCADE_CHECK, CASCADE_SCHEMA) if GENERATION_CASCADE else None
+
+def generate_response(query_str, context_str):
+    cached = get_answer_cache().get(query_str, context_str)
+    if cached is not None:
+        return cached
+    full_text = format_qa_prompt(query_str, context_str)
+    cascade = get_cascade()
+    if cascade:
+        answer = cascade.generate(full_text, query_str)['answer']
+    else:
+        answer = complete_with_model(generation_model, full_text)
+    get_answer_cache().set(query_str, context_str, answer)
+    return answer
+
+def start_stream(full_text):
+    # The stream is lazy and only sends the request when it is read, so the first chunk is pulled here;
+    # a failure before it is retried, one after it reaches the caller part way through the answer
+    stream = get_llm().stream_complete(full_text)
+    return next(stream, None), stream
+
+def generate_response_stream(query_str, context_str, timings=None):
+    # Yield the answer token by token, recording time-to-first-token and total time
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    cached = get_answer_cache().get(query_str, context_str)
+    timings['cached'] = cached is not None
+    if cached is not None:
+        timings['time_to_first_token'] = timings['generation_time'] = time.perf_counter() - start
+        yield cached
+        return
+
+    full_text = format_qa_prompt(query_str, context_str)
+    cascade = get_cascade()
+    if cascade:
+        # Cheaper models answer in full first; only an escalation is streamed from the last model.
+        # A JSON answer is only usable once complete, so then the last model answers in full too
+        outcome = cascade.generate(full_text, query_str, skip_last=not JSON_ANSWERS)
+        timings['escalations'] = len(outcome['escalations'])
+        if outcome['answer'] is not None:
+            timings['model'] = outcome['model']
+            timings['time_to_first_token'] = timings['generation_time'] = time.perf_counter() - start
+            get_answer_cache().set(query_str, context_str, outcome['answer'])
+            yield outcome['answer']
+            return
+
+    timings['model'] = generation_model
+    tokens = []
+    with track_llm_call('generation', generation_model) as call:
+        first, stream = call_with_retries(lambda: start_stream(full_text), call)
+        chunk = None
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            if 'time_to_first_token' not in timings:
+                timings['time_to_first_token'] = time.perf_counter() - start
+                call.time_to_first_token_ms = timings['time_to_first_token'] * 1000
+            tokens.append(chunk.delta or '')
+            yield chunk.delta or ''
+        record_usage(call, llama_usage(chunk), prompt_text=full_text, response_text=''.join(tokens))
+    timings.setdefault('time_to_first_token', time.perf_counter() - start)
+    timings['generation_time'] = time.perf_counter() - start
+    get_answer_cache().set(query_str, context_str, ''.join(tokens))
@@ -0,0 +1,105 @@
+# records.py
+import os
+import glob
+import hashlib
+import json
+from graph import Graph, message_metadata, list_item
+
+# Define the record sources produced from the Graph extract methods
+SOURCES = ['email', 'event', 'contact', 'sharepoint_item', 'document']
+
+def make_record(source, data, text, record_id=None):
+    if not record_id:
+        # Fall back to a content hash when Graph did not return an id
+        digest = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        record_id = digest[:16]
+    return {
+        'id': f"{source}:{record_id}",
+        'source': source,
+        'text': text,
+        'data': data
+    }
+
+def email_record(metadata, user_id):
+    # Ids are scoped by mailbox, so one mailbox's records can be re-synced on their own
+    text = (
+        f"Email from {metadata['from']} to {', '.join(metadata['to_recipients'])}. "
+        f"Subject: {metadata['subject']}. Received: {metadata['received_date_time']}. "
+        f"Importance: {metadata['importance']}. Categories: {', '.join(metadata['categories'])}."
+    )
+    return make_record('email', metadata, text, f"{user_id}/{metadata.get('id')}")
+
+def event_record(event, user_id):
+    data = {
+        'subject': event.subject,
+        'start': str(event.start.date_time) if event.start else 'N/A',
+        'end': str(event.end.date_time) if event.end else 'N/A',
+        'location': event.location.display_name if event.location else 'N/A'
+    }
+    text = f"Calendar event: {data['subject']} at {data['location']} from {data['start']} to {data['end']}."
+    return make_record('event', data, text, f"{user_id}/{event.id}")
+
+def contact_record(contact):
+    data = {
+        'display_name': contact.display_name,
+        'email': contact.email_addresses[0].address if contact.email_addresses else 'N/A'
+    }
+    text = f"Contact: {data['display_name']} <{data['email']}>."
+    return make_record('contact', data, text, contact.id)
+
+def sharepoint_item_record(item):
+    fields = '; '.join(f"{key}: {value}" for key, value in item['fields'].items() if not key.startswith('@'))
+    text = f"SharePoint item in list {item['list']} on site {item['site']}. {fields}"
+    return make_record('sharepoint_item', item, text, f"{item['site_id']}/{item['list_id']}/{item['id']}")
+
+def document_record(document, index, text):
+    # One chunk of a file's text; document describes the file it came from
+    data = dict(document, chunk=index)
+    return make_record('document', data, f"From {document['name']} ({document['source']}): {text}",
+                       f"{document['drive_id']}/{document['item_id']}#{index}")
+
+async def all_pages(get_page, *args):
+    # Follow @odata.nextLink until the last page
+    values, next_link = [], None
+    while True:
+        page = await get_page(*args, next_link)
+        values.extend(page.value or [])
+        next_link = page.odata_next_link
+        if not next_link:
+            return values
+
+async def collect_records(graph: Graph, search_term=None):
+    # Every page of the configured user's mail, events and contacts and of the SharePoint list items
+    records = []
+
+    messages = await all_pages(graph.get_mailbox_page, graph.user_id)
+    records.extend(email_record(message_metadata(message), graph.user_id) for message in messages)
+
+    events = await all_pages(graph.get_events_page, graph.user_id)
+    records.extend(event_record(event, graph.user_id) for event in events)
+
+    contacts = await all_pages(graph.get_contacts_page, graph.user_id)
+    records.extend(contact_record(contact) for contact in contacts)
+
+    for site in await all_pages(graph.get_sites_page, search_term):
+        for lst in await all_pages(graph.get_lists_page, site.id):
+            items = await all_pages(graph.get_list_items_page, site.id, lst.id)
+            records.extend(sharepoint_item_record(list_item(item, site, lst)) for item in items)
+
+    return records
+
+def read_records(paths):
+    # Records written by mailbox_crawl.py, sharepoint_crawl.py and document_pipeline.py:
+    # JSONL files, or folders of them
+    records = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A partially written line from a crawl that is still running
+                        continue
+    return records
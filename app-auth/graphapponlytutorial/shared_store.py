@@ -0,0 +1,284 @@
+# shared_store.py
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+# Define the store shared by all worker processes: memory:// (per process), sqlite:///shared_store.db,
+# shm://graphapp (SQLite in shared memory) or redis://127.0.0.1:6379/0
+SHARED_STORE_URL = os.getenv('SHARED_STORE_URL', 'memory://')
+
+# How long a single-flight lock is held at most, and how often waiters check for the result
+LOCK_TTL = 30.0
+LOCK_POLL_INTERVAL = 0.02
+
+class MemoryStore:
+    # Process-local store; every worker keeps its own copy
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _live(self, key, now):
+        entry = self.values.get(key)
+        if entry and entry[1] is not None and entry[1] <= now:
+            del self.values[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.values[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self.lock:
+            self.values.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self.lock:
+            for key in [key for key in self.values if key.startswith(prefix)]:
+                del self.values[key]
+
+    def acquire(self, key, ttl=LOCK_TTL):
+        token = uuid.uuid4().hex
+        with self.lock:
+            if self._live(key, time.time()):
+                return None
+            self.values[key] = (token, time.time() + ttl)
+            return token
+
+    def release(self, key, token):
+        with self.lock:
+            if self.values.get(key, (None,))[0] == token:
+                del self.values[key]
+
+class SQLiteStore:
+    path: str
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # Connections must not cross a fork, so each worker process opens its own
+        if self._connection is None or self._pid != os.getpid():
+            created = not os.path.exists(self.path)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.executescript('''
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires REAL
+                );
+            ''')
+            if created:
+                # The store holds access tokens, so only the owner may read it
+                os.chmod(self.path, 0o600)
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute('SELECT value, expires FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?)', (key, value, time.time() + ttl if ttl else None))
+
+    def delete(self, key):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def delete_prefix(self, prefix):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM kv WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+
+    def acquire(self, key, ttl=LOCK_TTL):
+        # One atomic upsert: it only takes over an existing lock once that lock has expired
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute('''
+                INSERT INTO kv VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires
+                WHERE kv.expires IS NOT NULL AND kv.expires <= ?''', (key, token, now + ttl, now))
+        return token if cursor.rowcount == 1 else None
+
+    def release(self, key, token):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM kv WHERE key = ? AND value = ?', (key, token))
+
+class RESPError(Exception):
+    pass
+
+class RedisStore:
+    # Minimal client for the Redis protocol (RESP2), enough for the commands this store needs
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._socket = None
+        self._reader = None
+        self._pid = None
+
+    def connect(self):
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile('rb')
+        self._pid = os.getpid()
+        if self.db:
+            self._send('SELECT', self.db)
+
+    def _send(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._socket.sendall(b''.join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by the server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RESPError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)[:-2]
+            return data.decode('utf-8')
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RESPError(f"Unexpected reply: {line!r}")
+
+    def command(self, *args):
+        with self.lock:
+            # Reconnect after a fork or a dropped connection, and retry once
+            for attempt in range(2):
+                try:
+                    if self._socket is None or self._pid != os.getpid():
+                        self.connect()
+                    return self._send(*args)
+                except (ConnectionError, OSError):
+                    self._socket = None
+                    if attempt:
+                        raise
+
+    def get(self, key):
+        return self.command('GET', key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command('SET', key, value, 'PX', int(ttl * 1000))
+        else:
+            self.command('SET', key, value)
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def delete_prefix(self, prefix):
+        pattern = ''.join('\\' + char if char in '*?[]\\' else char for char in prefix) + '*'
+        cursor = '0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', pattern, 'COUNT', 500)
+            if keys:
+                self.command('DEL', *keys)
+            if cursor == '0':
+                break
+
+    def acquire(self, key, ttl=LOCK_TTL):
+        token = uuid.uuid4().hex
+        return token if self.command('SET', key, token, 'NX', 'PX', int(ttl * 1000)) == 'OK' else None
+
+    def release(self, key, token):
+        # Compare and delete in one step so an expired lock taken over by another worker is left alone
+        self.command('EVAL', self.RELEASE_SCRIPT, 1, key, token)
+
+def open_store(url=SHARED_STORE_URL):
+    parts = urlsplit(url)
+    if parts.scheme == 'memory':
+        return MemoryStore()
+    if parts.scheme == 'sqlite':
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return SQLiteStore(url[len('sqlite:///'):])
+    if parts.scheme == 'shm':
+        # SQLite on a memory-backed file system; every worker on the host maps the same pages
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        return SQLiteStore(os.path.join(directory, f"{parts.netloc or 'graphapp'}.db"))
+    if parts.scheme == 'redis':
+        return RedisStore(parts.hostname or '127.0.0.1', parts.port or 6379, int(parts.path.lstrip('/') or 0))
+    raise ValueError(f"Unsupported shared store URL: {url}")
+
+def get_or_compute(store, key, compute, ttl, should_cache=None):
+    # Single flight: across all workers, only one computes a missing value while the others wait for it.
+    # ttl is in seconds, or a function of the computed value; the value is only stored if it is positive
+    deadline = time.monotonic() + LOCK_TTL
+    while True:
+        cached = store.get(key)
+        if cached is not None:
+            return cached, True
+        token = store.acquire(f"lock:{key}")
+        if token:
+            try:
+                value = compute()
+                expires_in = ttl(value) if callable(ttl) else ttl
+                if expires_in > 0 and (should_cache is None or should_cache(value)):
+                    store.set(key, value, expires_in)
+                return value, False
+            finally:
+                store.release(f"lock:{key}", token)
+        if time.monotonic() > deadline:
+            # The lock holder is stuck; compute without it rather than wait forever
+            return compute(), False
+        time.sleep(LOCK_POLL_INTERVAL)
+
+async def async_get_or_compute(store, key, compute, ttl, should_cache=None):
+    # The same as get_or_compute for coroutines; compute is an async function.
+    # SQLite and Redis calls block, so they run in a thread instead of on the event loop
+    deadline = time.monotonic() + LOCK_TTL
+    while True:
+        cached = await asyncio.to_thread(store.get, key)
+        if cached is not None:
+            return cached, True
+        token = await asyncio.to_thread(store.acquire, f"lock:{key}")
+        if token:
+            try:
+                value = await compute()
+                expires_in = ttl(value) if callable(ttl) else ttl
+                if expires_in > 0 and (should_cache is None or should_cache(value)):
+                    await asyncio.to_thread(store.set, key, value, expires_in)
+                return value, False
+            finally:
+                await asyncio.to_thread(store.release, f"lock:{key}", token)
+        if time.monotonic() > deadline:
+            return await compute(), False
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
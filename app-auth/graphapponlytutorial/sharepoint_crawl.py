@@ -0,0 +1,272 @@
+# sharepoint_crawl.py
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+import threading
+import configparser
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph
+from records import sharepoint_item_record
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define where the crawl state and the extracted records are kept
+SHAREPOINT_CRAWL_STATE_PATH = os.getenv('SHAREPOINT_CRAWL_STATE_PATH', 'sharepoint_crawl.db')
+SHAREPOINT_CRAWL_OUTPUT_DIR = os.getenv('SHAREPOINT_CRAWL_OUTPUT_DIR', 'sharepoint_crawl')
+
+class CrawlState:
+    path: str
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS crawl (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sites (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                lists_next_link TEXT
+            );
+            CREATE TABLE IF NOT EXISTS lists (
+                site_id TEXT NOT NULL,
+                list_id TEXT NOT NULL,
+                site TEXT,
+                name TEXT,
+                last_modified TEXT,
+                crawled_modified TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                next_link TEXT,
+                items INTEGER NOT NULL DEFAULT 0,
+                output_bytes INTEGER NOT NULL DEFAULT 0,
+                seen_pass INTEGER,
+                crawled_pass INTEGER,
+                PRIMARY KEY (site_id, list_id)
+            );
+        ''')
+
+    def get(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM crawl WHERE key = ?', (key,)).fetchone()
+        return row[0] if row and row[0] is not None else default
+
+    def put(self, **values):
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO crawl VALUES (?, ?)', list(values.items()))
+
+    def begin(self, search_term):
+        # Resume an unfinished crawl of the same sites, otherwise start a new pass that re-checks every list
+        if self.get('status') == 'running' and self.get('search_term', '') == (search_term or ''):
+            return False
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sites')
+        self.put(status='running', search_term=search_term or '', sites_next_link=None, sites_done='0',
+                 crawl_pass=str(int(self.get('crawl_pass', '0')) + 1), started=str(time.time()))
+        return True
+
+    @property
+    def crawl_pass(self):
+        return int(self.get('crawl_pass', '0'))
+
+    def add_sites(self, sites, next_link):
+        # Sites from one page and the link to the next page, saved together
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO sites (id, name) VALUES (?, ?)', sites)
+            self.connection.execute("INSERT OR REPLACE INTO crawl VALUES ('sites_next_link', ?)", (next_link,))
+            self.connection.execute("INSERT OR REPLACE INTO crawl VALUES ('sites_done', ?)", ('0' if next_link else '1',))
+
+    def sites(self, state):
+        with self.lock:
+            return self.connection.execute('SELECT id, name, lists_next_link FROM sites WHERE state = ? ORDER BY rowid', (state,)).fetchall()
+
+    def add_lists(self, site_id, site, lists, next_link):
+        # A list keeps its earlier crawl if lastModifiedDateTime is unchanged; otherwise it is crawled again from the start
+        crawl_pass = self.crawl_pass
+        keep = "(lists.state = 'done' AND lists.crawled_modified IS excluded.last_modified) OR lists.state = 'crawling'"
+        with self.lock, self.connection:
+            self.connection.executemany(f'''
+                INSERT INTO lists (site_id, list_id, site, name, last_modified, seen_pass) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (site_id, list_id) DO UPDATE SET
+                    site = excluded.site, name = excluded.name, last_modified = excluded.last_modified, seen_pass = excluded.seen_pass,
+                    state = CASE WHEN {keep} THEN lists.state ELSE 'pending' END,
+                    next_link = CASE WHEN {keep} THEN lists.next_link ELSE NULL END,
+                    items = CASE WHEN {keep} THEN lists.items ELSE 0 END,
+                    output_bytes = CASE WHEN {keep} THEN lists.output_bytes ELSE 0 END''',
+                [(site_id, list_id, site, name, last_modified, crawl_pass) for list_id, name, last_modified in lists])
+            self.connection.execute('UPDATE sites SET lists_next_link = ?, state = ? WHERE id = ?',
+                                    (next_link, 'pending' if next_link else 'listed', site_id))
+
+    def pending_lists(self, site_id):
+        crawl_pass = self.crawl_pass
+        with self.lock:
+            cursor = self.connection.execute('''
+                SELECT * FROM lists WHERE site_id = ? AND seen_pass = ? AND state IN ('pending', 'crawling')''',
+                (site_id, crawl_pass))
+            rows = cursor.fetchall()
+        return [dict(zip([column[0] for column in cursor.description], row)) for row in rows]
+
+    def start_list(self, site_id, list_id):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE lists SET state = 'crawling' WHERE site_id = ? AND list_id = ?", (site_id, list_id))
+
+    def checkpoint_list(self, site_id, list_id, next_link, items, output_bytes):
+        # The last page completes the list in the same update, so a crash cannot leave a list with no
+        # next_link to be crawled again from the first page
+        if next_link:
+            with self.lock, self.connection:
+                self.connection.execute('''
+                    UPDATE lists SET next_link = ?, items = items + ?, output_bytes = ? WHERE site_id = ? AND list_id = ?''',
+                    (next_link, items, output_bytes, site_id, list_id))
+            return
+        crawl_pass = self.crawl_pass
+        with self.lock, self.connection:
+            self.connection.execute('''
+                UPDATE lists SET state = 'done', next_link = NULL, items = items + ?, output_bytes = ?,
+                crawled_modified = last_modified, crawled_pass = ? WHERE site_id = ? AND list_id = ?''',
+                (items, output_bytes, crawl_pass, site_id, list_id))
+
+    def complete_site(self, site_id):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE sites SET state = 'done' WHERE id = ?", (site_id,))
+
+    def finish(self):
+        self.put(status='complete', finished=str(time.time()))
+
+    def summary(self):
+        crawl_pass = self.crawl_pass
+        with self.lock:
+            sites = dict(self.connection.execute('SELECT state, COUNT(*) FROM sites GROUP BY state').fetchall())
+            crawled, items = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(items), 0) FROM lists WHERE crawled_pass = ?', (crawl_pass,)).fetchone()
+            skipped = self.connection.execute('''
+                SELECT COUNT(*) FROM lists WHERE seen_pass = ? AND state = 'done' AND crawled_pass < ?''',
+                (crawl_pass, crawl_pass)).fetchone()[0]
+            remaining = self.connection.execute('''
+                SELECT COUNT(*) FROM lists WHERE state != 'done' AND seen_pass = ?''', (crawl_pass,)).fetchone()[0]
+        return {'pass': crawl_pass, 'status': self.get('status'), 'sites': sites, 'lists_crawled': crawled,
+                'lists_skipped': skipped, 'lists_remaining': remaining, 'items': items}
+
+def output_path(output_dir, site_id, list_id):
+    # Site ids contain commas, so file names keep only safe characters
+    return os.path.join(output_dir, re.sub(r'[^A-Za-z0-9.-]', '_', f"{site_id}_{list_id}") + '.jsonl')
+
+class SharePointCrawler:
+    def __init__(self, graph: Graph, state: CrawlState, output_dir, concurrency=4, page_size=200):
+        self.graph = graph
+        self.state = state
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.page_size = page_size
+
+    async def crawl(self, search_term=None):
+        if self.state.begin(search_term):
+            print(f"Starting crawl pass {self.state.crawl_pass}")
+        else:
+            print(f"Resuming crawl pass {self.state.crawl_pass}")
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        # Sites first, page by page, so an interrupted listing continues from its next link
+        while self.state.get('sites_done') != '1':
+            sites = await self.graph.get_sites_page(search_term, self.state.get('sites_next_link'))
+            self.state.add_sites([(site.id, site.display_name or site.web_url) for site in sites.value or []],
+                                 sites.odata_next_link)
+
+        for site_id, site, lists_next_link in self.state.sites('pending'):
+            await self.list_site(site_id, site, lists_next_link)
+        for site_id, site, _ in self.state.sites('listed'):
+            await self.crawl_site(site_id)
+        self.state.finish()
+        return self.state.summary()
+
+    async def list_site(self, site_id, site, next_link):
+        while True:
+            lists = await self.graph.get_lists_page(site_id, next_link)
+            next_link = lists.odata_next_link
+            self.state.add_lists(site_id, site, [
+                (lst.id, lst.display_name, lst.last_modified_date_time.isoformat() if lst.last_modified_date_time else None)
+                for lst in lists.value or []
+            ], next_link)
+            if not next_link:
+                return
+
+    async def crawl_site(self, site_id):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def crawl_with_limit(lst):
+            async with semaphore:
+                await self.crawl_list(lst)
+
+        # Let every list reach a checkpoint before an error stops the crawl
+        results = await asyncio.gather(*[crawl_with_limit(lst) for lst in self.state.pending_lists(site_id)],
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        self.state.complete_site(site_id)
+
+    async def crawl_list(self, lst):
+        site_id, list_id = lst['site_id'], lst['list_id']
+        self.state.start_list(site_id, list_id)
+        with open(output_path(self.output_dir, site_id, list_id), 'ab') as output:
+            # Drop anything written after the last checkpoint, so each page is written once
+            output.truncate(lst['output_bytes'])
+            next_link = lst['next_link']
+            while True:
+                items = await self.graph.get_list_items_page(site_id, list_id, next_link, self.page_size)
+                records = [sharepoint_item_record({
+                    'id': item.id, 'site_id': site_id, 'site': lst['site'], 'list_id': list_id, 'list': lst['name'],
+                    'fields': item.fields.additional_data if item.fields else {}
+                }) for item in items.value or []]
+                output.write(''.join(json.dumps(record, default=str) + '\n' for record in records).encode('utf-8'))
+                output.flush()
+                os.fsync(output.fileno())
+                next_link = items.odata_next_link
+                self.state.checkpoint_list(site_id, list_id, next_link, len(records), output.tell())
+                if not next_link:
+                    return
+
+async def main():
+    parser = argparse.ArgumentParser(description='Crawl SharePoint sites, lists and items with resumable checkpoints')
+    parser.add_argument('--search', help='Only crawl sites matching this search term')
+    parser.add_argument('--concurrency', type=int, default=4, help='Lists crawled at once within a site')
+    parser.add_argument('--page-size', type=int, default=200)
+    parser.add_argument('--state', default=SHAREPOINT_CRAWL_STATE_PATH)
+    parser.add_argument('--output-dir', default=SHAREPOINT_CRAWL_OUTPUT_DIR)
+    parser.add_argument('--status', action='store_true', help='Print the state of the last crawl and exit')
+    args = parser.parse_args()
+
+    state = CrawlState(args.state)
+    if args.status:
+        print(json.dumps(state.summary(), indent=2))
+        return
+
+    # Load settings
+    config = configparser.ConfigParser()
+    config.read(['config.cfg', 'config.dev.cfg'])
+    azure_settings = config['azure']
+
+    graph: Graph = Graph(azure_settings)
+    crawler = SharePointCrawler(graph, state, args.output_dir, args.concurrency, args.page_size)
+    started = time.time()
+    try:
+        summary = await crawler.crawl(args.search)
+    except Exception as e:
+        # Everything up to the last finished page is saved
+        print(f"Crawl interrupted: {e}")
+        print(f"Progress so far: {json.dumps(state.summary())}. Run again to resume.")
+        raise SystemExit(1)
+    print(f"Crawl pass {summary['pass']} finished in {time.time() - started:.1f} s: {summary['lists_crawled']} lists crawled, "
+          f"{summary['lists_skipped']} unchanged lists skipped, {summary['items']} items written to {args.output_dir}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
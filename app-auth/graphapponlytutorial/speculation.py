@@ -0,0 +1,131 @@
+# speculation.py
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from tools import TOOLS
+
+# Only read-only tools without arguments are speculated; actions such as send_mail never are
+PREDICTION_KEYWORDS = {
+    tool['name']: tool['keywords'] for tool in TOOLS if not tool.get('action') and not tool.get('required')
+}
+
+HISTORY_SIZE = 50
+
+class SpeculativePrefetcher:
+    def __init__(self, call_function, state_path='speculation_state.json', max_predictions=2, max_workers=4):
+        self.call_function = call_function
+        self.state_path = state_path
+        self.max_predictions = max_predictions
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.history = []
+        self.metrics = Counter()
+        self.load_state()
+
+    def load_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.history = state.get('history', [])[-HISTORY_SIZE:]
+            self.metrics.update(state.get('metrics', {}))
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        with self.lock:
+            state = {'history': self.history[-HISTORY_SIZE:], 'metrics': dict(self.metrics)}
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=4)
+
+    def predict(self, prompt):
+        words = set(re.findall(r'\w+', prompt.lower()))
+        with self.lock:
+            recent = Counter(self.history[-HISTORY_SIZE:])
+        total = sum(recent.values()) or 1
+
+        # Keyword hits decide; recent history breaks ties between similar datasets
+        scores = {}
+        for name, keywords in PREDICTION_KEYWORDS.items():
+            hits = len(words.intersection(keywords))
+            if hits:
+                scores[name] = hits + recent[name] / total
+        ranked = sorted(scores, key=lambda name: -scores[name])
+        return ranked[:self.max_predictions]
+
+    def start(self, prompt, call=None):
+        # Fetch the predicted datasets while routing is still in flight; call replaces call_function,
+        # so batch mode can share its deduplicated, slot-limited calls
+        speculative = {}
+        for name in self.predict(prompt):
+            started = time.perf_counter()
+            future = self.executor.submit(self._timed_call, name, call or self.call_function)
+            speculative[name] = (started, future)
+        with self.lock:
+            self.metrics['queries'] += 1
+            self.metrics['predictions'] += len(speculative)
+        return speculative
+
+    def _timed_call(self, name, call):
+        start = time.perf_counter()
+        result = call(name, {})
+        return result, time.perf_counter() - start
+
+    @staticmethod
+    def has_arguments(args):
+        return any(value for key, value in dict(args or {}).items() if key != 'dummy')
+
+    def resolve(self, function_calls, speculative, fallback=None):
+        # Confirmed predictions are reused, the rest are cancelled
+        fallback = fallback or self.call_function
+        routed_at = time.perf_counter()
+        confirmed = {name for name, args in function_calls if name in speculative and not self.has_arguments(args)}
+
+        with self.lock:
+            self.history.extend(name for name, _ in function_calls)
+            del self.history[:-HISTORY_SIZE]
+            self.metrics['routed_calls'] += len(function_calls)
+            self.metrics['hits'] += len(confirmed)
+            for name, (_, future) in speculative.items():
+                if name not in confirmed:
+                    # A request already on the wire cannot be interrupted; its result is discarded
+                    self.metrics['cancelled' if future.cancel() else 'wasted'] += 1
+
+        def call(name, args):
+            if name not in confirmed:
+                return fallback(name, args)
+            started, future = speculative[name]
+            result, duration = future.result()
+            # Without speculation the fetch would have started once routing finished
+            with self.lock:
+                self.metrics['latency_saved_ms'] += round(min(duration, routed_at - started) * 1000)
+            return result
+
+        return call
+
+    def cancel(self, speculative):
+        # Routing failed, so none of the predictions can be used
+        self.resolve([], speculative)
+
+    def summary(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        predictions = metrics.get('predictions', 0)
+        hits = metrics.get('hits', 0)
+        return {
+            'queries': metrics.get('queries', 0),
+            'predictions': predictions,
+            'hits': hits,
+            'hit_rate': round(hits / predictions, 3) if predictions else 0.0,
+            'recall': round(hits / metrics['routed_calls'], 3) if metrics.get('routed_calls') else 0.0,
+            'cancelled': metrics.get('cancelled', 0),
+            'wasted': metrics.get('wasted', 0),
+            'latency_saved_ms': metrics.get('latency_saved_ms', 0),
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.save_state()
@@ -0,0 +1,174 @@
+# subscriptions.py
+import os
+import time
+import sqlite3
+import secrets
+import asyncio
+import argparse
+import threading
+import configparser
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv, find_dotenv
+from graph import Graph
+
+# Load environment variables
+_ = load_dotenv(find_dotenv())  # read local .env file
+
+# Define where subscriptions are tracked and how early they are renewed
+SUBSCRIPTIONS_PATH = os.getenv('SUBSCRIPTIONS_PATH', 'subscriptions.db')
+NOTIFICATION_URL = os.getenv('NOTIFICATION_URL', '')
+RENEW_BEFORE = timedelta(hours=float(os.getenv('SUBSCRIPTION_RENEW_BEFORE_HOURS', '12')))
+
+# Longest lifetime Graph allows for each kind of subscription
+MAX_LIFETIME = {
+    'messages': timedelta(minutes=4230),
+    'events': timedelta(minutes=4230),
+    'list': timedelta(minutes=42300),
+}
+
+class SubscriptionStore:
+    path: str
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                resource TEXT NOT NULL,
+                change_type TEXT NOT NULL,
+                client_state TEXT NOT NULL,
+                expiration REAL NOT NULL,
+                site_id TEXT,
+                list_id TEXT
+            );
+        ''')
+
+    def save(self, subscription):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                subscription['id'], subscription['kind'], subscription['resource'], subscription['change_type'],
+                subscription['client_state'], subscription['expiration'], subscription.get('site_id'), subscription.get('list_id'),
+            ))
+
+    def get(self, subscription_id):
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM subscriptions WHERE id = ?', (subscription_id,)).fetchone()
+        return self.to_dict(row) if row else None
+
+    def all(self):
+        with self.lock:
+            rows = self.connection.execute('SELECT * FROM subscriptions').fetchall()
+        return [self.to_dict(row) for row in rows]
+
+    def delete(self, subscription_id):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM subscriptions WHERE id = ?', (subscription_id,))
+
+    @staticmethod
+    def to_dict(row):
+        keys = ['id', 'kind', 'resource', 'change_type', 'client_state', 'expiration', 'site_id', 'list_id']
+        return dict(zip(keys, row))
+
+def subscription_targets(user_id, sharepoint_lists):
+    # (kind, resource, change_type, site_id, list_id) for everything the app keeps fresh
+    targets = [
+        ('messages', f"users/{user_id}/mailFolders('inbox')/messages", 'created,updated,deleted', None, None),
+        ('events', f"users/{user_id}/events", 'created,updated,deleted', None, None),
+    ]
+    # SharePoint lists only support the updated change type
+    targets.extend(('list', f"sites/{lst['site_id']}/lists/{lst['list_id']}", 'updated', lst['site_id'], lst['list_id'])
+                   for lst in sharepoint_lists)
+    return targets
+
+class SubscriptionManager:
+    def __init__(self, graph: Graph, store: SubscriptionStore, notification_url=None, lifecycle_notification_url=None):
+        self.graph = graph
+        self.store = store
+        self.notification_url = notification_url
+        self.lifecycle_notification_url = lifecycle_notification_url
+
+    async def create(self, kind, resource, change_type, site_id=None, list_id=None):
+        if not self.notification_url:
+            raise Exception('A notification URL is required to create subscriptions')
+        # Each subscription gets its own secret, which Graph echoes back in every notification
+        client_state = secrets.token_urlsafe(32)
+        expiration = datetime.now(timezone.utc) + MAX_LIFETIME[kind]
+        created = await self.graph.create_subscription(resource, change_type, self.notification_url, client_state,
+                                                       expiration, self.lifecycle_notification_url)
+        subscription = {
+            'id': created.id, 'kind': kind, 'resource': resource, 'change_type': change_type,
+            'client_state': client_state, 'expiration': expiration.timestamp(), 'site_id': site_id, 'list_id': list_id,
+        }
+        self.store.save(subscription)
+        return subscription
+
+    async def renew(self, subscription):
+        expiration = datetime.now(timezone.utc) + MAX_LIFETIME[subscription['kind']]
+        await self.graph.renew_subscription(subscription['id'], expiration)
+        subscription = dict(subscription, expiration=expiration.timestamp())
+        self.store.save(subscription)
+        return subscription
+
+    async def ensure(self):
+        # Create missing subscriptions and renew the ones that expire soon
+        sharepoint_lists = await self.graph.get_sharepoint_lists()
+        existing = {subscription['resource']: subscription for subscription in self.store.all()}
+        created = renewed = 0
+        for kind, resource, change_type, site_id, list_id in subscription_targets(self.graph.user_id, sharepoint_lists):
+            subscription = existing.get(resource)
+            if subscription is None:
+                await self.create(kind, resource, change_type, site_id, list_id)
+                created += 1
+            elif subscription['expiration'] - time.time() < RENEW_BEFORE.total_seconds():
+                try:
+                    await self.renew(subscription)
+                    renewed += 1
+                except Exception:
+                    # The subscription already expired or was removed by Graph, so start a new one
+                    self.store.delete(subscription['id'])
+                    await self.create(kind, resource, change_type, site_id, list_id)
+                    created += 1
+        return created, renewed
+
+    async def delete_all(self):
+        for subscription in self.store.all():
+            try:
+                await self.graph.delete_subscription(subscription['id'])
+            except Exception as e:
+                print(f"Could not delete subscription {subscription['id']}: {e}")
+            self.store.delete(subscription['id'])
+
+async def main():
+    parser = argparse.ArgumentParser(description='Create and renew Graph change notification subscriptions')
+    parser.add_argument('--notification-url', default=NOTIFICATION_URL, help='Public URL of the /notifications endpoint')
+    parser.add_argument('--lifecycle-url', help='URL for lifecycle notifications, defaults to the notification URL')
+    parser.add_argument('--watch', type=float, help='Keep running and check for renewals every N minutes')
+    parser.add_argument('--delete', action='store_true', help='Delete all tracked subscriptions')
+    args = parser.parse_args()
+
+    # Load settings
+    config = configparser.ConfigParser()
+    config.read(['config.cfg', 'config.dev.cfg'])
+    azure_settings = config['azure']
+
+    graph: Graph = Graph(azure_settings)
+    manager = SubscriptionManager(graph, SubscriptionStore(SUBSCRIPTIONS_PATH), args.notification_url,
+                                  args.lifecycle_url or args.notification_url)
+    if args.delete:
+        await manager.delete_all()
+        print('Deleted all subscriptions')
+        return
+
+    while True:
+        created, renewed = await manager.ensure()
+        print(f"{created} subscriptions created, {renewed} renewed, {len(manager.store.all())} active")
+        if not args.watch:
+            break
+        await asyncio.sleep(args.watch * 60)
+
+if __name__ == "__main__":
+    asyncio.run(main())
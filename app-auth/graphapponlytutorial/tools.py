@@ -0,0 +1,158 @@
+# tools.py
+import os
+import re
+from functools import lru_cache
+import requests
+
+# Define the base URL for the Flask REST API
+BASE_URL = os.getenv('INTERACT_BASE_URL', "http://127.0.0.1:5000")
+
+# Send at most this many tools to the router per prompt
+ROUTER_TOP_N = int(os.getenv('ROUTER_TOP_N', '3'))
+
+# Declarative registry of the /interact tools. The Gemini function declarations,
+# the dispatch table and the router pre-filter are all generated from it.
+# Local tools have no /interact option and are run by rag_core itself.
+TOOLS = [
+    {
+        "name": "display_access_token",
+        "description": "Display the access token for the Microsoft Graph API",
+        "option": 1,
+        "action": True,
+        "keywords": ["token", "access", "bearer", "jwt"],
+    },
+    {
+        "name": "list_inbox",
+        "description": "List the emails in the inbox",
+        "option": 2,
+        "keywords": ["inbox", "unread", "latest", "recent", "emails", "mail"],
+    },
+    {
+        "name": "send_mail",
+        "description": "Send an email to the signed-in user",
+        "option": 3,
+        "action": True,
+        "keywords": ["send", "write", "notify", "test"],
+    },
+    {
+        "name": "extract_email_metadata",
+        "description": "Extract metadata from emails",
+        "option": 4,
+        "keywords": ["email", "emails", "mail", "message", "messages", "sender", "from", "recipients",
+                     "attachment", "attachments", "importance", "categories"],
+    },
+    {
+        "name": "extract_calendar_events",
+        "description": "Extract calendar events",
+        "option": 5,
+        "keywords": ["calendar", "meeting", "meetings", "event", "events", "schedule", "week", "today",
+                     "tomorrow", "appointment", "appointments"],
+    },
+    {
+        "name": "extract_contacts",
+        "description": "Extract contacts and network information",
+        "option": 6,
+        "keywords": ["contact", "contacts", "people", "network", "colleague", "colleagues", "phone"],
+    },
+    {
+        "name": "extract_sharepoint_usage",
+        "description": "Extract SharePoint usage information",
+        "option": 7,
+        "parameters": {
+            "search_term": {
+                "type": "STRING",
+                "description": "Search term to filter SharePoint sites",
+            },
+        },
+        "required": ["search_term"],
+        "keywords": ["sharepoint", "site", "sites", "list", "lists", "document", "documents", "files", "intranet"],
+    },
+    {
+        "name": "search_content",
+        "description": "Search emails, calendar events, files and SharePoint list items for a topic and return only the matches",
+        "option": 8,
+        "parameters": {
+            "query": {
+                "type": "STRING",
+                "description": "Keywords to search for, in KQL syntax",
+            },
+            "entity_types": {
+                "type": "ARRAY",
+                "items": {"type": "STRING", "enum": ["message", "event", "driveItem", "listItem"]},
+                "description": "Kinds of content to search; omit to search files and SharePoint list items only",
+            },
+        },
+        "required": ["query"],
+        "keywords": ["find", "search", "about", "mentioning", "mentions", "regarding", "containing", "topic",
+                     "file", "files", "document", "documents"],
+    },
+    {
+        "name": "search_index",
+        "description": "Look up the indexed emails, calendar events, contacts, SharePoint list items and documents "
+                       "most relevant to a question, including older data that the other tools do not return",
+        "local": True,
+        "parameters": {
+            "query": {
+                "type": "STRING",
+                "description": "The question or keywords to look up",
+            },
+        },
+        "required": ["query"],
+        "keywords": ["find", "search", "about", "mentioning", "regarding", "topic", "history", "older", "past",
+                     "ever", "archive", "who", "which"],
+    },
+]
+
+TOOLS_BY_NAME = {tool["name"]: tool for tool in TOOLS}
+
+# Functions that perform an action instead of reading data
+ACTION_FUNCTIONS = {tool["name"] for tool in TOOLS if tool.get("action")}
+
+def call_tool(name, args=None):
+    tool = TOOLS_BY_NAME[name]
+    if tool.get("local"):
+        raise Exception(f"{name} runs locally and has no /interact option")
+    payload = {"option": tool["option"]}
+    for parameter in tool.get("parameters", {}):
+        if args and parameter in args:
+            payload[parameter] = args[parameter]
+
+    response = requests.post(f"{BASE_URL}/interact", json=payload)
+    if response.status_code == 200:
+        return response.json()
+    else:
+        raise Exception(f"Failed to {name.replace('_', ' ')}: {response.status_code} - {response.text}")
+
+@lru_cache(maxsize=None)
+def get_declaration(name):
+    from google.genai import types
+
+    tool = TOOLS_BY_NAME[name]
+    declaration = {"name": name, "description": tool["description"]}
+    # Tools without arguments need no parameter schema at all, which keeps the routing prompt small
+    if tool.get("parameters"):
+        declaration["parameters"] = {
+            "type": "OBJECT",
+            "properties": tool["parameters"],
+            "required": tool.get("required", []),
+        }
+    return types.FunctionDeclaration(**declaration)
+
+@lru_cache(maxsize=None)
+def build_tool(names=None):
+    from google.genai import types
+
+    names = names or tuple(tool["name"] for tool in TOOLS if not tool.get("local"))
+    return types.Tool(function_declarations=[get_declaration(name) for name in names])
+
+def select_tools(prompt, top_n=ROUTER_TOP_N, local=False):
+    # Cheap local pre-filter: rank tools by keyword overlap with the prompt.
+    # Local tools are only offered when the caller can run them
+    tools = [tool for tool in TOOLS if local or not tool.get("local")]
+    words = set(re.findall(r'\w+', prompt.lower()))
+    scores = {tool["name"]: len(words.intersection(tool["keywords"])) for tool in tools}
+    ranked = [name for name in sorted(scores, key=lambda name: -scores[name]) if scores[name] > 0]
+    if not ranked:
+        # Nothing matched locally, so let the model choose from every tool
+        return tuple(tool["name"] for tool in tools)
+    return tuple(ranked[:top_n])
@@ -0,0 +1,80 @@
+# vector_index.py
+import json
+import os
+import numpy as np
+
+# Define the embedding model used to build and query the index
+EMBEDDING_MODEL = 'models/text-embedding-004'
+
+VECTORS_FILE = 'vectors.npy'
+RECORDS_FILE = 'records.jsonl'
+
+class VectorIndex:
+    vectors: np.ndarray
+    records: list
+
+    def __init__(self, vectors=None, records=None):
+        self.vectors = vectors if vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        self.records = records if records is not None else []
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, records, vectors):
+        vectors = self.normalize(vectors)
+        if len(records) != len(vectors):
+            raise ValueError(f"Got {len(records)} records but {len(vectors)} vectors")
+        if len(self.records) == 0:
+            self.vectors = vectors
+        else:
+            # A memory-mapped index is read-only, so stacking copies it into memory
+            self.vectors = np.vstack([self.vectors, vectors])
+        self.records.extend(records)
+
+    def search(self, query_vector, top_k=20):
+        if len(self.records) == 0:
+            return []
+        query_vector = self.normalize(query_vector)
+        scores = self.vectors @ query_vector
+        top_k = min(top_k, len(scores))
+        # Partial sort: only the top-k candidates are ordered
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(float(scores[i]), self.records[i]) for i in ranked]
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, VECTORS_FILE), np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(path, RECORDS_FILE), 'w', encoding='utf-8') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r' if mmap else None)
+        with open(os.path.join(path, RECORDS_FILE), encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return cls(vectors, records)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, VECTORS_FILE)) and os.path.exists(os.path.join(path, RECORDS_FILE))
+
+    @classmethod
+    def build(cls, records, embed_batch, batch_size=100):
+        index = cls()
+        vectors = []
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            vectors.extend(embed_batch([record['text'] for record in batch]))
+        if records:
+            # Add everything in one step to avoid re-stacking the matrix per batch
+            index.add(list(records), vectors)
+        return index
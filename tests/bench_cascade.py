@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+
+# Make the app-only tutorial modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-auth', 'graphapponlytutorial'))
+
+from cascade import ModelCascade
+
+# Prompts shaped like the questions the RAG pipeline answers
+QUERIES = [
+    "How many unread emails do I have?",
+    "List the subjects of my meetings this week",
+    "Who sent me emails about the invoice?",
+    "What is the total number of contacts in my network?",
+    "Which SharePoint sites mention the project?",
+]
+
+class MockModels:
+    # Deterministic stand-ins for Gemini with configurable latency and answer quality
+    def __init__(self, profiles, seed):
+        self.profiles = profiles
+        self.random = random.Random(seed)
+        self.elapsed = 0.0
+        self.calls = 0
+
+    def complete(self, model, prompt_text, temperature=None):
+        profile = self.profiles[model]
+        self.calls += 1
+        # Simulated latency, so the benchmark runs instantly
+        self.elapsed += max(0.0, self.random.gauss(profile['latency'], profile['latency'] * 0.1))
+        if self.random.random() < profile['failure_rate']:
+            return self.random.choice(["I don't know.", "", "There are several of them."])
+        return f"There are {12 if 'many' in prompt_text or 'number' in prompt_text else 3} matching items."
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run(models, profiles, check, queries, seed):
+    mock = MockModels(profiles, seed)
+    cascade = ModelCascade(models, mock.complete, check=check)
+    latencies = []
+    escalations = 0
+    for index in range(queries):
+        query_str = QUERIES[index % len(QUERIES)]
+        mock.elapsed = 0.0
+        outcome = cascade.generate(f"Query: {query_str}", query_str)
+        latencies.append(mock.elapsed * 1000)
+        escalations += 1 if outcome['escalations'] else 0
+    return {
+        'models': models,
+        'check': check,
+        'queries': queries,
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p95_ms': round(percentile(latencies, 0.95), 1),
+        'mean_ms': round(statistics.mean(latencies), 1),
+        'escalation_rate': round(escalations / queries, 3),
+        'calls_per_query': round(mock.calls / queries, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the generation model cascade with mocked models')
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--small-latency', type=float, default=0.35, help='Seconds per small-model call')
+    parser.add_argument('--large-latency', type=float, default=1.5, help='Seconds per large-model call')
+    parser.add_argument('--small-failure-rate', type=float, default=0.15)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    profiles = {
+        'small': {'latency': args.small_latency, 'failure_rate': args.small_failure_rate},
+        'large': {'latency': args.large_latency, 'failure_rate': 0.0},
+    }
+    results = [
+        run(['large'], profiles, 'heuristic', args.queries, args.seed),
+        run(['small', 'large'], profiles, 'heuristic', args.queries, args.seed),
+        run(['small', 'large'], profiles, 'self_consistency', args.queries, args.seed),
+    ]
+
+    print(f"{'cascade':<14} {'check':<17} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'escalated':>10} {'calls/q':>8}")
+    for result in results:
+        print(f"{' > '.join(result['models']):<14} {result['check']:<17} {result['p50_ms']:>8} {result['p95_ms']:>8} "
+              f"{result['mean_ms']:>8} {result['escalation_rate']:>10.1%} {result['calls_per_query']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == "__main__":
+    main()
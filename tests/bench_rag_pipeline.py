@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-auth', 'graphapponlytutorial')
+
+# Prompts shaped like the questions the RAG pipeline answers
+PROMPTS = [
+    "How many unread emails are in my inbox?",
+    "Who sent me emails about the invoice?",
+    "What meetings do I have this week?",
+    "List the people in my contacts network",
+    "Summarize my week: mail and meetings",
+]
+
+def synthetic_payload(option, volume, seed=0):
+    # Deterministic /interact responses with the same shape as app.py
+    rng = random.Random(seed + option)
+    if option in (2, 4):
+        key = 'messages' if option == 2 else 'email_metadata'
+        return {key: [{
+            'subject': f"Subject {i} {rng.choice(['invoice', 'report', 'lunch', 'review'])}",
+            'from': f"user{rng.randrange(100)}@contoso.com",
+            'received_date_time': f"2024-01-{1 + i % 28:02d} 09:00:00+0000",
+            'is_read': rng.random() < 0.5,
+        } for i in range(volume)]}
+    if option == 5:
+        return {'calendar_events': [{
+            'subject': f"Meeting {i}", 'start': '2024-01-01T09:00:00', 'end': '2024-01-01T10:00:00',
+            'location': f"Room {rng.randrange(20)}",
+        } for i in range(volume)]}
+    if option == 6:
+        return {'contacts': [{'display_name': f"Contact {i}", 'email': f"contact{i}@contoso.com"} for i in range(volume)]}
+    if option == 7:
+        return {'sharepoint_sites': [{'display_name': f"Site {i}", 'web_url': f"https://contoso.sharepoint.com/sites/{i}"}
+                                     for i in range(volume)]}
+    return {'message': 'ok'}
+
+class InteractStandIn(BaseHTTPRequestHandler):
+    # Replaces the Flask app and Microsoft Graph behind it
+    payloads = {}
+    latency = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.latency)
+        payload = self.payloads.get(body.get('option'), b'{}')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_interact_stand_in(volume, latency):
+    InteractStandIn.payloads = {option: json.dumps(synthetic_payload(option, volume)).encode('utf-8') for option in range(1, 8)}
+    InteractStandIn.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InteractStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class MockGemini:
+    # Stands in for both the routing client and the llama_index generation model
+    def __init__(self, routing_latency, generation_latency, generation_ms_per_1k_tokens, select_tools, tools_by_name):
+        self.routing_latency = routing_latency
+        self.generation_latency = generation_latency
+        self.generation_ms_per_1k_tokens = generation_ms_per_1k_tokens
+        self.select_tools = select_tools
+        self.tools_by_name = tools_by_name
+        self.models = self
+
+    def generate_content(self, model, contents, config):
+        time.sleep(self.routing_latency)
+        # Route deterministically to the best locally ranked read-only tools that need no arguments
+        names = [name for name in self.select_tools(contents)
+                 if not self.tools_by_name[name].get('action') and not self.tools_by_name[name].get('required')]
+        parts = [SimpleNamespace(function_call=SimpleNamespace(name=name, args={})) for name in names[:2]]
+        return SimpleNamespace(
+            candidates=[SimpleNamespace(content=SimpleNamespace(parts=parts))],
+            usage_metadata=SimpleNamespace(prompt_token_count=len(contents) // 4 + 50, candidates_token_count=10),
+        )
+
+    def complete(self, prompt_text):
+        prompt_tokens = len(prompt_text) // 4
+        time.sleep(self.generation_latency + prompt_tokens / 1000 * self.generation_ms_per_1k_tokens / 1000)
+        usage = {'prompt_token_count': prompt_tokens, 'candidates_token_count': 20}
+        return SimpleNamespace(text="There are 12 matching items.", raw={'usage_metadata': usage})
+
+def percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    pick = lambda fraction: round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 1)
+    return {'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'count': len(ordered)}
+
+def run_query(rag_core, prompt):
+    # The same stages as rag.py's interactive path
+    timings = {}
+    start = time.perf_counter()
+    function_calls = rag_core.determine_function_calls(prompt)
+    timings['routing'] = time.perf_counter() - start
+
+    stage_start = time.perf_counter()
+    context = rag_core.call_functions(function_calls)
+    timings['tools'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    rag_core.generate_response(prompt, context)
+    timings['generation'] = time.perf_counter() - stage_start
+    timings['total'] = time.perf_counter() - start
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the RAG pipeline with mocked Gemini and Graph')
+    parser.add_argument('--queries', type=int, default=100, help='Queries per scenario')
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+    parser.add_argument('--volumes', default='25,1000,10000', help='Comma-separated records per /interact response')
+    parser.add_argument('--routing-latency', type=float, default=0.3)
+    parser.add_argument('--interact-latency', type=float, default=0.2)
+    parser.add_argument('--generation-latency', type=float, default=0.8)
+    parser.add_argument('--generation-ms-per-1k-tokens', type=float, default=20.0)
+    parser.add_argument('--output', default='bench_rag_pipeline.json')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_rag_')
+    server = start_interact_stand_in(0, args.interact_latency)
+    os.environ.update({
+        'GEMINI_API_KEY': 'benchmark',
+        'INTERACT_BASE_URL': f"http://127.0.0.1:{server.server_address[1]}",
+        'ANSWER_CACHE_TTL': '0',
+        'LLM_METRICS_PATH': os.path.join(workdir, 'llm_metrics.db'),
+        'ANSWER_CACHE_PATH': os.path.join(workdir, 'answer_cache.db'),
+        'VECTOR_INDEX_DIR': os.path.join(workdir, 'no_index'),
+        'LLM_MAX_RETRIES': '0',
+    })
+    sys.path.insert(0, APP_DIR)
+    import rag_core
+    from tools import select_tools, TOOLS_BY_NAME
+
+    mock = MockGemini(args.routing_latency, args.generation_latency, args.generation_ms_per_1k_tokens, select_tools, TOOLS_BY_NAME)
+    rag_core.get_client = lambda: mock
+    rag_core.get_model_llm = lambda model: mock
+
+    scenarios = []
+    for volume in [int(value) for value in args.volumes.split(',')]:
+        InteractStandIn.payloads = {option: json.dumps(synthetic_payload(option, volume)).encode('utf-8') for option in range(1, 8)}
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.queries)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                runs = list(executor.map(lambda prompt: run_query(rag_core, prompt), prompts))
+            elapsed = time.perf_counter() - start
+
+            stages = {stage: percentiles([run[stage] for run in runs]) for stage in ('routing', 'tools', 'generation', 'total')}
+            scenarios.append({
+                'volume': volume,
+                'concurrency': concurrency,
+                'throughput_qps': round(len(runs) / elapsed, 2),
+                'stages': stages,
+            })
+            print(f"volume={volume:<6} concurrency={concurrency:<3} qps={len(runs) / elapsed:7.2f}  " +
+                  '  '.join(f"{stage} p50/p95/p99={values['p50_ms']}/{values['p95_ms']}/{values['p99_ms']}ms"
+                            for stage, values in stages.items()))
+
+    server.shutdown()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': time.time(), 'config': vars(args), 'scenarios': scenarios}, f, indent=4)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
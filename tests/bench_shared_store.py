@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from resp_server import start_server
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-auth', 'graphapponlytutorial'))
+sys.path.insert(0, APP_DIR)
+from shared_store import open_store, get_or_compute
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    pick = lambda q: round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 3)
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+def worker(url, namespace, worker_id, args, start, results):
+    # One app worker: every request needs a token and then a cacheable Graph result
+    store = open_store(url)
+    rng = random.Random(args.seed + worker_id)
+    graph_calls = token_fetches = 0
+    latencies, store_latencies = [], []
+
+    def fetch_token():
+        nonlocal token_fetches
+        token_fetches += 1
+        time.sleep(args.token_latency)
+        return json.dumps(['token', time.time() + 3600])
+
+    def fetch_graph(key):
+        nonlocal graph_calls
+        graph_calls += 1
+        time.sleep(args.graph_latency)
+        return json.dumps({'key': key, 'value': 'x' * args.value_size})
+
+    start.wait()
+    began = time.perf_counter()
+    for _ in range(args.requests):
+        # A skewed key mix, like many users asking for the same few inboxes
+        key = f"{namespace}interact:2:{min(int(rng.paretovariate(1.2)) - 1, args.keys - 1)}"
+        request_start = time.perf_counter()
+        get_or_compute(store, f"{namespace}token", fetch_token, 3300)
+        get_or_compute(store, key, lambda: fetch_graph(key), args.cache_ttl)
+        latencies.append(time.perf_counter() - request_start)
+
+        operation_start = time.perf_counter()
+        store.get(key)
+        store_latencies.append(time.perf_counter() - operation_start)
+    results.put({'elapsed': time.perf_counter() - began, 'graph_calls': graph_calls, 'token_fetches': token_fetches,
+                 'latencies': latencies, 'store_latencies': store_latencies})
+
+def run(url, namespace, workers, args):
+    context = multiprocessing.get_context('spawn')
+    start, results = context.Event(), context.Queue()
+    processes = [context.Process(target=worker, args=(url, namespace, worker_id, args, start, results)) for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+    # Let every worker import and connect before the clock starts
+    time.sleep(1 + workers * 0.05)
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    requests = workers * args.requests
+    return {
+        'workers': workers,
+        'requests': requests,
+        'throughput_rps': round(requests / max(outcome['elapsed'] for outcome in outcomes), 1),
+        'graph_calls': sum(outcome['graph_calls'] for outcome in outcomes),
+        'token_fetches': sum(outcome['token_fetches'] for outcome in outcomes),
+        'request_ms': percentiles([latency for outcome in outcomes for latency in outcome['latencies']]),
+        'store_get_ms': percentiles([latency for outcome in outcomes for latency in outcome['store_latencies']]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare shared store backends for tokens, cached results and single-flight locks')
+    parser.add_argument('--backends', default='memory,sqlite,shm,redis', help='Comma-separated: memory, sqlite, shm, redis')
+    parser.add_argument('--workers', default='1,4,16', help='Comma-separated worker process counts')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per worker')
+    parser.add_argument('--keys', type=int, default=50, help='Distinct cacheable requests')
+    parser.add_argument('--cache-ttl', type=float, default=30)
+    parser.add_argument('--graph-latency', type=float, default=0.05, help='Seconds per simulated Graph call')
+    parser.add_argument('--token-latency', type=float, default=0.2, help='Seconds per simulated token request')
+    parser.add_argument('--value-size', type=int, default=4096, help='Bytes per cached result')
+    parser.add_argument('--redis-url', help='Use this Redis server instead of the local stand-in')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_shared_store.json')
+    args = parser.parse_args()
+
+    redis_server = None
+    if 'redis' in args.backends and not args.redis_url:
+        redis_server = start_server()
+    workdir = tempfile.mkdtemp(prefix='shared-store-')
+
+    report = []
+    for backend in args.backends.split(','):
+        for workers in [int(count) for count in args.workers.split(',')]:
+            # A fresh store per run so no run starts with a warm cache
+            run_id = f"{backend}-{workers}-{int(time.time() * 1000)}"
+            if backend == 'memory':
+                url = 'memory://'
+            elif backend == 'sqlite':
+                url = f"sqlite:///{os.path.join(workdir, run_id + '.db')}"
+            elif backend == 'shm':
+                url = f"shm://{run_id}"
+            elif backend == 'redis':
+                url = args.redis_url or f"redis://127.0.0.1:{redis_server.server_address[1]}/0"
+            else:
+                raise Exception(f"Unknown backend: {backend}")
+
+            # Keys are namespaced per run, so a real Redis server keeps its other data
+            namespace = f"bench:{run_id}:"
+            result = dict(backend=backend, **run(url, namespace, workers, args))
+            report.append(result)
+            print(f"{backend:>6} x{workers:<3} {result['throughput_rps']:>8} req/s  graph calls {result['graph_calls']:>5}  "
+                  f"token fetches {result['token_fetches']:>3}  request p50/p99 {result['request_ms']['p50']}/{result['request_ms']['p99']} ms  "
+                  f"store get p50/p99 {result['store_get_ms']['p50']}/{result['store_get_ms']['p99']} ms")
+            if backend == 'redis':
+                open_store(url).delete_prefix(namespace)
+            if backend == 'shm':
+                for suffix in ('', '-wal', '-shm'):
+                    path = open_store(url).path + suffix
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'settings': vars(args), 'results': report}, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
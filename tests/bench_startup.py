@@ -0,0 +1,85 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# Define the paths to the app-only tutorial and the budget file
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-auth', 'graphapponlytutorial')
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+def run_import(module):
+    # Import the module in a fresh interpreter, as a CLI start or a new container would
+    env = dict(os.environ, GEMINI_API_KEY=os.environ.get('GEMINI_API_KEY', 'benchmark'))
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=False,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode != 0:
+        raise Exception(f"Failed to import {module}: {completed.stderr.strip().splitlines()[-1]}")
+
+    # Cumulative import time per module, in milliseconds
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2)) / 1000
+    return elapsed_ms, modules
+
+def measure(module, repeat):
+    baseline = statistics.median(run_import('sys')[0] for _ in range(repeat))
+    runs = [run_import(module) for _ in range(repeat)]
+    cold_start = statistics.median(elapsed for elapsed, _ in runs) - baseline
+    modules = runs[-1][1]
+    return cold_start, modules
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start import time of the RAG entry points')
+    parser.add_argument('--budget', default=BUDGET_FILE, help='JSON file with per-entry-point budgets in ms')
+    parser.add_argument('--output', help='Write the measurements to this JSON file')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest modules to print per entry point')
+    args = parser.parse_args()
+
+    with open(args.budget, encoding='utf-8') as f:
+        budget = json.load(f)
+
+    results = {}
+    failures = []
+    for entry_point, budget_ms in budget['entry_points'].items():
+        cold_start, modules = measure(entry_point, budget.get('repeat', 3))
+        loaded_early = [name for name in budget.get('deferred_modules', []) if name in modules]
+        results[entry_point] = {
+            'cold_start_ms': round(cold_start, 1),
+            'budget_ms': budget_ms,
+            'loaded_early': loaded_early,
+            'modules_ms': dict(sorted(modules.items(), key=lambda item: -item[1])[:args.top]),
+        }
+
+        print(f"{entry_point}: {cold_start:.0f} ms (budget {budget_ms} ms)")
+        for name, cumulative in results[entry_point]['modules_ms'].items():
+            print(f"  {cumulative:8.1f} ms  {name}")
+        if cold_start > budget_ms:
+            failures.append(f"{entry_point} cold start {cold_start:.0f} ms exceeds budget {budget_ms} ms")
+        if loaded_early:
+            failures.append(f"{entry_point} imports {', '.join(loaded_early)} at startup")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': time.time(), 'python': sys.version, 'results': results}, f, indent=4)
+
+    if failures:
+        print("\nCold start regressed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll entry points are within budget.")
+
+if __name__ == "__main__":
+    main()
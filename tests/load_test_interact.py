@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from mock_graph_server import Tenant, MockGraph, Throttle, start_server
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-auth', 'graphapponlytutorial'))
+
+# Serving configurations to compare. {port} is filled in when the server starts.
+CONFIGS = {
+    'flask': {'command': [sys.executable, os.path.join(APP_DIR, 'app.py')], 'env': {}},
+    'flask-cache': {'command': [sys.executable, os.path.join(APP_DIR, 'app.py')], 'env': {'INTERACT_CACHE_TTL': '30'}},
+    'gunicorn-4': {'command': ['gunicorn', '-w', '4', '-b', '127.0.0.1:{port}', '--pythonpath', APP_DIR, 'app:app'], 'env': {}},
+    'gunicorn-gthread': {'command': ['gunicorn', '-w', '2', '-k', 'gthread', '--threads', '8', '-b', '127.0.0.1:{port}',
+                                     '--pythonpath', APP_DIR, 'app:app'], 'env': {}},
+    # Cooperative workers: each worker serves up to 100 requests at once, switching between them
+    # while they wait on Graph instead of holding a thread per request
+    'gunicorn-gevent': {'command': ['gunicorn', '-w', '4', '-k', 'gevent', '--worker-connections', '100', '-b', '127.0.0.1:{port}',
+                                    '--pythonpath', APP_DIR, 'app:app'], 'env': {}},
+    'gunicorn-4-cache': {'command': ['gunicorn', '-w', '4', '-b', '127.0.0.1:{port}', '--pythonpath', APP_DIR, 'app:app'],
+                         'env': {'INTERACT_CACHE_TTL': '30'}},
+    # Same as gunicorn-4-cache, but the workers share one cache and token store in the scratch directory
+    'gunicorn-4-shared': {'command': ['gunicorn', '-w', '4', '-b', '127.0.0.1:{port}', '--pythonpath', APP_DIR, 'app:app'],
+                          'env': {'INTERACT_CACHE_TTL': '30', 'SHARED_STORE_URL': 'sqlite:///shared_store.db'}},
+}
+
+# Relative weight of each /interact option; 0 stands for GET /options
+DEFAULT_MIX = '0:1,1:0.5,2:3,3:0.2,4:3,5:2,6:1,7:1'
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def parse_mix(mix):
+    weights = {}
+    for entry in mix.split(','):
+        option, weight = entry.split(':')
+        weights[int(option)] = float(weight)
+    return weights
+
+def percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    pick = lambda fraction: round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 1)
+    return {'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+def process_tree(pid):
+    # The server and its worker processes, found through /proc
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except OSError:
+                continue
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent]
+        tree.update(children)
+        frontier.extend(children)
+    return tree
+
+def sample_resources(pid):
+    # Total CPU seconds and resident memory of the server process tree
+    cpu_seconds, rss_bytes = 0.0, 0
+    ticks, page_size = os.sysconf('SC_CLK_TCK'), os.sysconf('SC_PAGE_SIZE')
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu_seconds += (int(fields[11]) + int(fields[12])) / ticks
+            rss_bytes += int(fields[21]) * page_size
+        except OSError:
+            continue
+    return cpu_seconds, rss_bytes
+
+class ResourceMonitor(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        if not os.path.isdir('/proc'):
+            return
+        while not self.stopped.is_set():
+            cpu_seconds, rss_bytes = sample_resources(self.pid)
+            self.samples.append((time.perf_counter(), cpu_seconds, rss_bytes))
+            self.stopped.wait(self.interval)
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return {'cpu_percent_avg': None, 'cpu_percent_max': None, 'rss_mb_max': None}
+        usage = [(cpu - previous_cpu) / (at - previous_at) * 100
+                 for (previous_at, previous_cpu, _), (at, cpu, _) in zip(self.samples, self.samples[1:])]
+        total = (self.samples[-1][1] - self.samples[0][1]) / (self.samples[-1][0] - self.samples[0][0]) * 100
+        return {
+            'cpu_percent_avg': round(total, 1),
+            'cpu_percent_max': round(max(usage), 1),
+            'rss_mb_max': round(max(sample[2] for sample in self.samples) / 1024 / 1024, 1),
+        }
+
+def start_app(config, port, graph_url, workdir):
+    # Run the app from a scratch directory whose config.cfg points Graph at the mock server
+    with open(os.path.join(workdir, 'config.cfg'), 'w', encoding='utf-8') as f:
+        f.write(f"[azure]\nclientId = load-test\nclientSecret = load-test\ntenantId = load-test\n"
+                f"graphBaseUrl = {graph_url}\nstaticToken = load-test\n")
+    if shutil.which(config['command'][0]) is None:
+        raise Exception(f"{config['command'][0]} is not installed")
+    env = dict(os.environ, FLASK_DEBUG='0', PORT=str(port), PYTHONPATH=APP_DIR, **config['env'])
+    command = [part.format(port=port) for part in config['command']]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise Exception(f"Server exited with code {process.returncode}: {' '.join(command)}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/options", timeout=1).read()
+            return process
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    process.terminate()
+    raise Exception(f"Server did not start within 30 seconds: {' '.join(command)}")
+
+def send(base_url, option, timeout):
+    if option == 0:
+        request = urllib.request.Request(f"{base_url}/options")
+    else:
+        request = urllib.request.Request(f"{base_url}/interact", data=json.dumps({'option': option}).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+def run_load(base_url, rate, duration, mix, max_in_flight, timeout, seed):
+    # Open-loop load: requests are sent on a Poisson schedule whether or not earlier ones have finished,
+    # and latency is measured from the scheduled time so queueing delay is not hidden
+    rng = random.Random(seed)
+    options, weights = list(mix), list(mix.values())
+    results = []
+    lock = threading.Lock()
+
+    def issue(option, scheduled):
+        status = send(base_url, option, timeout)
+        with lock:
+            results.append((option, status, time.perf_counter() - scheduled))
+
+    start = time.perf_counter()
+    next_at = start
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while next_at - start < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(issue, rng.choices(options, weights)[0], next_at)
+            next_at += rng.expovariate(rate)
+    elapsed = time.perf_counter() - start
+
+    ok = [latency for _, status, latency in results if 200 <= status < 300]
+    per_option = {}
+    for option in options:
+        latencies = [latency for chosen, status, latency in results if chosen == option and 200 <= status < 300]
+        per_option['options' if option == 0 else str(option)] = percentiles(latencies)
+    return dict({
+        'offered_rps': rate,
+        'requests': len(results),
+        'throughput_rps': round(len(ok) / elapsed, 2),
+        'error_rate': round(1 - len(ok) / len(results), 4) if results else 0.0,
+        'per_option': per_option,
+    }, **percentiles(ok))
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Flask /interact and /options endpoints against a mock Graph')
+    parser.add_argument('--configs', default='flask,flask-cache', help=f"Comma-separated configurations: {', '.join(CONFIGS)}")
+    parser.add_argument('--rates', default='5,10,20', help='Comma-separated arrival rates in requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load per rate')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='option:weight pairs, 0 stands for GET /options')
+    parser.add_argument('--max-in-flight', type=int, default=256)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--graph-latency', type=float, default=0.05, help='Mean mock Graph latency in seconds')
+    parser.add_argument('--graph-jitter', type=float, default=0.01)
+    parser.add_argument('--graph-throttle-rps', type=float, default=0, help='Mock Graph requests per second before 429')
+    parser.add_argument('--messages', type=int, default=200, help='Messages per mock mailbox')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_test_interact.json')
+    args = parser.parse_args()
+
+    tenant = Tenant(users=5, messages=args.messages, seed=args.seed)
+    graph = MockGraph(tenant, args.graph_latency, args.graph_jitter, Throttle(args.graph_throttle_rps, seed=args.seed))
+    graph_server = start_server(graph)
+    graph_url = f"http://127.0.0.1:{graph_server.server_address[1]}/v1.0"
+    mix = parse_mix(args.mix)
+
+    report = []
+    for name in args.configs.split(','):
+        port = free_port()
+        workdir = tempfile.mkdtemp(prefix='load_test_')
+        try:
+            process = start_app(CONFIGS[name], port, graph_url, workdir)
+        except Exception as e:
+            print(f"{name}: skipped ({e})")
+            report.append({'config': name, 'error': str(e)})
+            continue
+        try:
+            for rate in [float(value) for value in args.rates.split(',')]:
+                monitor = ResourceMonitor(process.pid)
+                monitor.start()
+                result = run_load(f"http://127.0.0.1:{port}", rate, args.duration, mix, args.max_in_flight, args.timeout, args.seed)
+                monitor.stopped.set()
+                monitor.join()
+                result = dict(result, config=name, **monitor.summary())
+                report.append(result)
+                print(f"{name:<18} offered={rate:>6.1f} rps  throughput={result['throughput_rps']:>7.2f} rps  "
+                      f"p50/p95/p99={result['p50_ms']}/{result['p95_ms']}/{result['p99_ms']} ms  "
+                      f"errors={result['error_rate']:.1%}  cpu avg/max={result['cpu_percent_avg']}/{result['cpu_percent_max']}%  "
+                      f"rss={result['rss_mb_max']} MB")
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    graph_server.shutdown()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': time.time(), 'config': vars(args), 'graph': dict(graph.stats), 'results': report}, f, indent=4)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,990 @@
+import re
+import io
+import json
+import base64
+import time
+import uuid
+import random
+import argparse
+import zipfile
+import textwrap
+import threading
+import collections
+import urllib.error
+import urllib.request
+from collections.abc import Iterator
+from urllib.parse import urlsplit, parse_qs, urlencode, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# graph.py reads this hard-coded user, so the first synthetic user gets the same id
+DEFAULT_USER_ID = '7e00cad8-6276-4c23-89f7-d3ea1c5fd1b8'
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 20
+
+WORDS = ['invoice', 'report', 'review', 'budget', 'roadmap', 'lunch', 'launch', 'contract', 'hiring', 'offsite',
+         'release', 'security', 'training', 'forecast', 'customer', 'design', 'migration', 'planning']
+FIRST_NAMES = ['Adele', 'Alex', 'Diego', 'Grady', 'Henrietta', 'Isaiah', 'Johanna', 'Joni', 'Lee', 'Lidia',
+               'Lynne', 'Megan', 'Miriam', 'Nestor', 'Patti', 'Pradeep']
+# File types in the synthetic document libraries; .png files have no text to extract
+MIME_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.pdf': 'application/pdf',
+    '.txt': 'text/plain',
+    '.md': 'text/markdown',
+    '.png': 'image/png',
+}
+ATTACHMENT_TYPES = [('.pdf', 'application/pdf'), ('.zip', 'application/zip'), ('.jpg', 'image/jpeg'),
+                    ('.xlsx', MIME_TYPES['.xlsx'])]
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+LAST_NAMES = ['Vance', 'Wilber', 'Siciliani', 'Archie', 'Mueller', 'Langer', 'Lauer', 'Sherman', 'Gu', 'Holloway',
+              'Robbins', 'Bowen', 'Graham', 'Wilke', 'Fernandez', 'Gupta']
+
+class Tenant:
+    # A deterministic synthetic tenant; mailboxes and sites are generated on first access
+    def __init__(self, users=10, messages=100, events=50, contacts=25, sites=5, lists=3, items=50,
+                 domain='contoso.com', seed=0, documents=20, document_kb=64, attachment_kb=256):
+        self.counts = {'messages': messages, 'events': events, 'contacts': contacts, 'lists': lists, 'items': items,
+                       'documents': documents}
+        self.document_kb = document_kb
+        self.attachment_kb = attachment_kb
+        self.domain = domain
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.mailboxes = {}
+        self.sent = []
+        self.users = [self.make_user(index) for index in range(users)]
+        self.users_by_id = {user['id']: user for user in self.users}
+        for user in self.users:
+            self.users_by_id[user['userPrincipalName'].lower()] = user
+        self.sites = [self.make_site(index) for index in range(sites)]
+        self.sites_by_id = {site['id']: site for site in self.sites}
+        self.site_lists = {}
+        self.list_items = {}
+        self.drives = {}
+        self.drive_files = {}
+        self.file_contents = {}
+        self.drafts = {}
+
+    def rng(self, *parts):
+        return random.Random(':'.join(str(part) for part in (self.seed,) + parts))
+
+    def make_id(self, *parts):
+        return str(uuid.UUID(int=self.rng('id', *parts).getrandbits(128)))
+
+    def make_user(self, index):
+        rng = self.rng('user', index)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        address = f"{first.lower()}.{last.lower()}{index}@{self.domain}"
+        return {
+            'id': DEFAULT_USER_ID if index == 0 else self.make_id('user', index),
+            'displayName': f"{first} {last}",
+            'mail': address,
+            'userPrincipalName': address,
+            'jobTitle': rng.choice(['Engineer', 'Manager', 'Designer', 'Analyst', 'Director']),
+        }
+
+    def address(self, rng):
+        user = rng.choice(self.users)
+        return {'emailAddress': {'name': user['displayName'], 'address': user['mail']}}
+
+    def timestamp(self, rng, days=30):
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1704067200 + rng.randrange(days * 86400)))
+
+    def make_message(self, user_index, index):
+        rng = self.rng('message', user_index, index)
+        subject = f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} #{index}"
+        return {
+            'id': self.make_id('message', user_index, index),
+            'subject': subject,
+            'bodyPreview': f"Notes about the {subject.lower()}.",
+            'body': {'contentType': 'text', 'content': f"Notes about the {subject.lower()}. " * rng.randint(1, 20)},
+            'from': self.address(rng),
+            'toRecipients': [self.address(rng) for _ in range(rng.randint(1, 3))],
+            'ccRecipients': [self.address(rng) for _ in range(rng.randint(0, 2))],
+            'receivedDateTime': self.timestamp(rng),
+            'isRead': rng.random() < 0.6,
+            'importance': rng.choice(['low', 'normal', 'normal', 'high']),
+            'hasAttachments': rng.random() < 0.2,
+            'categories': rng.sample(['Blue category', 'Red category', 'Green category'], rng.randint(0, 2)),
+        }
+
+    def attachments(self, message):
+        # Attachment metadata of a message; content is generated in chunks when it is read
+        if not message.get('hasAttachments'):
+            return []
+        rng = self.rng('attachments', message['id'])
+        attachments = []
+        for i in range(rng.randint(1, 3)):
+            extension, content_type = rng.choice(ATTACHMENT_TYPES)
+            attachments.append({
+                '@odata.type': '#microsoft.graph.fileAttachment',
+                'id': self.make_id('attachment', message['id'], i),
+                'name': f"{rng.choice(WORDS).title()} {rng.choice(WORDS)}{extension}",
+                'contentType': content_type,
+                'size': int(rng.uniform(0.25, 1.75) * self.attachment_kb * 1024),
+                'isInline': False,
+                'lastModifiedDateTime': message.get('receivedDateTime'),
+            })
+        return attachments
+
+    def attachment_content(self, attachment):
+        # The same bytes on every read, without holding the whole attachment in memory
+        for offset in range(0, attachment['size'], ATTACHMENT_CHUNK_SIZE):
+            size = min(ATTACHMENT_CHUNK_SIZE, attachment['size'] - offset)
+            yield self.rng('content', attachment['id'], offset).randbytes(size)
+
+    def make_event(self, user_index, index):
+        rng = self.rng('event', user_index, index)
+        start = self.timestamp(rng, days=60)[:-1] + '.0000000'
+        end_hour = int(start[11:13]) + 1
+        return {
+            'id': self.make_id('event', user_index, index),
+            'subject': f"{rng.choice(WORDS).title()} sync",
+            'start': {'dateTime': start, 'timeZone': 'UTC'},
+            'end': {'dateTime': f"{start[:11]}{min(end_hour, 23):02d}{start[13:]}", 'timeZone': 'UTC'},
+            'location': {'displayName': f"Room {rng.randrange(1, 40)}"},
+            'organizer': self.address(rng),
+            'attendees': [dict(self.address(rng), type='required') for _ in range(rng.randint(1, 5))],
+        }
+
+    def make_contact(self, user_index, index):
+        rng = self.rng('contact', user_index, index)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return {
+            'id': self.make_id('contact', user_index, index),
+            'displayName': f"{first} {last}",
+            'emailAddresses': [{'name': f"{first} {last}", 'address': f"{first.lower()}@fabrikam.com"}],
+            'companyName': 'Fabrikam',
+            'businessPhones': [f"+1 425 555 {rng.randrange(10000):04d}"],
+        }
+
+    def mailbox(self, user):
+        # Messages are kept newest first, like an inbox ordered by receivedDateTime DESC
+        with self.lock:
+            if user['id'] not in self.mailboxes:
+                index = self.users.index(user)
+                messages = [self.make_message(index, i) for i in range(self.counts['messages'])]
+                messages.sort(key=lambda message: message['receivedDateTime'], reverse=True)
+                self.mailboxes[user['id']] = {
+                    'messages': messages,
+                    # Delta tokens are positions in this log of message ids
+                    'log': [message['id'] for message in reversed(messages)],
+                    'events': [self.make_event(index, i) for i in range(self.counts['events'])],
+                    'contacts': [self.make_contact(index, i) for i in range(self.counts['contacts'])],
+                }
+            return self.mailboxes[user['id']]
+
+    def deliver(self, user, message):
+        mailbox = self.mailbox(user)
+        with self.lock:
+            mailbox['messages'].insert(0, message)
+            mailbox['log'].append(message['id'])
+
+    def make_site(self, index):
+        rng = self.rng('site', index)
+        name = f"{rng.choice(WORDS).title()} {rng.choice(['Team', 'Hub', 'Project', 'Portal'])} {index}"
+        return {
+            'id': f"contoso.sharepoint.com,{self.make_id('site', index)},{self.make_id('web', index)}",
+            'displayName': name,
+            'name': name.replace(' ', ''),
+            'webUrl': f"https://contoso.sharepoint.com/sites/{name.replace(' ', '')}",
+            'lastModifiedDateTime': self.timestamp(rng),
+        }
+
+    def lists(self, site):
+        with self.lock:
+            if site['id'] not in self.site_lists:
+                index = self.sites.index(site)
+                self.site_lists[site['id']] = [{
+                    'id': self.make_id('list', index, i),
+                    'displayName': f"{self.rng('list', index, i).choice(WORDS).title()} tracker",
+                    'name': f"list{i}",
+                    'lastModifiedDateTime': self.timestamp(self.rng('list', index, i)),
+                    'list': {'template': 'genericList'},
+                } for i in range(self.counts['lists'])]
+            return self.site_lists[site['id']]
+
+    def items(self, site, lst):
+        with self.lock:
+            if lst['id'] not in self.list_items:
+                self.list_items[lst['id']] = []
+                for i in range(self.counts['items']):
+                    rng = self.rng('item', lst['id'], i)
+                    self.list_items[lst['id']].append({
+                        'id': str(i + 1),
+                        'lastModifiedDateTime': self.timestamp(rng),
+                        'fields': {
+                            'Title': f"{rng.choice(WORDS).title()} {rng.choice(WORDS)}",
+                            'Status': rng.choice(['Not started', 'In progress', 'Done']),
+                            'Owner': rng.choice(self.users)['displayName'],
+                        },
+                    })
+            return self.list_items[lst['id']]
+
+    def drive(self, kind, index):
+        drive_id = f"b!{self.make_id('drive', kind, index).replace('-', '')}"
+        with self.lock:
+            return self.drives.setdefault(drive_id, {
+                'id': drive_id,
+                'name': 'Documents' if kind == 'site' else 'OneDrive',
+                'driveType': 'documentLibrary' if kind == 'site' else 'business',
+            })
+
+    def files(self, drive_id):
+        # A folder and its files; file content is generated once and served from memory
+        with self.lock:
+            if drive_id not in self.drive_files:
+                rng = self.rng('drive', drive_id)
+                folder_id = self.make_id('folder', drive_id)
+                entries = [{'id': folder_id, 'name': 'Shared', 'folder': {'childCount': self.counts['documents']},
+                            'parentReference': {'driveId': drive_id}}]
+                for i in range(self.counts['documents']):
+                    extension = rng.choice(list(MIME_TYPES))
+                    item_id = self.make_id('file', drive_id, i)
+                    content = make_document(rng, extension, int(rng.uniform(0.25, 1.75) * self.document_kb * 1024))
+                    self.file_contents[item_id] = (MIME_TYPES[extension], content)
+                    name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}{extension}"
+                    entries.append({
+                        'id': item_id,
+                        'name': name,
+                        'size': len(content),
+                        'file': {'mimeType': MIME_TYPES[extension]},
+                        'webUrl': f"https://contoso.sharepoint.com/Shared/{quote(name)}",
+                        'lastModifiedDateTime': self.timestamp(rng),
+                        'parentReference': {'driveId': drive_id, 'id': folder_id},
+                    })
+                self.drive_files[drive_id] = entries
+            return self.drive_files[drive_id]
+
+def document_paragraphs(rng, size):
+    paragraphs, length = [], 0
+    while length < size:
+        paragraph = ' '.join(f"The {rng.choice(WORDS)} {rng.choice(WORDS)} is {rng.choice(['on track', 'delayed', 'approved', 'under review'])}."
+                             for _ in range(rng.randint(2, 8)))
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return paragraphs
+
+def office_package(parts):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>')
+        for name, xml in parts.items():
+            package.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>' + xml)
+    return buffer.getvalue()
+
+def make_pdf(paragraphs):
+    # A minimal PDF with one text line per wrapped line, 50 lines per page
+    lines = [line for paragraph in paragraphs for line in textwrap.wrap(paragraph, 90) + ['']]
+    pages = [lines[i:i + 50] for i in range(0, len(lines), 50)] or [[]]
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for page in pages:
+        text = ' '.join('(' + line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ') Tj T*' for line in page)
+        stream = f"BT /F1 10 Tf 14 TL 50 780 Td {text} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    output, offsets = b'%PDF-1.4\n', []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    output += ''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    return output
+
+def make_document(rng, extension, size):
+    if extension == '.png':
+        return b'\x89PNG\r\n\x1a\n' + rng.randbytes(size)
+    paragraphs = document_paragraphs(rng, size)
+    if extension in ('.txt', '.md'):
+        return '\n\n'.join(paragraphs).encode('utf-8')
+    if extension == '.pdf':
+        return make_pdf(paragraphs)
+    if extension == '.docx':
+        body = ''.join(f"<w:p><w:r><w:t>{paragraph}</w:t></w:r></w:p>" for paragraph in paragraphs)
+        return office_package({'word/document.xml': f'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>'})
+    if extension == '.pptx':
+        slides = [paragraphs[i:i + 5] for i in range(0, len(paragraphs), 5)]
+        return office_package({
+            f"ppt/slides/slide{number}.xml": '<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+            'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"><p:cSld><p:spTree><p:sp><p:txBody>'
+            + ''.join(f"<a:p><a:r><a:t>{paragraph}</a:t></a:r></a:p>" for paragraph in slide) + '</p:txBody></p:sp></p:spTree></p:cSld></p:sld>'
+            for number, slide in enumerate(slides, 1)
+        })
+    if extension == '.xlsx':
+        strings = ''.join(f"<si><t>{paragraph}</t></si>" for paragraph in paragraphs)
+        return office_package({'xl/sharedStrings.xml': f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">{strings}</sst>'})
+    raise ValueError(f"Unknown document type {extension}")
+
+class Throttle:
+    # Per-client token bucket plus an optional random 429 rate
+    def __init__(self, requests_per_second=0, random_rate=0.0, retry_after=1, seed=0):
+        self.requests_per_second = requests_per_second
+        self.random_rate = random_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def allow(self, client):
+        with self.lock:
+            if self.random_rate and self.rng.random() < self.random_rate:
+                return False
+            if not self.requests_per_second:
+                return True
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(client, (self.requests_per_second, now))
+            tokens = min(self.requests_per_second, tokens + (now - updated) * self.requests_per_second)
+            if tokens < 1:
+                self.buckets[client] = (tokens, now)
+                return False
+            self.buckets[client] = (tokens - 1, now)
+            return True
+
+class SendLimit:
+    # Messages each mailbox may send in any sliding minute, like the Exchange Online sending limit
+    def __init__(self, per_minute=0, retry_after=1):
+        self.per_minute = per_minute
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.windows = {}
+
+    def allow(self, sender):
+        if not self.per_minute:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            window = self.windows.setdefault(sender, collections.deque())
+            while window and window[0] <= now - 60:
+                window.popleft()
+            if len(window) >= self.per_minute:
+                return False
+            window.append(now)
+            return True
+
+class GraphError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+def select_fields(value, select):
+    if not select:
+        return value
+    fields = {field.strip() for field in select.split(',')}
+    # Like Graph, the id and the type of derived resources such as attachments are always returned
+    return {key: item for key, item in value.items() if key in fields or key in ('id', '@odata.type')}
+
+class MockGraph:
+    def __init__(self, tenant, latency=0.0, jitter=0.0, throttle=None, fixtures=None, max_page_size=MAX_PAGE_SIZE, send_limit=None):
+        self.tenant = tenant
+        self.send_limit = send_limit or SendLimit()
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle or Throttle()
+        self.fixtures = fixtures or {}
+        self.max_page_size = max_page_size
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'batch_requests': 0, 'notifications': 0, 'download_bytes': 0,
+                      'upload_bytes': 0, 'send_limited': 0}
+        self.upload_sessions = {}
+        self.subscriptions = {}
+        self.routes = [
+            ('GET', r'/users', self.list_users),
+            ('GET', r'/users/(?P<user>[^/]+)', self.get_user),
+            ('GET', r'/users/(?P<user>[^/]+)/(?:mailFolders/(?P<folder>[^/]+)/)?messages', self.list_messages),
+            ('GET', r'/users/(?P<user>[^/]+)/(?:mailFolders/(?P<folder>[^/]+)/)?messages/delta', self.messages_delta),
+            ('GET', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)', self.get_message),
+            ('GET', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)/attachments', self.list_attachments),
+            ('GET', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)/attachments/(?P<attachment_id>[^/]+)',
+             self.get_attachment),
+            ('GET', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)/attachments/(?P<attachment_id>[^/]+)/\$value',
+             self.attachment_value),
+            ('GET', r'/users/(?P<user>[^/]+)/events/(?P<event_id>[^/]+)', self.get_event),
+            ('GET', r'/users/(?P<user>[^/]+)/(?:calendar/)?events', self.list_events),
+            ('GET', r'/users/(?P<user>[^/]+)/contacts', self.list_contacts),
+            ('POST', r'/users/(?P<user>[^/]+)/sendMail', self.send_mail),
+            ('POST', r'/users/(?P<user>[^/]+)/messages', self.create_draft),
+            ('POST', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)/attachments', self.add_attachment),
+            ('POST', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)/attachments/createUploadSession',
+             self.create_upload_session),
+            ('PUT', r'/_mock/upload/(?P<session_id>[^/]+)', self.upload_chunk),
+            ('POST', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)/send', self.send_draft),
+            ('DELETE', r'/users/(?P<user>[^/]+)/messages/(?P<message_id>[^/]+)', self.delete_draft),
+            ('GET', r'/sites', self.list_sites),
+            ('GET', r'/sites/(?P<site>[^/]+)', self.get_site),
+            ('GET', r'/sites/(?P<site>[^/]+)/lists', self.list_lists),
+            ('GET', r'/sites/(?P<site>[^/]+)/lists/(?P<list_id>[^/]+)', self.get_list),
+            ('GET', r'/sites/(?P<site>[^/]+)/lists/(?P<list_id>[^/]+)/items', self.list_items),
+            ('GET', r'/sites/(?P<site>[^/]+)/drives', self.list_drives),
+            ('GET', r'/users/(?P<user>[^/]+)/drive', self.get_user_drive),
+            ('GET', r'/drives/(?P<drive>[^/]+)/(?:items/)?root/delta', self.drive_delta),
+            ('GET', r'/drives/(?P<drive>[^/]+)/items/(?P<item_id>[^/]+)/content', self.drive_item_content),
+            ('GET', r'/_mock/download/(?P<item_id>[^/]+)', self.download),
+            ('POST', r'/\$batch', self.batch),
+            ('POST', r'/search/query', self.search),
+            ('POST', r'/subscriptions', self.create_subscription),
+            ('PATCH', r'/subscriptions/(?P<subscription_id>[^/]+)', self.renew_subscription),
+            ('DELETE', r'/subscriptions/(?P<subscription_id>[^/]+)', self.delete_subscription),
+        ]
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def handle(self, method, url, body=None, client='local', base_url='', request_headers=None):
+        # Returns (status, headers, body) for one request, without the simulated latency
+        self.count('requests')
+        parts = urlsplit(url)
+        path = re.sub(r'^/(v1\.0|beta)', '', parts.path).rstrip('/') or '/'
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        fixture = self.fixtures.get(f"{method} {path}")
+        if fixture is not None:
+            return 200, {}, fixture
+        if not self.throttle.allow(client):
+            self.count('throttled')
+            return 429, {'Retry-After': str(self.throttle.retry_after)}, error_body(
+                'TooManyRequests', 'Application is over its MailboxConcurrency limit.')
+
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                try:
+                    return handler(query=query, body=body, base_url=base_url, path=path, request_headers=request_headers or {},
+                                   **match.groupdict())
+                except GraphError as e:
+                    self.count('errors')
+                    return e.status, {}, error_body(e.code, str(e))
+        self.count('errors')
+        return 400, {}, error_body('BadRequest', f"Resource not found for the segment '{path}'.")
+
+    def page(self, values, query, base_url, path, select=True):
+        # $top/$skip paging with @odata.nextLink, like Graph collection responses
+        top = min(int(query.get('$top', DEFAULT_PAGE_SIZE)), self.max_page_size)
+        skip = int(query.get('$skip', 0))
+        page = values[skip:skip + top]
+        response = {'value': [select_fields(value, query.get('$select')) if select else value for value in page]}
+        if query.get('$count') == 'true':
+            response['@odata.count'] = len(values)
+        if skip + top < len(values):
+            response['@odata.nextLink'] = f"{base_url}{path}?{urlencode(dict(query, **{'$skip': skip + top}))}"
+        return 200, {}, response
+
+    def user(self, user):
+        found = self.tenant.users_by_id.get(user.lower()) or self.tenant.users_by_id.get(user)
+        if not found:
+            raise GraphError(404, 'ErrorInvalidUser', f"The requested user '{user}' is invalid.")
+        return found
+
+    def list_users(self, query, base_url, path, **kwargs):
+        return self.page(self.tenant.users, query, base_url, path)
+
+    def get_user(self, user, query, **kwargs):
+        return 200, {}, select_fields(self.user(user), query.get('$select'))
+
+    def list_messages(self, user, query, base_url, path, folder=None, **kwargs):
+        if folder and folder.lower() != 'inbox':
+            raise GraphError(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+        messages = self.tenant.mailbox(self.user(user))['messages']
+        if query.get('$orderby', '').lower().startswith('receiveddatetime asc'):
+            messages = list(reversed(messages))
+        if query.get('$search'):
+            # Every term must appear in the subject, preview or sender, like a KQL search of the mailbox
+            terms = re.findall(r'\w+', query['$search'].lower())
+            messages = [message for message in messages
+                        if all(term in ' '.join([message['subject'], message.get('bodyPreview', ''),
+                                                 message['from']['emailAddress']['address']]).lower() for term in terms)]
+        return self.page(messages, query, base_url, path)
+
+    def messages_delta(self, user, query, base_url, path, **kwargs):
+        # A delta round returns messages added since the token, then a deltaLink for the next round
+        mailbox = self.tenant.mailbox(self.user(user))
+        by_id = {message['id']: message for message in mailbox['messages']}
+        start = int(query.get('$deltatoken', 0))
+        skip = int(query.get('$skiptoken', start))
+        top = min(int(query.get('$top', DEFAULT_PAGE_SIZE)), self.max_page_size)
+        ids = mailbox['log'][skip:skip + top]
+        response = {'value': [select_fields(by_id[message_id], query.get('$select')) for message_id in ids]}
+        if skip + top < len(mailbox['log']):
+            response['@odata.nextLink'] = f"{base_url}{path}?{urlencode({'$skiptoken': skip + top, '$top': top})}"
+        else:
+            response['@odata.deltaLink'] = f"{base_url}{path}?{urlencode({'$deltatoken': skip + len(ids)})}"
+        return 200, {}, response
+
+    def message(self, user, message_id):
+        message = next((message for message in self.tenant.mailbox(self.user(user))['messages'] if message['id'] == message_id), None)
+        if message is None:
+            raise GraphError(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+        return message
+
+    def get_message(self, user, message_id, query, **kwargs):
+        return 200, {}, select_fields(self.message(user, message_id), query.get('$select'))
+
+    def attachment(self, user, message_id, attachment_id):
+        attachment = next((attachment for attachment in self.tenant.attachments(self.message(user, message_id))
+                           if attachment['id'] == attachment_id), None)
+        if attachment is None:
+            raise GraphError(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+        return attachment
+
+    def with_content_bytes(self, attachment):
+        # Like Graph, file attachments carry their whole content as base64 unless $select leaves it out
+        content = b''.join(self.tenant.attachment_content(attachment))
+        self.count('download_bytes', len(content))
+        return dict(attachment, contentBytes=base64.b64encode(content).decode('ascii'))
+
+    def list_attachments(self, user, message_id, query, base_url, path, **kwargs):
+        attachments = self.tenant.attachments(self.message(user, message_id))
+        if not query.get('$select'):
+            attachments = [self.with_content_bytes(attachment) for attachment in attachments]
+        return self.page(attachments, query, base_url, path)
+
+    def get_attachment(self, user, message_id, attachment_id, query, **kwargs):
+        attachment = self.attachment(user, message_id, attachment_id)
+        if query.get('$select'):
+            return 200, {}, select_fields(attachment, query['$select'])
+        return 200, {}, self.with_content_bytes(attachment)
+
+    def attachment_value(self, user, message_id, attachment_id, **kwargs):
+        # Raw content, sent in chunks as it is generated
+        attachment = self.attachment(user, message_id, attachment_id)
+        self.count('download_bytes', attachment['size'])
+        return 200, {'Content-Type': attachment['contentType'], 'Content-Length': str(attachment['size'])}, \
+            self.tenant.attachment_content(attachment)
+
+    def get_event(self, user, event_id, query, **kwargs):
+        event = next((event for event in self.tenant.mailbox(self.user(user))['events'] if event['id'] == event_id), None)
+        if event is None:
+            raise GraphError(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+        return 200, {}, select_fields(event, query.get('$select'))
+
+    def list_events(self, user, query, base_url, path, **kwargs):
+        events = self.tenant.mailbox(self.user(user))['events']
+        if 'desc' in query.get('$orderby', '').lower():
+            events = sorted(events, key=lambda event: event['start']['dateTime'], reverse=True)
+        return self.page(events, query, base_url, path)
+
+    def list_contacts(self, user, query, base_url, path, **kwargs):
+        return self.page(self.tenant.mailbox(self.user(user))['contacts'], query, base_url, path)
+
+    def send_mail(self, user, body, **kwargs):
+        sender = self.user(user)
+        message = (body or {}).get('message')
+        if not message or not message.get('toRecipients'):
+            raise GraphError(400, 'ErrorInvalidRecipients', 'At least one recipient is not valid.')
+        if not self.send_limit.allow(sender['id']):
+            return self.send_limited()
+        attachments = [attachment_metadata(attachment) for attachment in message.get('attachments', [])]
+        self.deliver(sender, dict(message, attachments=attachments))
+        return 202, {}, None
+
+    def send_limited(self):
+        self.count('send_limited')
+        return 429, {'Retry-After': str(self.send_limit.retry_after)}, error_body(
+            'ErrorExceededMessageLimit', 'Cannot send mail. The message submission rate for this mailbox has been exceeded.')
+
+    def create_draft(self, user, body, **kwargs):
+        sender = self.user(user)
+        draft = dict(body or {}, id=str(uuid.uuid4()), isDraft=True)
+        draft['attachments'] = [attachment_metadata(attachment) for attachment in draft.get('attachments', [])]
+        with self.lock:
+            self.tenant.drafts[draft['id']] = (sender['id'], draft)
+        return 201, {}, draft
+
+    def draft(self, user, message_id):
+        sender = self.user(user)
+        with self.lock:
+            owner, draft = self.tenant.drafts.get(message_id, (None, None))
+        if owner != sender['id']:
+            raise GraphError(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+        return draft
+
+    def add_attachment(self, user, message_id, body, **kwargs):
+        draft = self.draft(user, message_id)
+        attachment = attachment_metadata(body or {})
+        if attachment['size'] > 3 * 1024 * 1024:
+            raise GraphError(413, 'ErrorRequestEntityTooLarge', 'Attachments over 3 MB need an upload session.')
+        with self.lock:
+            draft['attachments'].append(attachment)
+        return 201, {}, attachment
+
+    def create_upload_session(self, user, message_id, body, base_url, **kwargs):
+        self.draft(user, message_id)
+        item = (body or {}).get('AttachmentItem') or {}
+        if item.get('attachmentType') != 'file' or not item.get('name') or not item.get('size'):
+            raise GraphError(400, 'ErrorInvalidRequest', 'AttachmentItem needs attachmentType file, a name and a size.')
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.upload_sessions[session_id] = {'user': user, 'message_id': message_id, 'name': item['name'],
+                                                'contentType': item.get('contentType'), 'size': int(item['size']), 'received': 0}
+        # The upload URL is pre-authenticated, so chunks are sent without the Authorization header
+        return 201, {}, {'uploadUrl': f"{base_url}/_mock/upload/{session_id}", 'nextExpectedRanges': ['0-'],
+                         'expirationDateTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 900))}
+
+    def upload_chunk(self, session_id, body, request_headers, **kwargs):
+        # Each chunk must continue where the last one ended, and all but the last must be a multiple of 320 KiB
+        with self.lock:
+            session = self.upload_sessions.get(session_id)
+        if session is None:
+            raise GraphError(404, 'ErrorItemNotFound', 'The upload session was not found or has expired.')
+        if request_headers.get('Authorization'):
+            raise GraphError(401, 'InvalidAuthenticationToken', 'Upload URLs do not accept an Authorization header.')
+        match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', request_headers.get('Content-Range', ''))
+        chunk = body if isinstance(body, bytes) else b''
+        if not match:
+            raise GraphError(400, 'InvalidRange', 'A Content-Range header is required.')
+        start, end, total = (int(value) for value in match.groups())
+        if start != session['received'] or total != session['size'] or end - start + 1 != len(chunk):
+            raise GraphError(416, 'InvalidRange', f"Expected bytes {session['received']}- of {session['size']}.")
+        if end + 1 < total and len(chunk) % (320 * 1024):
+            raise GraphError(400, 'InvalidRange', 'Chunks must be a multiple of 320 KiB.')
+        self.count('upload_bytes', len(chunk))
+        with self.lock:
+            session['received'] = end + 1
+            if session['received'] < total:
+                return 200, {}, {'nextExpectedRanges': [f"{session['received']}-"]}
+            del self.upload_sessions[session_id]
+        draft = self.draft(session['user'], session['message_id'])
+        with self.lock:
+            draft['attachments'].append({'name': session['name'], 'contentType': session['contentType'], 'size': total})
+        return 201, {}, None
+
+    def send_draft(self, user, message_id, **kwargs):
+        sender = self.user(user)
+        draft = self.draft(user, message_id)
+        if not draft.get('toRecipients'):
+            raise GraphError(400, 'ErrorInvalidRecipients', 'At least one recipient is not valid.')
+        if not self.send_limit.allow(sender['id']):
+            return self.send_limited()
+        with self.lock:
+            del self.tenant.drafts[message_id]
+        self.deliver(sender, {key: value for key, value in draft.items() if key not in ('id', 'isDraft')})
+        return 202, {}, None
+
+    def delete_draft(self, user, message_id, **kwargs):
+        self.draft(user, message_id)
+        with self.lock:
+            del self.tenant.drafts[message_id]
+        return 204, {}, None
+
+    def deliver(self, sender, message):
+        sent = dict(message, id=str(uuid.uuid4()), receivedDateTime=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    isRead=False, hasAttachments=bool(message.get('attachments')),
+                    **{'from': {'emailAddress': {'name': sender['displayName'], 'address': sender['mail']}}})
+        self.tenant.sent.append(sent)
+        # Recipients inside the tenant receive the message, so it shows up in their inbox and delta
+        for recipient in message.get('toRecipients', []) + message.get('ccRecipients', []):
+            address = recipient.get('emailAddress', {}).get('address', '').lower()
+            if address in self.tenant.users_by_id:
+                recipient_user = self.tenant.users_by_id[address]
+                self.tenant.deliver(recipient_user, sent)
+                self.notify_message(recipient_user, 'created', sent['id'])
+
+    def create_subscription(self, body, **kwargs):
+        # Like Graph, the notification URL must echo a validation token before the subscription is created
+        body = body or {}
+        token = str(uuid.uuid4())
+        try:
+            with urllib.request.urlopen(urllib.request.Request(
+                    f"{body.get('notificationUrl')}?validationToken={quote(token)}", data=b'', method='POST'), timeout=10) as response:
+                echoed = response.read().decode('utf-8')
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise GraphError(400, 'InvalidRequest', f"Subscription validation request failed: {e}")
+        if echoed != token:
+            raise GraphError(400, 'InvalidRequest', 'Subscription validation request failed. Response must exactly match validationToken query parameter.')
+        subscription = dict(body, id=str(uuid.uuid4()))
+        with self.lock:
+            self.subscriptions[subscription['id']] = subscription
+        return 201, {}, subscription
+
+    def renew_subscription(self, subscription_id, body, **kwargs):
+        with self.lock:
+            if subscription_id not in self.subscriptions:
+                raise GraphError(404, 'ResourceNotFound', 'The object was not found.')
+            self.subscriptions[subscription_id].update(expirationDateTime=(body or {}).get('expirationDateTime'))
+            return 200, {}, self.subscriptions[subscription_id]
+
+    def delete_subscription(self, subscription_id, **kwargs):
+        with self.lock:
+            if self.subscriptions.pop(subscription_id, None) is None:
+                raise GraphError(404, 'ResourceNotFound', 'The object was not found.')
+        return 204, {}, None
+
+    def notify_message(self, user, change_type, message_id):
+        # Deliver change notifications to the user's message subscribers in the background, as Graph does
+        with self.lock:
+            subscriptions = [subscription for subscription in self.subscriptions.values()
+                             if subscription.get('resource', '').lower().startswith(f"users/{user['id']}/".lower())
+                             and 'messages' in subscription.get('resource', '').lower()
+                             and change_type in subscription.get('changeType', '')]
+        for subscription in subscriptions:
+            notification = {'value': [{
+                'subscriptionId': subscription['id'],
+                'clientState': subscription.get('clientState'),
+                'changeType': change_type,
+                'resource': f"Users/{user['id']}/Messages/{message_id}",
+                'resourceData': {'@odata.type': '#Microsoft.Graph.Message', 'id': message_id},
+                'tenantId': 'mock',
+            }]}
+            threading.Thread(target=self.post_notification, args=(subscription['notificationUrl'], notification), daemon=True).start()
+
+    def post_notification(self, url, notification):
+        request = urllib.request.Request(url, data=json.dumps(notification).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=10).read()
+            self.count('notifications')
+        except (urllib.error.URLError, OSError):
+            self.count('errors')
+
+    def site(self, site):
+        if site not in self.tenant.sites_by_id:
+            raise GraphError(404, 'itemNotFound', 'Requested site could not be found')
+        return self.tenant.sites_by_id[site]
+
+    def list_sites(self, query, base_url, path, **kwargs):
+        sites = self.tenant.sites
+        search = query.get('search', query.get('$search', '')).strip('"').lower()
+        if search and search != '*':
+            sites = [site for site in sites if search in site['displayName'].lower()]
+        return self.page(sites, query, base_url, path)
+
+    def get_site(self, site, query, **kwargs):
+        return 200, {}, select_fields(self.site(site), query.get('$select'))
+
+    def list_lists(self, site, query, base_url, path, **kwargs):
+        return self.page(self.tenant.lists(self.site(site)), query, base_url, path)
+
+    def get_list(self, site, list_id, query, **kwargs):
+        lst = next((candidate for candidate in self.tenant.lists(self.site(site)) if candidate['id'] == list_id), None)
+        if not lst:
+            raise GraphError(404, 'itemNotFound', 'List not found')
+        return 200, {}, select_fields(lst, query.get('$select'))
+
+    def list_items(self, site, list_id, query, base_url, path, **kwargs):
+        found = self.site(site)
+        lst = next((candidate for candidate in self.tenant.lists(found) if candidate['id'] == list_id), None)
+        if not lst:
+            raise GraphError(404, 'itemNotFound', 'List not found')
+        items = self.tenant.items(found, lst)
+        # Like Graph, item fields are only returned with $expand=fields
+        if 'fields' not in query.get('$expand', ''):
+            items = [{key: value for key, value in item.items() if key != 'fields'} for item in items]
+        return self.page(items, query, base_url, path)
+
+    def list_drives(self, site, query, base_url, path, **kwargs):
+        return self.page([self.tenant.drive('site', self.tenant.sites.index(self.site(site)))], query, base_url, path)
+
+    def get_user_drive(self, user, query, **kwargs):
+        return 200, {}, select_fields(self.tenant.drive('user', self.tenant.users.index(self.user(user))), query.get('$select'))
+
+    def drive_delta(self, drive, query, base_url, path, **kwargs):
+        if drive not in self.tenant.drives:
+            raise GraphError(404, 'itemNotFound', 'The drive could not be found')
+        status, headers, response = self.page(self.tenant.files(drive), dict({'$top': '200'}, **query), base_url, path)
+        # The last page carries the link for the next delta round instead of a next link
+        if '@odata.nextLink' not in response:
+            response['@odata.deltaLink'] = f"{base_url}{path}?token={len(self.tenant.files(drive))}"
+        return status, headers, response
+
+    def drive_item_content(self, drive, item_id, base_url, **kwargs):
+        # Like Graph, content is a redirect to a short-lived pre-authenticated download URL
+        if item_id not in self.tenant.file_contents:
+            raise GraphError(404, 'itemNotFound', 'The resource could not be found')
+        return 302, {'Location': f"{base_url}/_mock/download/{item_id}"}, None
+
+    def download(self, item_id, **kwargs):
+        if item_id not in self.tenant.file_contents:
+            raise GraphError(404, 'itemNotFound', 'The resource could not be found')
+        content_type, content = self.tenant.file_contents[item_id]
+        self.count('download_bytes', len(content))
+        return 200, {'Content-Type': content_type}, content
+
+    def search(self, body, **kwargs):
+        # Matches every query term against the names and list item fields of all sites
+        requests = (body or {}).get('requests', [])
+        if len(requests) != 1:
+            raise GraphError(400, 'BadRequest', 'Exactly one search request is supported.')
+        request = requests[0]
+        # Callers of the mock are app-only, and Graph only allows application permissions for SharePoint and OneDrive types
+        delegated_only = [entity_type for entity_type in request.get('entityTypes', []) if entity_type in ('message', 'event')]
+        if delegated_only:
+            raise GraphError(400, 'BadRequest', f"Application permissions are not supported for entity types: "
+                                                f"{', '.join(delegated_only)}. Use delegated permissions instead.")
+        terms = re.findall(r'\w+', request.get('query', {}).get('queryString', '').lower())
+        if not terms:
+            raise GraphError(400, 'BadRequest', 'The search query is empty.')
+
+        candidates = []
+        entity_types = request.get('entityTypes', [])
+        if 'listItem' in entity_types:
+            for site in self.tenant.sites:
+                for lst in self.tenant.lists(site):
+                    candidates += [('listItem', dict(item, webUrl=f"{site['webUrl']}/Lists/{lst['name']}/{item['id']}"),
+                                    ' '.join(str(value) for value in item['fields'].values()))
+                                   for item in self.tenant.items(site, lst)]
+
+        matches = [(entity_type, resource, text) for entity_type, resource, text in candidates
+                   if all(term in text.lower() for term in terms)]
+        start, size = int(request.get('from', 0)), int(request.get('size', 25))
+        hits = [{
+            'hitId': resource['id'],
+            'rank': start + rank + 1,
+            'summary': f"...{text}...",
+            'resource': dict(select_fields(resource, ','.join(request['fields'])) if request.get('fields') else resource,
+                             **{'@odata.type': f"#microsoft.graph.{entity_type}"}),
+        } for rank, (entity_type, resource, text) in enumerate(matches[start:start + size])]
+        return 200, {}, {'value': [{
+            'searchTerms': terms,
+            'hitsContainers': [{'hits': hits, 'total': len(matches), 'moreResultsAvailable': start + size < len(matches)}],
+        }]}
+
+    def batch(self, body, base_url, **kwargs):
+        requests = (body or {}).get('requests', [])
+        if not requests or len(requests) > MAX_BATCH_SIZE:
+            raise GraphError(400, 'BadRequest', f"A batch must contain between 1 and {MAX_BATCH_SIZE} requests.")
+        self.count('batch_requests', len(requests))
+        responses = []
+        for request in requests:
+            url = request['url'] if request['url'].startswith('/') else '/' + request['url']
+            status, headers, response_body = self.handle(request.get('method', 'GET').upper(), url, request.get('body'),
+                                                         client=f"batch:{url}", base_url=base_url)
+            responses.append({'id': request['id'], 'status': status, 'headers': headers, 'body': response_body})
+        return 200, {}, {'responses': responses}
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+def attachment_metadata(attachment):
+    # Sent and draft messages keep the name and size of their attachments, not the content
+    size = len(base64.b64decode(attachment['contentBytes'])) if attachment.get('contentBytes') else int(attachment.get('size', 0))
+    return {'name': attachment.get('name'), 'contentType': attachment.get('contentType'), 'size': size}
+
+def error_body(code, message):
+    return {'error': {'code': code, 'message': message}}
+
+def make_handler(graph):
+    class GraphRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self, method):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length else None
+            # Upload chunks are binary, everything else is JSON
+            if body and not self.headers.get('Content-Type', '').startswith('application/octet-stream'):
+                body = json.loads(body)
+            graph.delay()
+            host = self.headers.get('Host', f"{self.server.server_address[0]}:{self.server.server_address[1]}")
+            version = '/v1.0' if self.path.startswith('/v1.0') else ''
+            # Throttling is per client, identified like Graph by the caller's token or address
+            client = self.headers.get('Authorization') or self.client_address[0]
+            if self.path == '/_mock/stats':
+                status, headers, response = 200, {}, dict(graph.stats, sent=len(graph.tenant.sent))
+            else:
+                status, headers, response = graph.handle(method, self.path, body, client=client, base_url=f"http://{host}{version}",
+                                                         request_headers=dict(self.headers))
+
+            # Generated content is streamed with the Content-Length its route set
+            if isinstance(response, Iterator):
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                for chunk in response:
+                    self.wfile.write(chunk)
+                return
+
+            # File content is sent as is, everything else as JSON
+            if isinstance(response, bytes):
+                payload = response
+            else:
+                payload = json.dumps(response).encode('utf-8') if response is not None else b''
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            if payload and 'Content-Type' not in headers:
+                self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self.respond('GET')
+
+        def do_POST(self):
+            self.respond('POST')
+
+        def do_PUT(self):
+            self.respond('PUT')
+
+        def do_PATCH(self):
+            self.respond('PATCH')
+
+        def do_DELETE(self):
+            self.respond('DELETE')
+
+        def log_message(self, format, *args):
+            pass
+
+    return GraphRequestHandler
+
+def start_server(graph, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(graph))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Microsoft Graph endpoints used by graph.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=100, help='Messages per mailbox')
+    parser.add_argument('--events', type=int, default=50, help='Events per mailbox')
+    parser.add_argument('--contacts', type=int, default=25, help='Contacts per mailbox')
+    parser.add_argument('--sites', type=int, default=5)
+    parser.add_argument('--lists', type=int, default=3, help='Lists per site')
+    parser.add_argument('--items', type=int, default=50, help='Items per list')
+    parser.add_argument('--documents', type=int, default=20, help='Files per document library and OneDrive')
+    parser.add_argument('--document-kb', type=int, default=64, help='Average file size in KB')
+    parser.add_argument('--attachment-kb', type=int, default=256, help='Average attachment size in KB')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean latency per request in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Standard deviation of the latency in seconds')
+    parser.add_argument('--throttle-rps', type=float, default=0, help='Requests per second per client before 429 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with 429 at random')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds on 429 responses')
+    parser.add_argument('--max-page-size', type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument('--send-limit', type=int, default=0, help='Messages each mailbox may send per minute before 429 responses')
+    parser.add_argument('--fixtures', help='JSON file mapping "METHOD /path" to a recorded response body')
+    args = parser.parse_args()
+
+    fixtures = {}
+    if args.fixtures:
+        with open(args.fixtures, encoding='utf-8') as f:
+            fixtures = json.load(f)
+
+    tenant = Tenant(args.users, args.messages, args.events, args.contacts, args.sites, args.lists, args.items, seed=args.seed,
+                    documents=args.documents, document_kb=args.document_kb, attachment_kb=args.attachment_kb)
+    graph = MockGraph(tenant, args.latency, args.jitter, Throttle(args.throttle_rps, args.throttle_rate, args.retry_after, args.seed),
+                      fixtures, args.max_page_size, SendLimit(args.send_limit, args.retry_after))
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(graph))
+    server.daemon_threads = True
+    print(f"Mock Graph listening on http://{args.host}:{args.port}/v1.0 with {args.users} users and {args.sites} sites")
+    print(f"Set graphBaseUrl = http://{args.host}:{args.port}/v1.0 and staticToken in config.dev.cfg to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import json
+import time
+import uuid
+import random
+import sqlite3
+import argparse
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+# Graph gives up on a notification endpoint that does not answer within 3 seconds
+RESPONSE_DEADLINE = 3.0
+
+RESOURCE_DATA_TYPES = {'messages': '#Microsoft.Graph.Message', 'events': '#Microsoft.Graph.Event'}
+
+def post(url, body=None, timeout=10):
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.headers.get('Content-Type', ''), response.read().decode('utf-8'), time.perf_counter() - start
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('Content-Type', ''), e.read().decode('utf-8'), time.perf_counter() - start
+
+def check_validation(url):
+    # The handshake Graph performs when a subscription is created
+    token = f"Validation: Testing client application reachability for subscription Request-Id: {uuid.uuid4()}"
+    status, content_type, body, latency = post(f"{url}?validationToken={quote(token)}")
+    ok = status == 200 and body == token and content_type.startswith('text/plain')
+    print(f"Validation handshake: {'ok' if ok else 'FAILED'} (status {status}, {content_type or 'no content type'}, {latency * 1000:.1f} ms)")
+    return ok
+
+def load_subscriptions(path):
+    connection = sqlite3.connect(path)
+    rows = connection.execute('SELECT id, kind, resource, client_state FROM subscriptions').fetchall()
+    connection.close()
+    return [{'id': row[0], 'kind': row[1], 'resource': row[2], 'client_state': row[3]} for row in rows]
+
+def fetch_resource_ids(graph_url, kind, user_id, count):
+    # Real ids from the mock Graph server, so the app can fetch the changed items
+    path = 'messages' if kind == 'messages' else 'events'
+    with urllib.request.urlopen(f"{graph_url}/users/{user_id}/{path}?$top={count}&$select=id") as response:
+        return [item['id'] for item in json.load(response)['value']]
+
+def make_notification(subscription, change_type, resource_id, client_state=None):
+    notification = {
+        'subscriptionId': subscription['id'],
+        'clientState': client_state if client_state is not None else subscription['client_state'],
+        'changeType': change_type,
+        'resource': f"{subscription['resource']}/{resource_id}" if resource_id else subscription['resource'],
+        'subscriptionExpirationDateTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() + 86400)),
+        'tenantId': str(uuid.UUID(int=0)),
+    }
+    if subscription['kind'] in RESOURCE_DATA_TYPES:
+        notification['resourceData'] = {'@odata.type': RESOURCE_DATA_TYPES[subscription['kind']], 'id': resource_id}
+    return notification
+
+def main():
+    parser = argparse.ArgumentParser(description='Send Graph-style change notifications to the /notifications endpoint')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/notifications')
+    parser.add_argument('--subscriptions-db', default='subscriptions.db', help='Subscription store written by subscriptions.py')
+    parser.add_argument('--subscription-id', help='Send for this subscription instead of the ones in the store')
+    parser.add_argument('--client-state', help='Client state of --subscription-id')
+    parser.add_argument('--kind', choices=['messages', 'events', 'list'], default='messages', help='Kind of --subscription-id')
+    parser.add_argument('--resource', default='', help='Resource of --subscription-id')
+    parser.add_argument('--change-type', default='created', choices=['created', 'updated', 'deleted'])
+    parser.add_argument('--lifecycle-event', choices=['reauthorizationRequired', 'subscriptionRemoved', 'missed'])
+    parser.add_argument('--count', type=int, default=10, help='Number of POST requests')
+    parser.add_argument('--batch-size', type=int, default=1, help='Notifications per POST')
+    parser.add_argument('--rate', type=float, default=5.0, help='POST requests per second')
+    parser.add_argument('--invalid-fraction', type=float, default=0.0, help='Fraction of notifications with a wrong clientState')
+    parser.add_argument('--graph-url', help='Mock Graph URL to take real message and event ids from')
+    parser.add_argument('--user-id', default='7e00cad8-6276-4c23-89f7-d3ea1c5fd1b8')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if not check_validation(args.url):
+        raise SystemExit(1)
+
+    if args.subscription_id:
+        subscriptions = [{'id': args.subscription_id, 'kind': args.kind, 'resource': args.resource, 'client_state': args.client_state or ''}]
+    else:
+        subscriptions = load_subscriptions(args.subscriptions_db)
+    if not subscriptions:
+        raise SystemExit('No subscriptions to send notifications for')
+
+    resource_ids = {}
+    for kind in {subscription['kind'] for subscription in subscriptions}:
+        if kind != 'list':
+            resource_ids[kind] = (fetch_resource_ids(args.graph_url, kind, args.user_id, 50) if args.graph_url else []) or [str(uuid.uuid4())]
+
+    statuses, latencies, invalid = {}, [], 0
+    for i in range(args.count):
+        notifications = []
+        for _ in range(args.batch_size):
+            subscription = rng.choice(subscriptions)
+            client_state = None
+            if rng.random() < args.invalid_fraction:
+                client_state = 'not-the-client-state'
+                invalid += 1
+            if args.lifecycle_event:
+                notification = {'subscriptionId': subscription['id'], 'clientState': client_state or subscription['client_state'],
+                                'lifecycleEvent': args.lifecycle_event, 'resource': subscription['resource']}
+            else:
+                resource_id = rng.choice(resource_ids[subscription['kind']]) if subscription['kind'] in resource_ids else None
+                notification = make_notification(subscription, args.change_type, resource_id, client_state)
+            notifications.append(notification)
+
+        status, _, _, latency = post(args.url, {'value': notifications})
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies.append(latency)
+        time.sleep(max(0.0, 1 / args.rate - latency))
+
+    latencies.sort()
+    print(f"Sent {args.count * args.batch_size} notifications in {args.count} requests ({invalid} with a wrong clientState)")
+    print(f"Responses: {', '.join(f'{status}: {count}' for status, count in sorted(statuses.items()))}")
+    print(f"Response time p50/p95/max: {latencies[len(latencies) // 2] * 1000:.1f}/"
+          f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:.1f}/{latencies[-1] * 1000:.1f} ms")
+    if latencies[-1] > RESPONSE_DEADLINE:
+        print(f"WARNING: slowest response exceeded Graph's {RESPONSE_DEADLINE:.0f} second deadline")
+
+    # Give the background worker a moment, then show what the app did with the notifications
+    time.sleep(1)
+    try:
+        with urllib.request.urlopen(f"{args.url.rstrip('/')}/stats") as response:
+            print(f"Processor stats: {json.load(response)}")
+    except (urllib.error.URLError, OSError):
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+
+# The only script EVAL understands: the compare-and-delete that shared_store.py uses to release locks
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+class Keyspace:
+    # In-memory keys with optional expiry, shared by all connections
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.commands = 0
+
+    def live(self, key):
+        entry = self.values.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        name = args[0].upper()
+        with self.lock:
+            self.commands += 1
+            if name == 'PING':
+                return 'PONG'
+            if name == 'SELECT':
+                return 'OK'
+            if name == 'GET':
+                entry = self.live(args[1])
+                return entry[0] if entry else None
+            if name == 'SET':
+                return self.set(args[1], args[2], [arg.upper() for arg in args[3:]], args[3:])
+            if name == 'DEL':
+                return sum(1 for key in args[1:] if self.live(key) and self.values.pop(key))
+            if name == 'EXISTS':
+                return sum(1 for key in args[1:] if self.live(key))
+            if name == 'SCAN':
+                # The whole keyspace in one pass, which real servers may also do for small databases
+                options = dict(zip([arg.upper() for arg in args[2::2]], args[3::2]))
+                pattern = options.get('MATCH', '*')
+                return ['0', [key for key in list(self.values) if self.live(key) and fnmatch.fnmatchcase(key, pattern)]]
+            if name == 'DBSIZE':
+                return sum(1 for key in list(self.values) if self.live(key))
+            if name == 'FLUSHDB':
+                self.values.clear()
+                return 'OK'
+            if name == 'EVAL':
+                if args[1] != RELEASE_SCRIPT:
+                    raise ValueError('ERR only the shared_store lock release script is supported')
+                entry = self.live(args[3])
+                if entry and entry[0] == args[4]:
+                    del self.values[args[3]]
+                    return 1
+                return 0
+        raise ValueError(f"ERR unknown command '{args[0]}'")
+
+    def set(self, key, value, flags, options):
+        expires = None
+        if 'PX' in flags:
+            expires = time.monotonic() + int(options[flags.index('PX') + 1]) / 1000
+        elif 'EX' in flags:
+            expires = time.monotonic() + int(options[flags.index('EX') + 1])
+        if 'NX' in flags and self.live(key):
+            return None
+        self.values[key] = (value, expires)
+        return 'OK'
+
+def encode(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+    if value in ('OK', 'PONG'):
+        return f"+{value}\r\n".encode('utf-8')
+    data = value.encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+def read_command(reader):
+    line = reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # Inline command, as typed into telnet
+        return line.decode('utf-8').split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int(reader.readline()[1:])
+        args.append(reader.read(length + 2)[:-2].decode('utf-8'))
+    return args
+
+def make_handler(keyspace):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                args = read_command(self.rfile)
+                if not args:
+                    return
+                try:
+                    reply = encode(keyspace.execute(args))
+                except (ValueError, IndexError) as e:
+                    message = str(e) if str(e).startswith('ERR') else f"ERR {e}"
+                    reply = f"-{message}\r\n".encode('utf-8')
+                self.wfile.write(reply)
+    return Handler
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_server(keyspace=None, host='127.0.0.1', port=0):
+    server = Server((host, port), make_handler(keyspace or Keyspace()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for a Redis server, with the commands shared_store.py uses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    server = Server((args.host, args.port), make_handler(Keyspace()))
+    print(f"RESP stand-in listening on {args.host}:{args.port}; set SHARED_STORE_URL=redis://{args.host}:{args.port}/0 to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
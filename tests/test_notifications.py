@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import pytest
+from mock_graph_server import Tenant, MockGraph, Throttle, start_server, DEFAULT_USER_ID
+from notification_sender import fetch_resource_ids, make_notification
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app-auth', 'graphapponlytutorial'))
+
+# Checks /notifications end to end: the Flask app runs in-process against the mock Graph server,
+# with its subscriptions, keyword index and /interact cache in a scratch directory
+
+def cache_key(data):
+    # The key app.py stores /interact results under
+    return f"interact:{data['option']}:{hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()}"
+
+def wait_for(client, key, count, timeout=10):
+    # Changes are applied in the background after the 202, so poll the processor's counters
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = client.get('/notifications/stats').get_json()
+        if stats.get(key, 0) >= count:
+            return stats
+        time.sleep(0.05)
+    raise AssertionError(f"Expected {count} {key} within {timeout} seconds, got {stats}")
+
+def indexed_ids(index, prefix):
+    return {row[0] for row in index.connection.execute('SELECT id FROM docs WHERE id LIKE ?', (prefix + '%',))}
+
+def subscription(kind, resource):
+    return {'id': str(uuid.uuid4()), 'kind': kind, 'resource': resource, 'change_type': 'created,updated,deleted',
+            'client_state': uuid.uuid4().hex, 'expiration': time.time() + 86400}
+
+@pytest.fixture
+def notification_app(tmp_path, monkeypatch):
+    # Yields the app module and the mock Graph URL; everything is torn down and unimported afterwards
+    # Small pages, so a resync has to follow @odata.nextLink
+    graph_server = start_server(MockGraph(Tenant(users=2, messages=20, events=10, seed=0), throttle=Throttle(), max_page_size=5))
+    graph_url = f"http://127.0.0.1:{graph_server.server_address[1]}/v1.0"
+    (tmp_path / 'config.cfg').write_text(f"[azure]\nclientId = test\nclientSecret = test\ntenantId = test\n"
+                                         f"graphBaseUrl = {graph_url}\nstaticToken = test\n", encoding='utf-8')
+    monkeypatch.setenv('INTERACT_CACHE_TTL', '300')
+    monkeypatch.setenv('SHARED_STORE_URL', 'memory://')
+    monkeypatch.setenv('SUBSCRIPTIONS_PATH', str(tmp_path / 'subscriptions.db'))
+    monkeypatch.setenv('KEYWORD_INDEX_PATH', str(tmp_path / 'keyword_index.db'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(APP_DIR)
+    app = None
+    try:
+        import app
+        yield app, graph_url
+    finally:
+        if app is not None:
+            app.notification_processor.shutdown()
+        graph_server.shutdown()
+        # app.py reads its settings at import time, so the next import must start from scratch;
+        # monkeypatch.delitem would put the modules back on undo
+        for name, module in list(sys.modules.items()):
+            if os.path.dirname(os.path.abspath(getattr(module, '__file__', None) or '')) == APP_DIR:
+                del sys.modules[name]
+
+@pytest.fixture
+def keyword_index(notification_app):
+    from bm25_index import BM25Index
+    index = BM25Index(os.environ['KEYWORD_INDEX_PATH'])
+    try:
+        yield index
+    finally:
+        index.close()
+
+def test_notifications(notification_app, keyword_index):
+    app, graph_url = notification_app
+    index = keyword_index
+    from records import make_record
+
+    client = app.app.test_client()
+    messages = subscription('messages', f"users/{DEFAULT_USER_ID}/mailFolders('inbox')/messages")
+    events = subscription('events', f"users/{DEFAULT_USER_ID}/events")
+    app.notification_processor.store.save(messages)
+    app.notification_processor.store.save(events)
+    message_id = fetch_resource_ids(graph_url, 'messages', DEFAULT_USER_ID, 1)[0]
+    event_id = fetch_resource_ids(graph_url, 'events', DEFAULT_USER_ID, 1)[0]
+
+    # The keyword index starts with the event that will be deleted and without the new message
+    index.add([make_record('event', {'subject': 'Planning'}, 'Calendar event: Planning', f"{DEFAULT_USER_ID}/{event_id}")])
+
+    # Graph's validation handshake: the token comes back unchanged as plain text
+    token = f"Validation: Testing client application reachability for subscription Request-Id: {uuid.uuid4()}"
+    response = client.post('/notifications', query_string={'validationToken': token})
+    assert response.status_code == 200, response.status_code
+    assert response.content_type.startswith('text/plain'), response.content_type
+    assert response.get_data(as_text=True) == token
+
+    # Cache mail, calendar and contacts results
+    requests = {option: {'option': option} for option in (4, 5, 6)}
+    for data in requests.values():
+        response = client.post('/interact', json=data)
+        assert response.status_code == 200, response.get_json()
+        assert app.shared_store.get(cache_key(data)) is not None, f"option {data['option']} was not cached"
+
+    # A wrong clientState is acknowledged but changes nothing
+    response = client.post('/notifications', json={'value': [make_notification(messages, 'created', message_id, 'not-the-client-state')]})
+    assert response.status_code == 202, response.status_code
+    assert wait_for(client, 'rejected', 1).get('accepted', 0) == 0
+    assert all(app.shared_store.get(cache_key(data)) is not None for data in requests.values())
+
+    # A new message drops cached mail results only, and is added to the keyword index
+    response = client.post('/notifications', json={'value': [make_notification(messages, 'created', message_id)]})
+    assert response.status_code == 202, response.status_code
+    assert app.shared_store.get(cache_key(requests[4])) is None, 'mail results are still cached'
+    assert app.shared_store.get(cache_key(requests[5])) is not None, 'calendar results were dropped'
+    assert app.shared_store.get(cache_key(requests[6])) is not None, 'contacts results were dropped'
+    wait_for(client, 'index_updates', 1)
+    assert index.connection.execute('SELECT 1 FROM docs WHERE id = ?', (f"email:{DEFAULT_USER_ID}/{message_id}",)).fetchone(), \
+        'new message is not in the keyword index'
+
+    # A deleted event drops cached calendar results and its record in the keyword index
+    response = client.post('/notifications', json={'value': [make_notification(events, 'deleted', event_id)]})
+    assert response.status_code == 202, response.status_code
+    assert app.shared_store.get(cache_key(requests[5])) is None, 'calendar results are still cached'
+    assert app.shared_store.get(cache_key(requests[6])) is not None, 'contacts results were dropped'
+    stats = wait_for(client, 'index_updates', 2)
+    assert not index.connection.execute('SELECT 1 FROM docs WHERE id = ?', (f"event:{DEFAULT_USER_ID}/{event_id}",)).fetchone(), \
+        'deleted event is still in the keyword index'
+    assert stats.get('failed', 0) == 0, stats
+
+def test_missed_notifications(notification_app, keyword_index):
+    app, graph_url = notification_app
+    index = keyword_index
+    from records import make_record
+
+    client = app.app.test_client()
+    messages = subscription('messages', f"users/{DEFAULT_USER_ID}/mailFolders('inbox')/messages")
+    events = subscription('events', f"users/{DEFAULT_USER_ID}/events")
+    app.notification_processor.store.save(messages)
+    app.notification_processor.store.save(events)
+
+    # A record deleted while notifications were missed, and records of another mailbox
+    index.add([make_record('email', {'subject': 'Gone'}, 'Email: Gone', f"{DEFAULT_USER_ID}/deleted-message"),
+               make_record('email', {'subject': 'Kept'}, 'Email: Kept', 'other-user/message'),
+               make_record('event', {'subject': 'Kept'}, 'Calendar event: Kept', 'other-user/event')])
+
+    # 'missed' re-reads every page of the subscribed mailbox and replaces only its records
+    lifecycle = [{'subscriptionId': subscription['id'], 'clientState': subscription['client_state'],
+                  'lifecycleEvent': 'missed', 'resource': subscription['resource']} for subscription in (messages, events)]
+    response = client.post('/notifications', json={'value': lifecycle})
+    assert response.status_code == 202, response.status_code
+    stats = wait_for(client, 'lifecycle_missed', 2)
+    assert stats.get('failed', 0) == 0, stats
+    assert len(indexed_ids(index, f"email:{DEFAULT_USER_ID}/")) == 20, 'not every page of messages was indexed'
+    assert len(indexed_ids(index, f"event:{DEFAULT_USER_ID}/")) == 10, 'not every page of events was indexed'
+    assert f"email:{DEFAULT_USER_ID}/deleted-message" not in indexed_ids(index, 'email:'), 'stale message is still indexed'
+    assert indexed_ids(index, 'email:other-user/') and indexed_ids(index, 'event:other-user/'), \
+        "another mailbox's records were dropped"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -1,5 +1,7 @@
+import os
+import asyncio
 from configparser import SectionProxy
-from azure.identity import DeviceCodeCredential
+from azure.identity import DeviceCodeCredential, TokenCachePersistenceOptions, AuthenticationRecord
 from msgraph import GraphServiceClient
 from msgraph.generated.users.item.user_item_request_builder import UserItemRequestBuilder
 from msgraph.generated.users.item.mail_folders.item.messages.messages_request_builder import MessagesRequestBuilder
@@ -21,15 +23,40 @@ class Graph:
         self.settings = config
         client_id = self.settings['clientId']
         tenant_id = self.settings['tenantId']
-        graph_scopes = self.settings['graphUserScopes'].split(' ')
+        self.graph_scopes = self.settings['graphUserScopes'].split(' ')
+
+        # Tokens are kept in an encrypted on-disk cache, and the saved authentication record
+        # tells the credential which cached account to use, so later runs refresh silently
+        self.auth_record_path = self.settings.get('authRecordPath', 'auth_record.json')
+        self.auth_record = None
+        if os.path.exists(self.auth_record_path):
+            with open(self.auth_record_path, encoding='utf-8') as f:
+                self.auth_record = AuthenticationRecord.deserialize(f.read())
+        cache_options = TokenCachePersistenceOptions(
+            name=self.settings.get('tokenCacheName', 'graphtutorial'),
+            allow_unencrypted_storage=self.settings.getboolean('allowUnencryptedTokenCache', False)
+        )
+
+        self.device_code_credential = DeviceCodeCredential(
+            client_id,
+            tenant_id=tenant_id,
+            cache_persistence_options=cache_options,
+            authentication_record=self.auth_record
+        )
+        self.user_client = GraphServiceClient(self.device_code_credential, self.graph_scopes)
+
 
-        self.device_code_credential = DeviceCodeCredential(client_id, tenant_id=tenant_id)
-        self.user_client = GraphServiceClient(self.device_code_credential, graph_scopes)
+    async def authenticate(self):
+        # Only the first run needs the interactive device code flow
+        if self.auth_record is None:
+            self.auth_record = await asyncio.to_thread(self.device_code_credential.authenticate, scopes=self.graph_scopes)
+            with open(self.auth_record_path, 'w', encoding='utf-8') as f:
+                f.write(self.auth_record.serialize())
 
 
     async def get_user_token(self):
-        graph_scopes = self.settings['graphUserScopes']
-        access_token = self.device_code_credential.get_token(graph_scopes)
+        # get_token blocks on network I/O, so run it off the event loop
+        access_token = await asyncio.to_thread(self.device_code_credential.get_token, *self.graph_scopes)
         return access_token.token
 
 
@@ -65,6 +92,12 @@ class Graph:
         return messages
 
 
+    async def get_inbox_page(self, next_link: str):
+        # Follow the @odata.nextLink of a previous inbox page
+        messages = await self.user_client.me.mail_folders.by_mail_folder_id('inbox').messages.with_url(next_link).get()
+        return messages
+
+
     async def send_mail(self, subject: str, body: str, recipient: str):
         message = Message()
         message.subject = subject